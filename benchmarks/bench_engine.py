@@ -0,0 +1,113 @@
+""" Compares the throughput of the row engines with the former csv.DictReader loop """
+
+import argparse
+import csv
+import io
+import random
+import string
+import time
+
+from gdpr_obfuscator.engine import iter_lines, obfuscate_csv_stream
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def make_csv(rows: int, columns: int, seed: int = 0) -> str:
+    """
+    Builds a synthetic CSV file in memory.
+
+    Args:
+        rows (int): Number of data rows.
+        columns (int): Number of columns.
+        seed (int): Seed of the random generator, so runs are reproducible.
+
+    Returns:
+        str: The CSV content, header included.
+    """
+    generator = random.Random(seed)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([f"column_{index}" for index in range(columns)])
+    for _ in range(rows):
+        writer.writerow(
+            "".join(generator.choices(string.ascii_letters, k=10)) for _ in range(columns)
+        )
+    return buffer.getvalue()
+
+
+def dict_reader_engine(lines, pii_fields: list, chunk_size: int):
+    """The row loop used before the positional engine, kept as the baseline."""
+    reader = csv.DictReader(lines)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=reader.fieldnames)
+    writer.writeheader()
+
+    for row in reader:
+        for pii_field in pii_fields:
+            if pii_field in row:
+                row[pii_field] = "***"
+        writer.writerow(row)
+
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def decoding(engine):
+    """Wraps a text engine so it reads and writes bytes, like the stream does."""
+
+    def run(source, pii_fields: list, chunk_size: int):
+        lines = iter_lines(iter(lambda: source.read(chunk_size), b""))
+        for chunk in engine(lines, pii_fields, chunk_size):
+            yield chunk.encode("utf-8")
+
+    return run
+
+
+def byte_parser(source, pii_fields: list, chunk_size: int):
+    """The stream without its byte-level fast path."""
+    return obfuscate_csv_stream(source, pii_fields, chunk_size, fast_path=False)
+
+
+def measure(engine, content: bytes, pii_fields: list, repeat: int) -> float:
+    """
+    Runs an engine over the content and returns the best time of `repeat` runs.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        source = io.BytesIO(content)
+        start = time.perf_counter()
+        for _ in engine(source, pii_fields, CHUNK_SIZE):
+            pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--columns", type=int, default=10)
+    parser.add_argument("--pii-columns", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    content = make_csv(args.rows, args.columns).encode("utf-8")
+    pii_fields = [f"column_{index}" for index in range(args.pii_columns)]
+    engines = [
+        ("DictReader", decoding(dict_reader_engine)),
+        ("positional", byte_parser),
+        ("fast path", obfuscate_csv_stream),
+    ]
+
+    for name, engine in engines:
+        elapsed = measure(engine, content, pii_fields, args.repeat)
+        print(f"{name:>12}: {args.rows / elapsed:>12,.0f} rows/sec ({elapsed:.3f} s)")
+
+
+if __name__ == "__main__":
+    main()
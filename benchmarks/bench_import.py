@@ -0,0 +1,99 @@
+""" Measures the import time of the Lambda handler with python -X importtime and guards the cold-start budget """
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+# Module imported by the Lambda runtime during a cold start
+HANDLER_MODULE = "gdpr_obfuscator.lambda_obfuscator"
+
+# Cumulative import time of the handler allowed, in milliseconds, interpreter startup excluded
+DEFAULT_BUDGET_MS = 150
+
+# Modules that must only be loaded on first use, and never by the import of the handler
+LAZY_MODULES = ("boto3", "botocore", "argparse", "pyarrow", "multiprocessing", "gdpr_obfuscator.cli")
+
+
+def measure_import(module: str) -> tuple[float, dict]:
+    """
+    Imports a module in a fresh interpreter with `-X importtime`.
+
+    Args:
+        module (str): The dotted name of the module.
+
+    Returns:
+        tuple: A tuple containing:
+            - cumulative (float): The import time of the module, its imports
+              included, in milliseconds.
+            - modules (dict): The self import time in milliseconds of every module
+              loaded after the interpreter started, by name.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = {**os.environ, "PYTHONPATH": root}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=environment,
+        check=True,
+    )
+
+    cumulative = 0.0
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_time, cumulative_time, name = line[len("import time:") :].split("|")
+        if not self_time.strip().isdigit():
+            # The header line of the report
+            continue
+        name = name.strip()
+        modules[name] = int(self_time) / 1000
+        if name == module:
+            cumulative = int(cumulative_time) / 1000
+    return cumulative, modules
+
+
+def eager_modules(modules: dict) -> list[str]:
+    """Lists the modules of `LAZY_MODULES` found among the loaded ones."""
+    return sorted(
+        lazy
+        for lazy in LAZY_MODULES
+        if any(name == lazy or name.startswith(f"{lazy}.") for name in modules)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default=HANDLER_MODULE, help="Module to import.")
+    parser.add_argument("--repeat", type=int, default=5, help="Imports measured, the median is kept.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to list.")
+    args = parser.parse_args()
+
+    runs = [measure_import(args.module) for _ in range(args.repeat)]
+    median = statistics.median(cumulative for cumulative, _ in runs)
+    modules = runs[-1][1]
+
+    print(f"{args.module}: {median:.1f} ms (median of {args.repeat}), budget {args.budget_ms:.0f} ms")
+    for name, self_time in sorted(modules.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"{self_time:>8.2f} ms  {name}")
+
+    failures = []
+    if median > args.budget_ms:
+        failures.append(f"the import takes {median:.1f} ms, over the budget of {args.budget_ms:.0f} ms")
+    eager = eager_modules(modules)
+    if eager:
+        failures.append(f"the import loads {', '.join(eager)}, which must be loaded lazily")
+
+    for failure in failures:
+        print(f"Regression: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
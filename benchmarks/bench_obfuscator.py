@@ -0,0 +1,319 @@
+""" End-to-end benchmark of the Obfuscator on local and S3 files, with a JSON report """
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import boto3
+import psutil
+from moto import mock_aws
+
+from generate import column_names, generate_csv, parse_size
+
+from gdpr_obfuscator import FileSink, Obfuscator, S3MultipartSink, set_s3_client
+
+
+BUCKET_NAME = "benchmark-bucket"
+
+# Scenarios of each suite: name, size, columns, PII columns, quoting, unicode
+SUITES = {
+    "quick": [
+        ("small", "256KB", 10, 3, 0.0, 0.0),
+        ("medium", "16MB", 10, 3, 0.0, 0.0),
+        ("quoted", "16MB", 10, 3, 0.2, 0.0),
+        ("unicode", "16MB", 10, 3, 0.0, 0.3),
+        ("wide", "16MB", 100, 20, 0.0, 0.0),
+    ],
+    "full": [
+        ("small", "256KB", 10, 3, 0.0, 0.0),
+        ("medium", "64MB", 10, 3, 0.0, 0.0),
+        ("quoted", "64MB", 10, 3, 0.2, 0.0),
+        ("unicode", "64MB", 10, 3, 0.0, 0.3),
+        ("wide", "64MB", 100, 20, 0.0, 0.0),
+        ("large", "1GB", 10, 3, 0.0, 0.0),
+        ("large_quoted", "1GB", 10, 3, 0.2, 0.1),
+    ],
+}
+
+TARGETS = ("local", "s3")
+
+# Relative drop of throughput, or growth of peak memory, reported as a regression
+DEFAULT_TOLERANCE = 0.15
+
+
+class PeakRSS:
+    """
+    Samples the resident memory of the process in a background thread.
+
+    Args:
+        interval (float): Seconds between two samples.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.__process = psutil.Process()
+        self.__interval = interval
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.peak = 0
+
+    def __enter__(self):
+        self.peak = self.__process.memory_info().rss
+        self.__thread = threading.Thread(target=self.__sample, daemon=True)
+        self.__thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__stop.set()
+        self.__thread.join()
+        self.peak = max(self.peak, self.__process.memory_info().rss)
+
+    def __sample(self):
+        while not self.__stop.wait(self.__interval):
+            self.peak = max(self.peak, self.__process.memory_info().rss)
+
+
+class Stages:
+    """Records the wall time of the named stages of one run."""
+
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+
+def prepare_input(data_dir: str, scenario: tuple) -> tuple[str, int]:
+    """
+    Generates the input of a scenario, or reuses it if it is already in `data_dir`.
+
+    Returns:
+        tuple: The path of the file and its number of data rows.
+    """
+    name, size, columns, pii_columns, quoting, unicode = scenario
+    file_name = f"{name}-{size}-{columns}-{pii_columns}-{quoting}-{unicode}.csv"
+    path = os.path.join(data_dir, file_name)
+    rows_path = path + ".rows"
+
+    if not (os.path.exists(path) and os.path.exists(rows_path)):
+        with open(path, "w", encoding="utf-8", newline="") as output:
+            rows = generate_csv(
+                output,
+                size=parse_size(size),
+                columns=columns,
+                pii_columns=pii_columns,
+                quoting=quoting,
+                unicode=unicode,
+            )
+        with open(rows_path, "w") as rows_file:
+            rows_file.write(str(rows))
+
+    with open(rows_path) as rows_file:
+        return path, int(rows_file.read())
+
+
+def run_local(path: str, pii_fields: list, output_dir: str, stages: Stages) -> int:
+    """Obfuscates a local file to a local file. Returns the size of the output."""
+    output = os.path.join(output_dir, "obfuscated.csv")
+    request = json.dumps({"file_to_obfuscate": path, "pii_fields": pii_fields})
+
+    with stages.stage("validate"):
+        obfuscator = Obfuscator(request)
+    with stages.stage("obfuscate"):
+        with FileSink(output) as sink:
+            written = obfuscator.obfuscate_to(sink)
+
+    os.remove(output)
+    return written
+
+
+def run_s3(path: str, pii_fields: list, stages: Stages) -> int:
+    """Obfuscates a file uploaded to a moto-backed bucket, back to the bucket."""
+    with mock_aws():
+        client = boto3.client("s3", region_name="eu-west-2")
+        client.create_bucket(
+            Bucket=BUCKET_NAME,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        set_s3_client(client)
+
+        try:
+            with stages.stage("upload"):
+                client.upload_file(path, BUCKET_NAME, "input.csv")
+
+            request = json.dumps(
+                {"file_to_obfuscate": f"s3://{BUCKET_NAME}/input.csv", "pii_fields": pii_fields}
+            )
+            with stages.stage("validate"):
+                obfuscator = Obfuscator(request)
+            with stages.stage("obfuscate"):
+                sink = S3MultipartSink(BUCKET_NAME, "output.csv")
+                written = obfuscator.obfuscate_to(sink)
+            with stages.stage("publish"):
+                sink.close()
+        finally:
+            set_s3_client(None)
+
+    return written
+
+
+def run_scenario(scenario: tuple, target: str, data_dir: str, repeat: int = 1) -> dict:
+    """
+    Runs one scenario against one target and measures its fastest run out of `repeat`.
+
+    Throughput is computed from the 'validate' and 'obfuscate' stages (and
+    'publish' for S3), which is what a caller of the library waits for.
+    The upload of the input to the fake bucket is reported but not counted.
+    Peak RSS is the highest resident memory of the process during that run,
+    and RSS growth how much it rose above its level at the start of the run.
+
+    Returns:
+        dict: The measures of the run.
+    """
+    name, size, columns, pii_columns = scenario[:4]
+    generation = Stages()
+
+    with generation.stage("generate"):
+        path, rows = prepare_input(data_dir, scenario)
+    input_bytes = os.path.getsize(path)
+    pii_fields = column_names(columns, pii_columns)[:pii_columns]
+
+    best = None
+    for _ in range(repeat):
+        stages = Stages()
+        start_rss = psutil.Process().memory_info().rss
+        with PeakRSS() as memory:
+            if target == "local":
+                output_bytes = run_local(path, pii_fields, data_dir, stages)
+            else:
+                output_bytes = run_s3(path, pii_fields, stages)
+
+        seconds = sum(
+            stages.seconds.get(stage, 0.0) for stage in ("validate", "obfuscate", "publish")
+        )
+        if best is None or seconds < best[0]:
+            best = (seconds, stages, memory.peak, memory.peak - start_rss)
+
+    seconds, stages, peak_rss, rss_growth = best
+    return {
+        "scenario": name,
+        "target": target,
+        "size": size,
+        "columns": columns,
+        "pii_columns": pii_columns,
+        "rows": rows,
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds, 1),
+        "mb_per_sec": round(input_bytes / 1024**2 / seconds, 2),
+        "peak_rss_mb": round(peak_rss / 1024**2, 1),
+        "rss_growth_mb": round(rss_growth / 1024**2, 1),
+        "stages": {
+            stage: round(value, 4)
+            for stage, value in {**generation.seconds, **stages.seconds}.items()
+        },
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Lists the runs of the report that are worse than the same runs of the baseline.
+
+    A run regresses when its throughput drops, or its peak memory grows, by
+    more than `tolerance` (a share of the baseline value).
+
+    Returns:
+        list: One message per regression, empty if there is none.
+    """
+    previous = {(run["scenario"], run["target"]): run for run in baseline["results"]}
+    regressions = []
+
+    for run in report["results"]:
+        before = previous.get((run["scenario"], run["target"]))
+        if before is None:
+            continue
+
+        label = f"{run['scenario']}/{run['target']}"
+        if run["mb_per_sec"] < before["mb_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{label}: {run['mb_per_sec']} MB/s, baseline {before['mb_per_sec']} MB/s"
+            )
+        if run["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{label}: peak RSS {run['peak_rss_mb']} MB, baseline {before['peak_rss_mb']} MB"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    parser.add_argument("--scenario", action="append", help="Only run these scenarios.")
+    parser.add_argument("--target", choices=TARGETS, action="append", help="Only run these targets.")
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs of each scenario, the fastest is kept."
+    )
+    parser.add_argument("--data-dir", help="Directory keeping the generated inputs between runs.")
+    parser.add_argument("--report", help="Path of the JSON report to write.")
+    parser.add_argument("--baseline", help="JSON report to compare the results with.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    scenarios = [
+        scenario
+        for scenario in SUITES[args.suite]
+        if not args.scenario or scenario[0] in args.scenario
+    ]
+    targets = args.target or list(TARGETS)
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        data_dir = args.data_dir or temporary_dir
+        os.makedirs(data_dir, exist_ok=True)
+
+        results = []
+        for scenario in scenarios:
+            for target in targets:
+                run = run_scenario(scenario, target, data_dir, args.repeat)
+                results.append(run)
+                print(
+                    f"{run['scenario']:>14} {run['target']:>5}: {run['rows_per_sec']:>12,.0f} rows/sec"
+                    f" {run['mb_per_sec']:>8.2f} MB/s {run['peak_rss_mb']:>8.1f} MB peak RSS"
+                    f" ({run['seconds']:.3f} s)"
+                )
+
+    report = {
+        "suite": args.suite,
+        "repeat": args.repeat,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
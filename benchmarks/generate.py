@@ -0,0 +1,182 @@
+""" Seeded generator of synthetic CSV files, from a few KB to several GB """
+
+import argparse
+import csv
+import random
+import string
+import sys
+
+
+# Names of the first PII columns, further ones are called pii_<n>
+PII_NAMES = ["name", "email_address", "phone_number", "address"]
+
+# Non-ASCII alphabets mixed into the values when unicode is asked for
+UNICODE_ALPHABETS = ["àéîõüçñøßæ", "ŁłŚśŻżĆćĘę", "αβγδεζηθλμ", "東京大阪名古屋札幌", "😀🚀🌍🎉"]
+
+# Characters that force a field to be quoted
+QUOTED_SNIPPETS = [", ", '"', "\n", ', "']
+
+# Number of rows generated and written at a time
+BATCH_ROWS = 10_000
+
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+
+
+def parse_size(size: str) -> int:
+    """
+    Converts a size such as '64KB', '10MB' or '2GB' to bytes.
+
+    Args:
+        size (str): A number followed by an optional unit: B, KB, MB or GB.
+
+    Returns:
+        int: The size in bytes.
+    """
+    text = size.strip().upper()
+    for unit in sorted(SIZE_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[: -len(unit)]) * SIZE_UNITS[unit])
+    return int(text)
+
+
+def column_names(columns: int, pii_columns: int) -> list:
+    """
+    Names the columns of a generated file: the PII columns first, then column_<n>.
+
+    Args:
+        columns (int): Total number of columns.
+        pii_columns (int): Number of PII columns, at most `columns`.
+
+    Returns:
+        list: The header of the file.
+    """
+    pii = [
+        PII_NAMES[index] if index < len(PII_NAMES) else f"pii_{index}"
+        for index in range(pii_columns)
+    ]
+    return pii + [f"column_{index}" for index in range(columns - pii_columns)]
+
+
+def _value_pool(
+    generator: random.Random, name: str, cardinality: int, quoting: float, unicode: float
+) -> list:
+    """
+    Builds the distinct values a column draws from.
+
+    Drawing from a fixed pool keeps the generation fast enough for multi-GB
+    files and gives the repeated values real PII columns have.
+    """
+    pool = []
+    for _ in range(cardinality):
+        length = generator.randint(4, 12)
+        alphabet = string.ascii_letters
+        if generator.random() < unicode:
+            alphabet = generator.choice(UNICODE_ALPHABETS)
+        value = "".join(generator.choices(alphabet, k=length))
+
+        if name == "email_address":
+            value = f"{value}@example.com"
+        elif name == "phone_number":
+            value = "07" + "".join(generator.choices(string.digits, k=9))
+
+        if generator.random() < quoting:
+            value += generator.choice(QUOTED_SNIPPETS) + value
+        pool.append(value)
+    return pool
+
+
+def generate_csv(
+    output,
+    size: int = None,
+    rows: int = None,
+    columns: int = 10,
+    pii_columns: int = 3,
+    quoting: float = 0.0,
+    unicode: float = 0.0,
+    cardinality: int = 1000,
+    seed: int = 0,
+) -> int:
+    """
+    Writes a synthetic CSV file, the same for the same arguments.
+
+    Args:
+        output: A text file opened with `newline=""`.
+        size (int, optional): Approximate size of the file in bytes.
+        rows (int, optional): Exact number of data rows. Wins over `size`.
+        columns (int): Number of columns.
+        pii_columns (int): Number of PII columns, named by `column_names`.
+        quoting (float): Share of the values that contain commas, quotes or newlines.
+        unicode (float): Share of the values written with non-ASCII characters.
+        cardinality (int): Number of distinct values of each column.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        int: The number of data rows written.
+    """
+    if size is None and rows is None:
+        raise ValueError("Either a size or a number of rows is needed")
+
+    generator = random.Random(seed)
+    header = column_names(columns, pii_columns)
+    pools = [_value_pool(generator, name, cardinality, quoting, unicode) for name in header]
+
+    # Average encoded size of a row, so small files do not overshoot their size
+    row_size = columns + sum(
+        sum(len(value.encode("utf-8")) for value in pool) / len(pool) for pool in pools
+    )
+
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(header)
+
+    written = 0
+    while True:
+        if rows is None:
+            batch = min(BATCH_ROWS, int((size - output.tell()) / row_size) + 1)
+        else:
+            batch = min(BATCH_ROWS, rows - written)
+        if batch <= 0:
+            break
+
+        fields = [generator.choices(pool, k=batch) for pool in pools]
+        writer.writerows(zip(*fields))
+        written += batch
+
+        if rows is None and output.tell() >= size:
+            break
+
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("output", help="Path of the CSV file to write.")
+    parser.add_argument("--size", type=parse_size, default=None, help="Approximate size, such as 64KB or 2GB.")
+    parser.add_argument("--rows", type=int, default=None, help="Exact number of data rows.")
+    parser.add_argument("--columns", type=int, default=10)
+    parser.add_argument("--pii-columns", type=int, default=3)
+    parser.add_argument("--quoting", type=float, default=0.0, help="Share of values needing quotes.")
+    parser.add_argument("--unicode", type=float, default=0.0, help="Share of non-ASCII values.")
+    parser.add_argument("--cardinality", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.size is None and args.rows is None:
+        parser.error("one of --size or --rows is required")
+
+    with open(args.output, "w", encoding="utf-8", newline="") as output:
+        rows = generate_csv(
+            output,
+            size=args.size,
+            rows=args.rows,
+            columns=args.columns,
+            pii_columns=args.pii_columns,
+            quoting=args.quoting,
+            unicode=args.unicode,
+            cardinality=args.cardinality,
+            seed=args.seed,
+        )
+    print(f"Generated {rows:,} rows", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
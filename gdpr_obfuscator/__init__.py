@@ -1,3 +1,11 @@
 """ This file makes the directory "gdpr_obfuscator" a Python package """
 
+from .clients import configure_s3_client, get_s3_client, set_s3_client
+from .metrics import Metrics
 from .obfuscator import Obfuscator
+from .pseudonymise import Pseudonymiser, get_pseudonymiser, set_pseudonymiser
+from .detection import SchemaRegistry, get_schema_registry, set_schema_registry
+from .sinks import BytesSink, FileSink, S3MultipartSink, Sink, StdoutSink, open_sink
+from .batch import BatchResult, obfuscate_many
+from .manifest import Manifest, obfuscate_incrementally
+from .bulk import BulkResult, obfuscate_prefix
@@ -0,0 +1,7 @@
+""" Allows the package to be run from the command line with "python -m gdpr_obfuscator" """
+
+from .cli import main
+
+# Worker processes of the parallel mode import this module again, without running it
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+""" Obfuscation of many files concurrently with a shared S3 client """
+
+import json
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Union
+
+from .manifest import Manifest, obfuscate_incrementally
+from .metrics import Metrics, stage
+from .obfuscator import Obfuscator
+from .parallel import process_pool
+from .sinks import BytesSink, open_sink
+
+
+DEFAULT_MAX_WORKERS = 16
+
+
+@dataclass
+class BatchResult:
+    """
+    Outcome of one request of `obfuscate_many`.
+
+    Attributes:
+        file_to_obfuscate (str): The file of the request, if it could be read.
+        output (str): Where the obfuscated file was written, or None if it was kept in memory.
+        bytes_written (int): Size of the obfuscated file.
+        content (bytes): The obfuscated file, only for requests without an output.
+        error (Exception): The exception raised while processing the request, if any.
+        metrics (Metrics): The stage durations and counters of the request, if collected.
+        status (str): 'processed', or with a manifest 'skipped' or 'appended'. None on error.
+    """
+
+    file_to_obfuscate: Optional[str] = None
+    output: Optional[str] = None
+    bytes_written: int = 0
+    content: Optional[bytes] = None
+    error: Optional[Exception] = None
+    metrics: Optional[Metrics] = None
+    status: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def obfuscate_many(
+    requests: Iterable[Union[str, dict]],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    s3_client=None,
+    collect_metrics: bool = False,
+    manifest: Manifest = None,
+    pipelined: bool = False,
+) -> list[BatchResult]:
+    """
+    Obfuscates many files concurrently on a bounded pool of threads.
+
+    Every request is what the `Obfuscator` constructor accepts, as a JSON string
+    or a dictionary, with an optional 'output' key: an S3 URL, a local path or
+    '-' for stdout. Without it the obfuscated file is returned in the result.
+    All the requests share one S3 client, so the S3 round trips of different
+    files overlap instead of paying for a new client and new connections per
+    file. Its connection pool should be at least `max_workers` connections.
+    Files are validated by their GET, so each input costs a single S3 request.
+
+    Errors do not stop the batch: each one is reported in the result of its
+    request, and outputs are only published for successful requests.
+
+    With a manifest, files already obfuscated with the same options are
+    skipped after a HEAD request, append-only files only have their new
+    records processed (see `obfuscate_incrementally`) and the manifest is
+    saved once the batch is done. Every request then needs an 'output'.
+
+    Args:
+        requests (Iterable): The requests to process.
+        max_workers (int): Maximum number of files processed at the same time.
+        s3_client (optional): The boto3 S3 client to share. Defaults to the
+            process-wide client, created by the first request that needs S3.
+        collect_metrics (bool): If True, every result holds the `Metrics` of its request.
+        manifest (Manifest, optional): The record of the previous runs, updated by this one.
+        pipelined (bool): If True, each file is read, obfuscated and written in
+            overlapping threads (see `Obfuscator.obfuscate_to`).
+
+    Returns:
+        list: One `BatchResult` per request, in the order of the requests.
+
+    Example:
+        results = obfuscate_many(
+            [
+                {"file_to_obfuscate": "s3://bucket/a.csv", "pii_fields": ["name"], "output": "s3://out/a.csv"},
+                {"file_to_obfuscate": "s3://bucket/b.csv", "pii_fields": ["name"], "output": "s3://out/b.csv"},
+            ]
+        )
+        failed = [result for result in results if not result.ok]
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(_obfuscate_one, request, s3_client, collect_metrics, manifest, pipelined)
+            for request in requests
+        ]
+        results = [future.result() for future in futures]
+
+    if manifest is not None:
+        manifest.save()
+    return results
+
+
+def obfuscate_in_processes(
+    requests: Iterable[Union[str, dict]], max_workers: int, pipelined: bool = False
+) -> Iterator[BatchResult]:
+    """
+    Obfuscates many files on a pool of worker processes, one file per worker at a time.
+
+    Unlike `obfuscate_many`, whose threads share one core for parsing, every
+    file is parsed on its own core. Each worker process has its own
+    process-wide S3 client. The requests should have an 'output', since the
+    content of in-memory outputs is sent back to this process.
+
+    Args:
+        requests (Iterable): The requests to process, as for `obfuscate_many`.
+        max_workers (int): Number of worker processes.
+        pipelined (bool): If True, each file is obfuscated in pipelined mode.
+
+    Yields:
+        BatchResult: The outcome of each request, in the order of the requests,
+        as soon as it and the ones before it are done.
+    """
+    with process_pool(max_workers) as pool:
+        futures = [pool.submit(_obfuscate_in_worker, request, pipelined) for request in requests]
+        for future in futures:
+            yield future.result()
+
+
+def _obfuscate_in_worker(request: Union[str, dict], pipelined: bool) -> BatchResult:
+    """
+    Processes a request of `obfuscate_in_processes` in a worker process.
+
+    Returns:
+        BatchResult: The outcome of the request, with an error that can be
+        sent back to the parent process.
+    """
+    result = _obfuscate_one(request, None, pipelined=pipelined)
+    if result.error is not None:
+        try:
+            pickle.dumps(result.error)
+        except Exception:
+            result.error = RuntimeError(f"{type(result.error).__name__}: {result.error}")
+    return result
+
+
+def _obfuscate_one(
+    request: Union[str, dict],
+    s3_client,
+    collect_metrics: bool = False,
+    manifest: Manifest = None,
+    pipelined: bool = False,
+) -> BatchResult:
+    """
+    Processes a single request of `obfuscate_many`, capturing any error.
+
+    Args:
+        request (str | dict): The request, as a JSON string or a dictionary.
+        s3_client (optional): The shared boto3 S3 client, or None for the process-wide one.
+        collect_metrics (bool): If True, the metrics of the request are kept in the result.
+        manifest (Manifest, optional): Skips or extends the files already obfuscated.
+        pipelined (bool): If True, the file is obfuscated in pipelined mode.
+
+    Returns:
+        BatchResult: The outcome of the request.
+    """
+    result = BatchResult(metrics=Metrics() if collect_metrics else None)
+
+    try:
+        if isinstance(request, str):
+            json_string = request
+            request = json.loads(request)
+        else:
+            json_string = json.dumps(request)
+
+        result.file_to_obfuscate = request.get("file_to_obfuscate")
+        result.output = request.get("output")
+
+        if manifest is not None:
+            result.status, result.bytes_written = obfuscate_incrementally(
+                request, manifest, s3_client, result.metrics, pipelined
+            )
+            return result
+
+        obfuscator = Obfuscator(
+            json_string, s3_client=s3_client, lazy_validation=True, metrics=result.metrics
+        )
+        with open_sink(result.output, s3_client) as sink:
+            result.bytes_written = obfuscator.obfuscate_to(sink, pipelined=pipelined)
+
+            # Closing publishes the output, for S3 it completes the upload
+            with stage(result.metrics, "publish"):
+                sink.close()
+
+        if isinstance(sink, BytesSink):
+            result.content = sink.getvalue()
+        result.status = "processed"
+    except Exception as e:
+        result.error = e
+
+    return result
@@ -0,0 +1,219 @@
+""" Obfuscation of every file under an S3 prefix or a local directory, with resumable checkpoints """
+
+import os
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+from urllib.parse import urlparse
+
+from .batch import DEFAULT_MAX_WORKERS, obfuscate_many
+from .clients import get_s3_client
+from .manifest import Manifest, load_document, save_document
+from .sinks import is_temporary_file
+
+
+# Number of files listed, processed and checkpointed at a time, one S3 listing page
+PAGE_SIZE = 1000
+
+
+@dataclass
+class BulkResult:
+    """
+    Outcome of `obfuscate_prefix`, including the runs it resumed.
+
+    Attributes:
+        processed (int): Number of files obfuscated, or appended to with a manifest.
+        skipped (int): Number of files skipped because the manifest showed them unchanged.
+        failed (dict): The error message of each file that failed, by file.
+    """
+
+    processed: int = 0
+    skipped: int = 0
+    failed: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+def iter_pages(
+    location: str,
+    start_after: str = None,
+    s3_client=None,
+    page_size: int = PAGE_SIZE,
+    exclude: Iterable[str] = (),
+) -> Iterator[list]:
+    """
+    Lists the files under an S3 prefix or a local directory, in key order.
+
+    S3 prefixes are listed with a paginator, one page at a time, so listing
+    millions of objects needs neither the whole listing in memory nor any
+    request for the keys before `start_after`. Empty objects, such as the
+    markers of S3 folders, and the temporary files of local outputs are left out.
+
+    Args:
+        location (str): An S3 URL ('s3://bucket/prefix/') or a local directory.
+        start_after (str, optional): Only the files after this one are listed.
+        s3_client (optional): The boto3 S3 client. Defaults to the process-wide client.
+        page_size (int): Maximum number of files per page.
+        exclude (Iterable): S3 URLs or local paths left out of the listing,
+            such as the checkpoint and the manifest of the run.
+
+    Yields:
+        list: Pages of S3 URLs or local paths.
+    """
+    exclude = {item if item.startswith("s3://") else os.path.abspath(item) for item in exclude}
+
+    if location.startswith("s3://"):
+        s3 = s3_client or get_s3_client()
+        parsed_url = urlparse(location)
+        bucket_name = parsed_url.netloc
+        arguments = {"Bucket": bucket_name, "Prefix": parsed_url.path.lstrip("/")}
+        if start_after:
+            arguments["StartAfter"] = urlparse(start_after).path.lstrip("/")
+
+        paginator = s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(**arguments, PaginationConfig={"PageSize": page_size}):
+            keys = [item["Key"] for item in page.get("Contents", []) if item["Size"] > 0]
+            urls = [f"s3://{bucket_name}/{key}" for key in keys]
+            urls = [url for url in urls if url not in exclude]
+            if urls:
+                yield urls
+        return
+
+    paths = sorted(
+        os.path.join(directory, file_name)
+        for directory, _, file_names in os.walk(location)
+        for file_name in file_names
+    )
+    if start_after is not None:
+        paths = [path for path in paths if path > start_after]
+    paths = [
+        path
+        for path in paths
+        if os.path.getsize(path) and not is_temporary_file(path) and os.path.abspath(path) not in exclude
+    ]
+    for start in range(0, len(paths), page_size):
+        yield paths[start : start + page_size]
+
+
+def output_location(source: str, location: str, destination: str) -> str:
+    """
+    Maps a file under `location` to the same relative place under `destination`.
+
+    Example:
+        output_location("s3://in/2024/a.csv", "s3://in/", "s3://out/obfuscated/")
+        # "s3://out/obfuscated/2024/a.csv"
+    """
+    relative = source[len(location) :].lstrip("/")
+    if destination.startswith("s3://"):
+        return f"{destination.rstrip('/')}/{relative}"
+    return os.path.join(destination, relative)
+
+
+def obfuscate_prefix(
+    location: str,
+    destination: str,
+    options: dict,
+    checkpoint: str = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    s3_client=None,
+    manifest: Manifest = None,
+    pipelined: bool = False,
+    page_size: int = PAGE_SIZE,
+) -> BulkResult:
+    """
+    Obfuscates every file under an S3 prefix or a local directory.
+
+    Files are listed one page at a time and each page is processed by
+    `obfuscate_many` with bounded concurrency. Each output is written at the
+    same relative place under `destination`, which may be the location itself
+    to obfuscate the files in place: each output only replaces its file once
+    it is complete. A manifest cannot be used in place, as the outputs would
+    be taken for changes of the sources.
+
+    After each page, the checkpoint records the last file listed and the
+    results so far. A run given the checkpoint of a crashed or timed-out run
+    resumes listing after that file, so finished files are neither listed nor
+    processed again. Files that failed are kept in the checkpoint and reported.
+
+    Args:
+        location (str): An S3 URL ('s3://bucket/prefix/') or a local directory.
+        destination (str): An S3 URL or a local directory for the outputs.
+        options (dict): The keys of the requests other than 'file_to_obfuscate'
+            and 'output', such as 'pii_fields' and 'transforms'.
+        checkpoint (str, optional): Local path or S3 URL of the checkpoint document.
+        max_workers (int): Maximum number of files processed at the same time.
+        s3_client (optional): The boto3 S3 client. Defaults to the process-wide client.
+        manifest (Manifest, optional): Skips the files unchanged since a previous run.
+        pipelined (bool): If True, each file is obfuscated in pipelined mode.
+        page_size (int): Number of files listed and processed between two checkpoints.
+
+    Returns:
+        BulkResult: The counts of files processed and skipped, and the failures.
+
+    Raises:
+        ValueError: If the destination is inside the location, a manifest is
+        used in place, or the checkpoint is the one of another location.
+    """
+    root, inside = location.rstrip("/") + "/", destination.rstrip("/") + "/"
+    if inside != root and inside.startswith(root):
+        raise ValueError("The destination cannot be inside the location to obfuscate")
+    if inside == root and manifest is not None:
+        raise ValueError("A manifest cannot be used to obfuscate the files in place")
+    if s3_client is None and (location.startswith("s3://") or destination.startswith("s3://")):
+        s3_client = get_s3_client()
+
+    state = load_document(checkpoint, s3_client) if checkpoint else None
+    if state is not None and state.get("location") != location:
+        raise ValueError(f"The checkpoint '{checkpoint}' belongs to a run on '{state.get('location')}'")
+
+    state = state or {"location": location, "start_after": None}
+    result = BulkResult(
+        processed=state.get("processed", 0),
+        skipped=state.get("skipped", 0),
+        failed=state.get("failed", {}),
+    )
+
+    # The documents of the run, and their temporary files, may be stored under the location
+    documents = [path for path in (checkpoint, manifest and manifest.location) if path]
+    exclude = documents + [f"{path}.tmp" for path in documents]
+
+    for page in iter_pages(location, state["start_after"], s3_client, page_size, exclude):
+        requests = [
+            {
+                **options,
+                "file_to_obfuscate": source,
+                "output": output_location(source, location, destination),
+            }
+            for source in page
+        ]
+        if not destination.startswith("s3://"):
+            for request in requests:
+                os.makedirs(os.path.dirname(request["output"]) or ".", exist_ok=True)
+
+        batch = obfuscate_many(
+            requests,
+            max_workers=max_workers,
+            s3_client=s3_client,
+            manifest=manifest,
+            pipelined=pipelined,
+        )
+
+        for request, outcome in zip(requests, batch):
+            if not outcome.ok:
+                result.failed[request["file_to_obfuscate"]] = str(outcome.error)
+            elif outcome.status == "skipped":
+                result.skipped += 1
+            else:
+                result.processed += 1
+
+        if checkpoint:
+            state.update(
+                start_after=page[-1],
+                processed=result.processed,
+                skipped=result.skipped,
+                failed=result.failed,
+            )
+            save_document(checkpoint, state, s3_client)
+
+    return result
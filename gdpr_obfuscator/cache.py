@@ -0,0 +1,169 @@
+""" Bounded caches kept for the life of the process, so warm Lambda invocations reuse earlier work """
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from .pseudonymise import pseudonymiser_stats
+
+
+# Maximum number of entries of each cache, and seconds an entry is kept for
+DEFAULT_CACHE_SIZE = int(os.environ.get("OBFUSCATOR_CACHE_SIZE", "256"))
+DEFAULT_CACHE_TTL = float(os.environ.get("OBFUSCATOR_CACHE_TTL", "3600"))
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after a time to live.
+
+    When the cache is full, the least recently used entry is evicted. Entries
+    older than `ttl` seconds are dropped when they are next looked up. Hits,
+    misses, evictions and expirations are counted, see `stats`.
+
+    Args:
+        max_size (int): Maximum number of entries.
+        ttl (float, optional): Seconds an entry is kept for, forever if None.
+        clock (Callable): Returns the current time in seconds.
+    """
+
+    def __init__(
+        self,
+        max_size: int = DEFAULT_CACHE_SIZE,
+        ttl: Optional[float] = DEFAULT_CACHE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.__clock = clock
+        # Re-entrant, so a factory of `get_or_create` may use the cache too
+        self.__lock = threading.RLock()
+        self.__entries = OrderedDict()
+        self.__counts = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key: Hashable, default=None):
+        """
+        Returns:
+            The value of the key, or `default` if it is missing or has expired.
+        """
+        with self.__lock:
+            value = self.__lookup(key)
+            if value is _MISSING:
+                self.__counts["misses"] += 1
+                return default
+            self.__counts["hits"] += 1
+            return value
+
+    def put(self, key: Hashable, value) -> None:
+        """Stores a value, evicting the least recently used entries beyond `max_size`."""
+        with self.__lock:
+            self.__entries[key] = (value, self.__clock())
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.__counts["evictions"] += 1
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], object]):
+        """
+        Returns the value of the key, storing the result of `factory()` first if it is missing.
+
+        Exceptions of the factory are raised and nothing is stored.
+        """
+        with self.__lock:
+            value = self.__lookup(key)
+            if value is not _MISSING:
+                self.__counts["hits"] += 1
+                return value
+
+            self.__counts["misses"] += 1
+            value = factory()
+            self.put(key, value)
+            return value
+
+    def pop(self, key: Hashable, default=None):
+        """Removes a key, returning its value or `default`."""
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def clear(self) -> None:
+        """Empties the cache and resets its counters."""
+        with self.__lock:
+            self.__entries.clear()
+            self.__counts = dict.fromkeys(self.__counts, 0)
+
+    def stats(self) -> dict:
+        """
+        Reports how well the cache is doing.
+
+        Returns:
+            dict: The number of 'hits', 'misses', 'evictions' and 'expirations',
+            the current 'size' and 'max_size', and the 'hit_rate' between 0 and 1.
+        """
+        with self.__lock:
+            counts = dict(self.__counts)
+            size = len(self.__entries)
+        lookups = counts["hits"] + counts["misses"]
+        return {
+            **counts,
+            "size": size,
+            "max_size": self.max_size,
+            "hit_rate": counts["hits"] / lookups if lookups else 0.0,
+        }
+
+    def __lookup(self, key: Hashable):
+        entry = self.__entries.get(key)
+        if entry is None:
+            return _MISSING
+
+        value, created = entry
+        if self.ttl is not None and self.__clock() - created >= self.ttl:
+            del self.__entries[key]
+            self.__counts["expirations"] += 1
+            return _MISSING
+
+        self.__entries.move_to_end(key)
+        return value
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__entries)
+
+
+# The validated options of requests, by canonical JSON of the options
+request_configs = TTLCache()
+
+# The compiled plans of CSV headers, by header, PII fields and transforms
+row_plans = TTLCache()
+
+# S3 clients, by name. They are never expired, to keep their connection pools
+s3_clients = TTLCache(max_size=8, ttl=None)
+
+
+def cache_stats() -> dict:
+    """
+    Reports the statistics of every process-wide cache.
+
+    Returns:
+        dict: The `TTLCache.stats` of 'request_configs', 'row_plans' and
+        's3_clients', and the memo statistics of the process-wide
+        pseudonymiser under 'tokens' once it is in use.
+    """
+    stats = {
+        "request_configs": request_configs.stats(),
+        "row_plans": row_plans.stats(),
+        "s3_clients": s3_clients.stats(),
+    }
+    tokens = pseudonymiser_stats()
+    if tokens is not None:
+        stats["tokens"] = tokens
+    return stats
+
+
+def clear_caches() -> None:
+    """Empties the request config and row plan caches. Clients and tokens are kept."""
+    request_configs.clear()
+    row_plans.clear()
@@ -0,0 +1,293 @@
+""" Command line of the obfuscator, kept apart so the library and the Lambda handler never load it """
+
+import argparse
+import glob
+import json
+import os
+import sys
+from urllib.parse import urlparse
+
+from .batch import BatchResult, obfuscate_in_processes, obfuscate_many
+from .bulk import obfuscate_prefix
+from .manifest import Manifest
+from .obfuscator import Obfuscator
+from .sinks import open_sink
+
+
+def main(argv: list = None):
+    """
+    Command line of the obfuscator: python -m gdpr_obfuscator INPUT [INPUT ...].
+
+    Every input is a JSON request, or a local path, glob or S3 URL obfuscated
+    with the `--pii-fields` and `--options` given. Requests can also be read
+    from a JSON Lines file with `--requests`. Outputs are streamed to their
+    file, S3 object or stdout as they are produced, a summary line per file
+    is printed to stderr, and the exit status is 1 if any file failed.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "bulk":
+        return bulk_main(argv[1:])
+
+    parser = argparse.ArgumentParser(
+        description="Obfuscate PII fields in CSV, JSON Lines and Parquet files."
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        help="JSON requests with 'file_to_obfuscate' and optional 'pii_fields', "
+        "or local paths, globs or S3 URLs of files to obfuscate.",
+    )
+    parser.add_argument(
+        "--requests",
+        type=str,
+        default=None,
+        help="File of JSON requests, one per line ('-' for stdin).",
+    )
+    parser.add_argument(
+        "--pii-fields",
+        nargs="+",
+        default=None,
+        help="PII fields of the inputs given as paths, globs or S3 URLs.",
+    )
+    parser.add_argument(
+        "--options",
+        type=str,
+        default=None,
+        help="JSON object of other keys of the inputs given as paths, globs or S3 URLs.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Path or S3 URL of the obfuscated file, for a single input. Defaults to stdout.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=None,
+        help="Directory or S3 prefix of the obfuscated files, named after their input.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Obfuscate this many files at the same time, each in its own process.",
+    )
+    parser.add_argument(
+        "--compression",
+        type=str,
+        default=None,
+        help="Codec of the output: gzip, bz2, zstd or none. Defaults to the codec of the input.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="Obfuscate a large uncompressed CSV file with this many worker processes.",
+    )
+    parser.add_argument(
+        "--compression-level",
+        type=int,
+        default=None,
+        help="Compression level of the output. Defaults to the default of the codec.",
+    )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="Overlap the download, the obfuscation and the writes in separate threads.",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="Local path or S3 URL of a manifest: skip the files unchanged since the last run.",
+    )
+
+    args = parser.parse_args(argv)
+
+    try:
+        requests = _build_requests(args)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not requests:
+        parser.error("nothing to obfuscate: give inputs or --requests")
+
+    if args.processes:
+        if len(requests) != 1:
+            parser.error("--processes splits a single file, use --workers for many files")
+        request = requests[0]
+        result = BatchResult(request.get("file_to_obfuscate"), request["output"])
+        try:
+            obfuscator = Obfuscator(json.dumps(request))
+            with open_sink(request["output"]) as sink:
+                for chunk in obfuscator.obfuscate_parallel(max_workers=args.processes):
+                    sink.write(chunk)
+                    result.bytes_written += len(chunk)
+            result.status = "processed"
+        except Exception as e:
+            result.error = e
+        results = [result]
+    elif args.manifest:
+        manifest = Manifest(args.manifest)
+        results = obfuscate_many(
+            requests, max_workers=args.workers or 1, manifest=manifest, pipelined=args.pipelined
+        )
+    elif args.workers and args.workers > 1 and len(requests) > 1:
+        results = obfuscate_in_processes(requests, args.workers, args.pipelined)
+    else:
+        results = obfuscate_many(requests, max_workers=1, pipelined=args.pipelined)
+
+    failed = 0
+    for result in results:
+        if result.ok:
+            output = "stdout" if result.output == "-" else result.output
+            print(
+                f"{result.status}: {result.file_to_obfuscate} -> {output} ({result.bytes_written} bytes)",
+                file=sys.stderr,
+            )
+        else:
+            failed += 1
+            print(f"failed: {result.file_to_obfuscate}: {result.error}", file=sys.stderr)
+
+    if failed:
+        sys.exit(1)
+
+
+def _build_requests(args) -> list[dict]:
+    """
+    Turns the inputs of the command line into requests with an 'output'.
+
+    Files matched by a glob keep their path relative to the directory before
+    its first wildcard under `--output-dir`, so 'col/**/x.csv' writes
+    'col/a/x.csv' to 'a/x.csv'. Other files are named after their input.
+
+    Raises:
+        ValueError: If a request is not valid JSON, a glob matches no file,
+        several files have no output, or several files have the same output,
+        stdout included.
+    """
+    options = json.loads(args.options) if args.options else {}
+    if args.pii_fields:
+        options["pii_fields"] = args.pii_fields
+
+    requests = []
+    # The names of the outputs under --output-dir, by position of the request
+    names = {}
+    for item in args.inputs:
+        if item.lstrip().startswith("{"):
+            requests.append(json.loads(item))
+        elif item.startswith("s3://") or not _has_wildcard(item):
+            requests.append({**options, "file_to_obfuscate": item})
+        else:
+            paths = sorted(glob.glob(item, recursive=True))
+            if not paths:
+                raise ValueError(f"No file matches '{item}'")
+            root = _glob_root(item)
+            for path in paths:
+                names[len(requests)] = os.path.relpath(path, root).replace(os.sep, "/")
+                requests.append({**options, "file_to_obfuscate": path})
+
+    if args.requests:
+        lines = sys.stdin if args.requests == "-" else open(args.requests)
+        with lines:
+            requests.extend(json.loads(line) for line in lines if line.strip())
+
+    if args.output and len(requests) > 1:
+        raise ValueError("--output is the output of a single file, use --output-dir for many")
+    if args.output_dir and not args.output_dir.startswith("s3://"):
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    sources = {}
+    for position, request in enumerate(requests):
+        # Command line options override the keys of the requests
+        if args.compression is not None:
+            request["output_compression"] = args.compression
+        if args.compression_level is not None:
+            request["compression_level"] = args.compression_level
+
+        if request.get("output"):
+            pass
+        elif args.output_dir:
+            name = names.get(position)
+            if name is None:
+                name = os.path.basename(urlparse(request.get("file_to_obfuscate", "")).path)
+            if args.output_dir.startswith("s3://"):
+                request["output"] = f"{args.output_dir.rstrip('/')}/{name}"
+            else:
+                request["output"] = os.path.join(args.output_dir, *name.split("/"))
+                os.makedirs(os.path.dirname(request["output"]), exist_ok=True)
+        elif len(requests) == 1:
+            request["output"] = args.output or "-"
+        else:
+            raise ValueError(
+                f"'{request.get('file_to_obfuscate')}' has no output, use --output-dir"
+            )
+
+        output = request["output"]
+        if output in sources:
+            destination = "stdout" if output == "-" else f"'{output}'"
+            raise ValueError(
+                f"'{sources[output]}' and '{request.get('file_to_obfuscate')}' "
+                f"would both be written to {destination}"
+            )
+        sources[output] = request.get("file_to_obfuscate")
+
+    return requests
+
+
+def _has_wildcard(path: str) -> bool:
+    return any(character in path for character in "*?[")
+
+
+def _glob_root(pattern: str) -> str:
+    """Returns the directory of a glob before its first wildcard, '.' if there is none."""
+    root = os.path.dirname(pattern)
+    while _has_wildcard(root):
+        root = os.path.dirname(root)
+    return root or "."
+
+
+def bulk_main(argv: list = None):
+    """Command line of the bulk mode: python -m gdpr_obfuscator bulk LOCATION DESTINATION."""
+    parser = argparse.ArgumentParser(
+        prog="gdpr_obfuscator bulk",
+        description="Obfuscate every file under an S3 prefix or a local directory.",
+    )
+    parser.add_argument("location", help="S3 URL of a prefix ('s3://bucket/prefix/') or local directory.")
+    parser.add_argument("destination", help="S3 URL or local directory of the obfuscated files.")
+    parser.add_argument(
+        "--options",
+        type=str,
+        default="{}",
+        help="JSON object of the options of every file, such as 'pii_fields' and 'transforms'.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        default=None,
+        help="Local path or S3 URL of a checkpoint: an interrupted run resumes where it stopped.",
+    )
+    parser.add_argument("--manifest", type=str, default=None, help="Skip files unchanged since the last run.")
+    parser.add_argument("--workers", type=int, default=16, help="Files processed at the same time.")
+    parser.add_argument("--pipelined", action="store_true", help="Obfuscate each file in pipelined mode.")
+
+    args = parser.parse_args(argv)
+
+    manifest = Manifest(args.manifest) if args.manifest else None
+    result = obfuscate_prefix(
+        args.location,
+        args.destination,
+        json.loads(args.options),
+        checkpoint=args.checkpoint,
+        max_workers=args.workers,
+        manifest=manifest,
+        pipelined=args.pipelined,
+    )
+
+    for source, error in result.failed.items():
+        print(f"Error: {source}: {error}", file=sys.stderr)
+    print(f"{result.processed} processed, {result.skipped} skipped, {len(result.failed)} failed")
+    if not result.ok:
+        sys.exit(1)
+
@@ -0,0 +1,108 @@
+""" Process-wide S3 client shared by every Obfuscator, sink and batch """
+
+import os
+
+from .cache import s3_clients
+
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_MODE = "adaptive"
+
+# Name of the process-wide client in the `s3_clients` cache
+DEFAULT_CLIENT = "default"
+
+
+def create_s3_client(
+    max_pool_connections: int = None,
+    max_attempts: int = None,
+    retry_mode: str = None,
+    session=None,
+    **client_kwargs,
+):
+    """
+    Creates a new S3 client with a sized connection pool and a retry policy.
+
+    Settings that are not given are read from the environment variables
+    `OBFUSCATOR_S3_MAX_POOL_CONNECTIONS`, `OBFUSCATOR_S3_MAX_ATTEMPTS` and
+    `OBFUSCATOR_S3_RETRY_MODE`, and then fall back to the module defaults.
+
+    boto3 is imported here, on the first use of S3, as it is by far the
+    slowest module to import: importing the package, and obfuscating local
+    files, do not pay for it.
+
+    Args:
+        max_pool_connections (int, optional): Maximum number of connections kept open.
+        max_attempts (int, optional): Maximum number of attempts of each request, first one included.
+        retry_mode (str, optional): The botocore retry mode: 'legacy', 'standard' or 'adaptive'.
+        session (boto3.Session, optional): The session to create the client from.
+        **client_kwargs: Any other argument for `boto3.client`, such as `region_name`.
+
+    Returns:
+        A new boto3 S3 client.
+    """
+    if max_pool_connections is None:
+        max_pool_connections = int(
+            os.environ.get("OBFUSCATOR_S3_MAX_POOL_CONNECTIONS", DEFAULT_MAX_POOL_CONNECTIONS)
+        )
+    if max_attempts is None:
+        max_attempts = int(os.environ.get("OBFUSCATOR_S3_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+    if retry_mode is None:
+        retry_mode = os.environ.get("OBFUSCATOR_S3_RETRY_MODE", DEFAULT_RETRY_MODE)
+
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        max_pool_connections=max_pool_connections,
+        retries={"total_max_attempts": max_attempts, "mode": retry_mode},
+    )
+    session = session or boto3.session.Session()
+    return session.client("s3", config=config, **client_kwargs)
+
+
+def get_s3_client():
+    """
+    Returns the process-wide S3 client, creating it on first use.
+
+    The client is kept in the `s3_clients` cache, which never expires it, so
+    it is reused by every call and, in AWS Lambda, by every warm invocation
+    of the same container. boto3 clients are thread-safe, so it can be shared
+    by worker threads.
+
+    Returns:
+        The shared boto3 S3 client.
+    """
+    return s3_clients.get_or_create(DEFAULT_CLIENT, create_s3_client)
+
+
+def set_s3_client(client) -> None:
+    """
+    Replaces the process-wide S3 client, for example with a moto-backed one in tests.
+
+    Args:
+        client: The boto3 S3 client to share, or None to create a new one on next use.
+
+    Example:
+        with mock_aws():
+            set_s3_client(boto3.client("s3", region_name="eu-west-2"))
+    """
+    if client is None:
+        s3_clients.pop(DEFAULT_CLIENT)
+    else:
+        s3_clients.put(DEFAULT_CLIENT, client)
+
+
+def configure_s3_client(**kwargs):
+    """
+    Creates a client with `create_s3_client` and makes it the process-wide client.
+
+    Args:
+        **kwargs: The arguments of `create_s3_client`.
+
+    Returns:
+        The new shared boto3 S3 client.
+    """
+    client = create_s3_client(**kwargs)
+    set_s3_client(client)
+    return client
@@ -0,0 +1,368 @@
+""" Streaming decompression of the input and recompression of the output """
+
+import bz2
+import io
+import zlib
+from typing import Iterable, Iterator, Optional
+
+
+CODECS = ("gzip", "bz2", "zstd")
+EXTENSIONS = {".gz": "gzip", ".gzip": "gzip", ".bz2": "bz2", ".zst": "zstd", ".zstd": "zstd"}
+MAGIC_BYTES = {b"\x1f\x8b": "gzip", b"BZh": "bz2", b"\x28\xb5\x2f\xfd": "zstd"}
+
+# Compression levels accepted by each codec, lowest and highest
+LEVELS = {"gzip": (0, 9), "bz2": (1, 9), "zstd": (1, 22)}
+
+# Number of bytes needed to recognise any of the magic numbers
+MAGIC_SIZE = 4
+
+# Smallest slice of compressed input given to a zstd decompressor at a time
+MIN_FEED_SIZE = 256
+
+
+def _import_zstandard():
+    """
+    Imports zstandard on first use, so it is only loaded for zstd files.
+
+    Raises:
+        ImportError: If zstandard is not installed.
+    """
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(
+            "zstd support requires zstandard: pip install 'gdpr_obfuscator[zstd]'"
+        ) from e
+    return zstandard
+
+
+def validate_codec(codec: Optional[str]) -> Optional[str]:
+    """
+    Checks a codec name given by the user.
+
+    Args:
+        codec (str): One of `CODECS`, 'none' or None.
+
+    Returns:
+        str: The codec, or None for no compression.
+
+    Raises:
+        ValueError: If the codec is not supported.
+    """
+    if codec in (None, "none"):
+        return None
+    if codec not in CODECS:
+        raise ValueError(
+            f"The compression '{codec}' is not supported, use one of {', '.join(CODECS)} or none"
+        )
+    return codec
+
+
+def validate_level(level, codec: Optional[str]):
+    """
+    Checks a compression level given by the user.
+
+    Args:
+        level (int, optional): The level, or None for the default of the codec.
+        codec (str, optional): One of `CODECS`, None for no compression, or
+            'auto' if the codec is only known from the magic bytes of the
+            input, in which case the level must suit every codec.
+
+    Returns:
+        int: The level, or None.
+
+    Raises:
+        ValueError: If the level is not an integer in the range of the codec.
+    """
+    if level is None or codec is None:
+        return level
+    if isinstance(level, bool) or not isinstance(level, int):
+        raise ValueError("The compression level must be an integer")
+
+    codecs = CODECS if codec == "auto" else (codec,)
+    lowest = max(LEVELS[name][0] for name in codecs)
+    highest = min(LEVELS[name][1] for name in codecs)
+    if not lowest <= level <= highest:
+        target = f"'{codec}'" if codec != "auto" else "a codec detected from the input"
+        raise ValueError(f"The compression level of {target} must be between {lowest} and {highest}")
+    return level
+
+
+def split_extension(file_name: str) -> tuple[str, Optional[str]]:
+    """
+    Removes a compression extension from a file name.
+
+    Args:
+        file_name (str): A path, key or URL such as 'data/file.csv.gz'.
+
+    Returns:
+        tuple: A tuple containing:
+            - name (str): The name without the compression extension, e.g. 'data/file.csv'.
+            - codec (str): The codec of the extension, or None.
+    """
+    for extension, codec in EXTENSIONS.items():
+        if file_name.lower().endswith(extension):
+            return file_name[: -len(extension)], codec
+    return file_name, None
+
+
+def detect_magic(head: bytes) -> Optional[str]:
+    """
+    Recognises a compressed stream from its first bytes.
+
+    Args:
+        head (bytes): At least the first `MAGIC_SIZE` bytes of the stream.
+
+    Returns:
+        str: The codec of the stream, or None if it is not compressed.
+    """
+    for magic, codec in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+class PeekableReader:
+    """
+    Binary reader that can look at the first bytes of a stream without consuming them.
+
+    Args:
+        source: Any object with a `read(size)` method returning bytes.
+    """
+
+    def __init__(self, source):
+        self.__source = source
+        self.__head = b""
+
+    def peek(self, size: int) -> bytes:
+        while len(self.__head) < size:
+            block = self.__source.read(size - len(self.__head))
+            if not block:
+                break
+            self.__head += block
+        return self.__head[:size]
+
+    def read(self, size: int = -1) -> bytes:
+        if self.__head:
+            head, self.__head = self.__head, b""
+            if size < 0:
+                return head + self.__source.read()
+            if len(head) >= size:
+                self.__head = head[size:]
+                return head[:size]
+            return head + self.__source.read(size - len(head))
+        return self.__source.read(size)
+
+    def close(self) -> None:
+        self.__source.close()
+
+
+class BoundedReader:
+    """
+    Binary reader that stops after a number of bytes of its source.
+
+    Args:
+        source: Any object with `read(size)` and `close()` methods returning bytes.
+        limit (int): Number of bytes of the source that can be read.
+    """
+
+    def __init__(self, source, limit: int):
+        self.__source = source
+        self.__remaining = limit
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.__remaining:
+            size = self.__remaining
+        if size <= 0:
+            return b""
+        data = self.__source.read(size)
+        self.__remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self.__source.close()
+
+
+def _decompressor(codec: str):
+    """Returns a new incremental decompressor for a codec."""
+    if codec == "gzip":
+        return zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    if codec == "bz2":
+        return bz2.BZ2Decompressor()
+    return _import_zstandard().ZstdDecompressor().decompressobj()
+
+
+def decompress_head(data: bytes, codec: str, size: int = -1) -> bytes:
+    """
+    Decompresses the start of a compressed file, as far as the bytes given allow.
+
+    Args:
+        data (bytes): The first bytes of the file, possibly cut in the middle of the stream.
+        codec (str): One of `CODECS`.
+        size (int): Maximum number of decompressed bytes returned, all of them if negative.
+
+    Returns:
+        bytes: The start of the decompressed content.
+    """
+    return DecompressingReader(io.BytesIO(data), codec, strict=False).read(size)
+
+
+class DecompressingReader:
+    """
+    Binary reader returning the decompressed content of a compressed stream.
+
+    The compressed stream is read in blocks and decompressed incrementally,
+    and each call of the decompressor is capped to about `block_size` bytes of
+    output, so a block that expands a thousandfold is not decompressed at once
+    and no full decompressed copy is ever held in memory. Concatenated streams,
+    as written by `cat a.gz b.gz`, are decompressed one after the other.
+    A stream cut before its end raises a ValueError instead of being
+    silently truncated, unless `strict` is False.
+
+    Args:
+        source: Any object with a `read(size)` method returning compressed bytes.
+        codec (str): One of `CODECS`.
+        block_size (int): Number of compressed bytes read from the source at a time.
+        strict (bool): If False, a stream cut before its end simply ends the
+            content, as for the start of a file read on its own.
+    """
+
+    def __init__(self, source, codec: str, block_size: int = 64 * 1024, strict: bool = True):
+        self.__source = source
+        self.__codec = codec
+        self.__block_size = block_size
+        self.__strict = strict
+        self.__decompressor = _decompressor(codec)
+        self.__started = False
+        # Compressed bytes read from the source but not given to the decompressor yet
+        self.__input = b""
+        # True if the decompressor may hold more output without being given more input
+        self.__pending = False
+        # zstandard has no output cap, so it is given slices of the input, sized
+        # from the compressed and decompressed bytes counted here
+        self.__fed = 0
+        self.__produced = 0
+        self.__buffer = bytearray()
+        self.__finished = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self.__finished and (size < 0 or len(self.__buffer) < size):
+            self.__fill(max(size - len(self.__buffer), self.__block_size))
+
+        if size < 0:
+            size = len(self.__buffer)
+        data = bytes(self.__buffer[:size])
+        # Deleting from the start of a bytearray does not copy the rest of it
+        del self.__buffer[:size]
+        return data
+
+    def __fill(self, limit: int) -> None:
+        """
+        Decompresses at most about `limit` more bytes into the buffer.
+
+        Raises:
+            ValueError: If the source ends in the middle of a compressed stream.
+        """
+        if not self.__input and not self.__pending:
+            self.__input = self.__source.read(self.__block_size)
+            if not self.__input:
+                self.__finished = True
+                if self.__started and self.__strict:
+                    raise ValueError(f"The {self.__codec} stream is truncated")
+                return
+
+        self.__started = True
+        decompressor = self.__decompressor
+        if self.__codec == "gzip":
+            output = decompressor.decompress(self.__input, limit)
+            # At the end of the stream, the rest of the input is in unused_data too
+            self.__input = b"" if decompressor.eof else decompressor.unconsumed_tail
+            self.__pending = len(output) >= limit
+        elif self.__codec == "bz2":
+            output = decompressor.decompress(self.__input, limit)
+            self.__input = b""
+            self.__pending = not decompressor.needs_input and not decompressor.eof
+        else:
+            # Sized from the compression ratio so far, to produce about `limit` bytes
+            feed_size = MIN_FEED_SIZE
+            if self.__produced:
+                feed_size = max(MIN_FEED_SIZE, min(limit * self.__fed // self.__produced, self.__block_size))
+            feed, self.__input = self.__input[:feed_size], self.__input[feed_size:]
+            output = decompressor.decompress(feed)
+            self.__fed += len(feed)
+            self.__produced += len(output)
+        self.__buffer += output
+
+        # Start a new decompressor for the next concatenated stream, if any
+        if decompressor.eof:
+            self.__input = decompressor.unused_data + self.__input
+            self.__decompressor = _decompressor(self.__codec)
+            self.__started = False
+            self.__pending = False
+
+    def close(self) -> None:
+        self.__source.close()
+
+
+def open_decompressed(source, codec: Optional[str] = None):
+    """
+    Wraps a binary stream so it is read decompressed.
+
+    Args:
+        source: Any object with `read(size)` and `close()` methods returning bytes.
+        codec (str, optional): The codec of the stream. If None, it is detected
+            from the magic bytes at the start of the stream.
+
+    Returns:
+        tuple: A tuple containing:
+            - reader: A reader of the decompressed content.
+            - codec (str): The codec of the stream, or None if it is not compressed.
+    """
+    if codec is None:
+        source = PeekableReader(source)
+        codec = detect_magic(source.peek(MAGIC_SIZE))
+        if codec is None:
+            return source, None
+
+    return DecompressingReader(source, codec), codec
+
+
+def _compressor(codec: str, level: Optional[int]):
+    """Returns a new incremental compressor for a codec and an optional level."""
+    if codec == "gzip":
+        level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        return zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    if codec == "bz2":
+        return bz2.BZ2Compressor(9 if level is None else level)
+
+    zstandard = _import_zstandard()
+    return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+
+
+def compress_chunks(
+    chunks: Iterable[bytes], codec: Optional[str], level: Optional[int] = None
+) -> Iterator[bytes]:
+    """
+    Compresses a stream of chunks incrementally.
+
+    Args:
+        chunks (Iterable[bytes]): The uncompressed chunks.
+        codec (str, optional): One of `CODECS`. The chunks are passed through if None.
+        level (int, optional): The compression level, the codec default if None.
+
+    Yields:
+        bytes: The compressed stream, in pieces. Empty pieces are skipped.
+    """
+    if codec is None:
+        for chunk in chunks:
+            if chunk:
+                yield chunk
+        return
+
+    compressor = _compressor(codec, level)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
@@ -0,0 +1,270 @@
+""" Sample-based detection of PII fields, with a registry of the schemas already seen """
+
+import csv
+import hashlib
+import json
+import re
+import threading
+from typing import Iterable, Optional
+
+from .parallel import split_complete_records
+
+
+# Maximum number of rows (or documents) of a file looked at by the detection
+DEFAULT_SAMPLE_ROWS = 200
+
+# Share of the non-empty sampled values of a column that must look like PII
+MATCH_RATIO = 0.8
+
+# Values that are PII whatever the name of their column
+VALUE_PATTERNS = {
+    "email": re.compile(r"[^@\s]+@[^@\s]+\.[A-Za-z]{2,}"),
+    # Between 9 and 15 digits, starting with a country code or a trunk prefix
+    "phone": re.compile(
+        r"(?=(?:\D*\d){9,15}\D*$)(?:\+\d{1,3}[ .-]?|0)(?:\(0\)[ .-]?)?\d{2,5}(?:[ .-]?\d{3,4}){1,2}"
+    ),
+    "postcode": re.compile(r"[A-Z]{1,2}\d[A-Z\d]? ?\d[A-Z]{2}", re.IGNORECASE),
+    "ni_number": re.compile(
+        r"(?!BG|GB|KN|NK|NT|TN|ZZ)[A-CEGHJ-PR-TW-Z][A-CEGHJ-NPR-TW-Z] ?\d{2} ?\d{2} ?\d{2} ?[A-D]",
+        re.IGNORECASE,
+    ),
+}
+
+# Column names that are PII whatever their values, matched on the snake_case name
+HEADER_PATTERNS = {
+    "name": re.compile(
+        r"name|(?:.*_)?(?:(?:first|last|full|given|family|middle|maiden)_?name|surname|forename)"
+    ),
+    "email": re.compile(r"(?:.*_)?e_?mail(?:_address)?"),
+    "phone": re.compile(r"(?:.*_)?(?:phone|mobile|telephone|tel)(?:_(?:number|no))?"),
+    "postcode": re.compile(r"(?:.*_)?(?:post_?code|zip_?code|zip)"),
+    "address": re.compile(r"(?:.*_)?(?:home_|street_|postal_)?address(?:_line)?(?:_\d)?"),
+    "date_of_birth": re.compile(r"(?:.*_)?(?:dob|date_of_birth|birth_?date|birthday)"),
+    "ni_number": re.compile(r"(?:.*_)?(?:nino|ni_number|ni_no|national_insurance(?:_number)?)"),
+}
+
+_lock = threading.Lock()
+_registry = None
+
+
+def _snake_case(name: str) -> str:
+    name = re.sub(r"(?<=[a-z0-9])(?=[A-Z])", "_", name)
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+
+def detect_column(name: str, values: Iterable[str]) -> Optional[str]:
+    """
+    Tells whether a column holds PII, from its name or from a sample of its values.
+
+    Args:
+        name (str): The column name, or the dotted path of a JSON key.
+        values (Iterable): Sampled values of the column, as strings.
+
+    Returns:
+        str: The kind of PII found, such as 'email' or 'header:name', or None.
+    """
+    key = _snake_case(name.rsplit(".", 1)[-1])
+    for kind, pattern in HEADER_PATTERNS.items():
+        if pattern.fullmatch(key):
+            return f"header:{kind}"
+
+    values = [value.strip() for value in values if value and value.strip()]
+    if not values:
+        return None
+    for kind, pattern in VALUE_PATTERNS.items():
+        matches = sum(1 for value in values if pattern.fullmatch(value))
+        if matches >= MATCH_RATIO * len(values):
+            return kind
+    return None
+
+
+def detect_pii_fields(columns: dict) -> dict:
+    """
+    Detects the PII fields of a sample.
+
+    Args:
+        columns (dict): Sampled values, as strings, by field name in file order.
+
+    Returns:
+        dict: The kind of PII of each detected field, by field name in file order.
+    """
+    detected = {}
+    for name, values in columns.items():
+        kind = detect_column(name, values)
+        if kind is not None:
+            detected[name] = kind
+    return detected
+
+
+def sample_csv(head: bytes, complete: bool, max_rows: int = DEFAULT_SAMPLE_ROWS) -> dict:
+    """
+    Collects the values of the first rows of a CSV file, by column.
+
+    Args:
+        head (bytes): The decompressed start of the file.
+        complete (bool): True if `head` is the whole file, so its last record is complete.
+        max_rows (int): Maximum number of rows sampled.
+
+    Returns:
+        dict: The values of each column of the header, by column name.
+    """
+    if not complete:
+        head = split_complete_records(head)[0]
+    lines = head.decode("utf-8", errors="replace").splitlines(keepends=True)
+    reader = csv.reader(lines)
+
+    fieldnames = next(reader, None) or []
+    columns = {name: [] for name in fieldnames}
+    for number, row in enumerate(reader):
+        if number >= max_rows:
+            break
+        for name, value in zip(fieldnames, row):
+            columns[name].append(value)
+    return columns
+
+
+def _flatten(value, path: str, columns: dict) -> None:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(item, f"{path}.{key}" if path else key, columns)
+    elif isinstance(value, list):
+        for item in value:
+            _flatten(item, path, columns)
+    elif path:
+        columns.setdefault(path, [])
+        if value is not None:
+            columns[path].append(value if isinstance(value, str) else json.dumps(value))
+
+
+def sample_jsonl(head: bytes, complete: bool, max_rows: int = DEFAULT_SAMPLE_ROWS) -> dict:
+    """
+    Collects the values of the first documents of a JSON Lines file, by key path.
+
+    Nested keys get dotted paths, as in 'pii_fields', and lists are looked through.
+
+    Args:
+        head (bytes): The decompressed start of the file.
+        complete (bool): True if `head` is the whole file, so its last line is complete.
+        max_rows (int): Maximum number of documents sampled.
+
+    Returns:
+        dict: The values of each key path, by path in order of appearance.
+
+    Raises:
+        ValueError: If a sampled line is not valid JSON.
+    """
+    lines = head.split(b"\n")
+    if not complete:
+        lines = lines[:-1]
+
+    columns = {}
+    rows = 0
+    for line in lines:
+        if rows >= max_rows:
+            break
+        if line.strip():
+            _flatten(json.loads(line), "", columns)
+            rows += 1
+    return columns
+
+
+def schema_fingerprint(file_format: str, fieldnames: Iterable[str]) -> str:
+    """
+    Identifies the schema of a file from its format and its field names, in order.
+
+    Returns:
+        str: A SHA-256 hex digest.
+    """
+    canonical = json.dumps([file_format, list(fieldnames)], separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class SchemaRegistry:
+    """
+    Remembers the PII fields detected for each schema, by schema fingerprint.
+
+    Files whose schema was already seen skip the detection and get the same
+    fields, so all the files of a dataset are obfuscated alike. The registry
+    lives in memory, and is also loaded from and saved to `location` if given.
+    It is safe to share between threads.
+
+    Args:
+        location (str, optional): A local path or an S3 URL ('s3://bucket/key')
+            of the registry document.
+        s3_client (optional): The boto3 S3 client of S3 locations. Defaults to
+            the process-wide client.
+    """
+
+    def __init__(self, location: Optional[str] = None, s3_client=None):
+        # Imported here, as the manifest module depends on the obfuscator, which depends on this one
+        from .manifest import load_document
+
+        self.location = location
+        self.__s3_client = s3_client
+        self.__lock = threading.Lock()
+        self.__schemas = (load_document(location, s3_client) if location else None) or {}
+
+    def get(self, fingerprint: str) -> Optional[dict]:
+        """
+        Returns:
+            dict: The kind of PII of each detected field of the schema, or None
+            if the schema was never seen.
+        """
+        with self.__lock:
+            entry = self.__schemas.get(fingerprint)
+            return None if entry is None else dict(entry["pii_fields"])
+
+    def put(self, fingerprint: str, fieldnames: list, detected: dict) -> None:
+        """
+        Records the detected fields of a schema.
+
+        Args:
+            fingerprint (str): The fingerprint of the schema.
+            fieldnames (list): Its field names, kept for reference.
+            detected (dict): The kind of PII of each detected field, by field name.
+        """
+        with self.__lock:
+            self.__schemas[fingerprint] = {"fieldnames": list(fieldnames), "pii_fields": dict(detected)}
+
+    def save(self) -> None:
+        """Writes the registry to its location, if it has one."""
+        from .manifest import save_document
+
+        if self.location is None:
+            return
+        with self.__lock:
+            schemas = dict(self.__schemas)
+        save_document(self.location, schemas, self.__s3_client)
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__schemas)
+
+
+def get_schema_registry() -> SchemaRegistry:
+    """
+    Returns the process-wide schema registry, an in-memory one created on first use.
+
+    Sharing it lets every file of a batch, and every warm Lambda invocation,
+    reuse the detections of the schemas already seen.
+    """
+    global _registry
+
+    with _lock:
+        if _registry is None:
+            _registry = SchemaRegistry()
+        return _registry
+
+
+def set_schema_registry(registry: Optional[SchemaRegistry]) -> None:
+    """
+    Replaces the process-wide schema registry, for example with a persistent one.
+
+    Args:
+        registry (SchemaRegistry): The registry to share, or None to start a new
+            in-memory one on next use.
+    """
+    global _registry
+
+    with _lock:
+        _registry = registry
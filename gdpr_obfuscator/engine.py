@@ -0,0 +1,456 @@
+""" Row engine shared by the sequential and the parallel obfuscation paths """
+
+import codecs
+import csv
+import io
+from itertools import chain
+from typing import Callable, Iterable, Iterator, Optional
+
+from .cache import row_plans
+from .transforms import Drop, Null
+
+
+# Size in bytes of the blocks read from the source and emitted by the stream
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+MASK = "***"
+
+
+def read_blocks(byte_stream, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Reads a binary stream in blocks of `chunk_size` bytes until it is exhausted.
+
+    Args:
+        byte_stream: Any object with a `read(size)` method returning bytes, such as
+            a file opened in binary mode or an S3 `StreamingBody`.
+        chunk_size (int): Number of bytes to read from the stream on each call.
+
+    Yields:
+        bytes: The consecutive non-empty blocks of the stream.
+    """
+    while block := byte_stream.read(chunk_size):
+        yield block
+
+
+def iter_lines(blocks: Iterable[bytes]) -> Iterator[str]:
+    """
+    Lazily decodes binary blocks and yields their content line by line.
+
+    Blocks are decoded with an incremental UTF-8 decoder, so multi-byte
+    characters split across two blocks are handled and only one block is held
+    in memory at a time. Line endings are kept, which is what the `csv` module
+    expects from its input iterable.
+
+    Args:
+        blocks (Iterable[bytes]): Consecutive blocks of UTF-8 encoded text.
+
+    Yields:
+        str: The decoded lines, including their line terminator.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+
+    for block in chain(blocks, [None]):
+        final = block is None
+        text = pending + decoder.decode(block or b"", final=final)
+
+        # Everything after the last newline belongs to a line not read completely yet
+        lines = text.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+
+    if pending:
+        yield pending
+
+
+def resolve_pii_indices(fieldnames: list, pii_fields: list) -> list[int]:
+    """
+    Resolves the names of the PII columns to their positions in the header.
+
+    This is done once per file, so the row loop only deals with indices.
+    PII fields that are not in the header are skipped.
+
+    Args:
+        fieldnames (list): The header of the file.
+        pii_fields (list): Names of the columns to obfuscate.
+
+    Returns:
+        list: The positions of the columns to obfuscate, in header order.
+    """
+    pii_names = set(pii_fields)
+    return [index for index, name in enumerate(fieldnames) if name in pii_names]
+
+
+class RowPlan:
+    """
+    The obfuscation of the rows of one header, compiled into specialised functions.
+
+    Every column is resolved once to what happens to it: kept, masked, passed
+    to a transform, emptied or dropped. The row functions are then generated
+    as a single list expression, such as `[row[0], MASK, t2(row[2]), *row[3:]]`,
+    so rows are rewritten without any loop or branch over the columns or the spec.
+
+    Plans only depend on the header, the PII fields and the transforms, and
+    `compile_plan` keeps them in the process-wide `row_plans` cache, so files
+    sharing a header, and warm Lambda invocations, share a plan.
+
+    Attributes:
+        fieldnames (list): The header of the input.
+        header (list): The header of the output, without the dropped columns.
+        pii_cells (int): Number of PII cells replaced or dropped per row.
+        row (Callable): Obfuscates a row given as a list of strings.
+        encoded_row (Callable): Obfuscates a row given as a list of UTF-8 encoded fields.
+    """
+
+    def __init__(self, fieldnames: list, pii_fields: list, transforms: Optional[dict] = None):
+        transforms = transforms or {}
+        self.fieldnames = list(fieldnames)
+        self.header = []
+        self.pii_cells = 0
+
+        pii_indices = set(resolve_pii_indices(fieldnames, pii_fields))
+        namespace = {"MASK": MASK, "ENCODED_MASK": MASK.encode("utf-8")}
+        items, encoded_items = [], []
+
+        for index, name in enumerate(fieldnames):
+            if index not in pii_indices:
+                items.append(f"row[{index}]")
+                encoded_items.append(f"row[{index}]")
+                self.header.append(name)
+                continue
+
+            self.pii_cells += 1
+            transform = transforms.get(name)
+            if isinstance(transform, Drop):
+                continue
+
+            self.header.append(name)
+            if transform is None:
+                items.append("MASK")
+                encoded_items.append("ENCODED_MASK")
+            elif isinstance(transform, Null):
+                items.append("''")
+                encoded_items.append("b''")
+            else:
+                namespace[f"t{index}"] = transform
+                namespace[f"e{index}"] = _encoded(transform)
+                items.append(f"t{index}(row[{index}])")
+                encoded_items.append(f"e{index}(row[{index}])")
+
+        # Fields beyond the header are kept, as the csv module does
+        rest = f"*row[{len(fieldnames)}:]"
+        self.row = eval(f"lambda row: [{', '.join(items + [rest])}]", namespace)
+        self.encoded_row = eval(f"lambda row: [{', '.join(encoded_items + [rest])}]", namespace)
+
+
+def _encoded(transform: Callable) -> Callable:
+    """Wraps a transform of strings into a transform of UTF-8 encoded fields."""
+
+    def encoded_transform(value: bytes) -> bytes:
+        return transform(value.decode("utf-8")).encode("utf-8")
+
+    return encoded_transform
+
+
+def compile_plan(
+    fieldnames: list, pii_fields: list, transforms: Optional[dict] = None
+) -> RowPlan:
+    """
+    Returns the compiled plan of a header, reusing a cached one when possible.
+
+    Args:
+        fieldnames (list): The header of the file.
+        pii_fields (list): Names of the columns to obfuscate. Missing columns are skipped.
+        transforms (dict, optional): Functions replacing the value of some PII
+            columns, by column name, or `Null` and `Drop` instances. The other
+            PII columns are masked.
+
+    Returns:
+        RowPlan: The plan of the header.
+    """
+    items = tuple(sorted((transforms or {}).items(), key=lambda item: item[0]))
+    key = (tuple(fieldnames), tuple(pii_fields), items)
+    try:
+        return row_plans.get_or_create(key, lambda: RowPlan(fieldnames, pii_fields, transforms))
+    except TypeError:
+        # Transforms that cannot be hashed are compiled every time
+        return RowPlan(fieldnames, pii_fields, transforms)
+
+
+def obfuscate_csv(
+    lines: Iterable[str],
+    pii_fields: list,
+    chunk_size: int,
+    fieldnames: Optional[list] = None,
+    transforms: Optional[dict] = None,
+    metrics=None,
+) -> Iterator[str]:
+    """
+    Obfuscates CSV lines one row at a time. Each PII field is replaced with '***',
+    or with the result of its function in `transforms`.
+
+    The header is compiled once into a `RowPlan`, and rows are handled as plain
+    lists by its generated row function, so no dictionary is built and no
+    column is looked up per row. Rows are written to a
+    small in-memory buffer that is handed out and emptied every time it grows
+    past `chunk_size` characters, so memory use depends on the chunk size and
+    not on the size of the input.
+
+    Args:
+        lines (Iterable[str]): The CSV lines, including their line terminator.
+        pii_fields (list): Names of the columns to obfuscate. Missing columns are skipped.
+        chunk_size (int): Approximate size of each emitted chunk.
+        fieldnames (list, optional): The header of the file. When given, `lines`
+            only contains data rows and no header is written to the output.
+        transforms (dict, optional): Functions taking and returning a string,
+            by PII column name, used instead of the mask. `Drop` removes the column.
+        metrics (Metrics, optional): Where the 'rows' and 'pii_cells' counters
+            are recorded, once the rows have all been read.
+
+    Yields:
+        str: Consecutive pieces of the obfuscated CSV, each ending on a row boundary.
+    """
+    reader = csv.reader(lines)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    write_header = fieldnames is None
+    if write_header:
+        fieldnames = next(reader, None)
+
+        # Nothing to write for an input without a header
+        if fieldnames is None:
+            return
+
+    plan = compile_plan(fieldnames, pii_fields, transforms)
+    if write_header:
+        writer.writerow(plan.header)
+
+    obfuscate_row = plan.row
+    width = len(fieldnames)
+    writerow = writer.writerow
+    tell = buffer.tell
+    rows = 0
+
+    try:
+        # Process the rows and obfuscate PII fields
+        for row in reader:
+            # Blank lines are dropped and short rows padded, as csv.DictReader does
+            if len(row) < width:
+                if not row:
+                    continue
+                row += [""] * (width - len(row))
+
+            writerow(obfuscate_row(row))
+            rows += 1
+
+            # Hand out the buffer once it is full and start a new one
+            if tell() >= chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    finally:
+        if metrics is not None:
+            metrics.count("rows", rows)
+            metrics.count("pii_cells", rows * plan.pii_cells)
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def obfuscate_csv_chunk(
+    data: bytes, fieldnames: list, pii_fields: list, transforms: Optional[dict] = None
+) -> bytes:
+    """
+    Obfuscates a block of complete CSV records that does not contain the header.
+
+    This is the unit of work of the parallel modes, so it only takes and returns
+    picklable values and can run in a worker process. Blocks without quotes
+    take the byte-level fast path, with the same output.
+
+    Args:
+        data (bytes): UTF-8 encoded CSV records, starting and ending on a record boundary.
+        fieldnames (list): The header of the file the records come from.
+        pii_fields (list): Names of the columns to obfuscate.
+        transforms (dict, optional): Picklable functions used instead of the mask,
+            by column name. The plan of the header is compiled once per worker process.
+
+    Returns:
+        bytes: The UTF-8 encoded obfuscated records.
+    """
+    if is_unquoted(data):
+        if not data.endswith(b"\n"):
+            data += b"\n"
+        return obfuscate_unquoted(data, compile_plan(fieldnames, pii_fields, transforms))
+
+    lines = io.StringIO(data.decode("utf-8"), newline="")
+    chunks = obfuscate_csv(lines, pii_fields, len(data) + 1, fieldnames, transforms)
+    return "".join(chunks).encode("utf-8")
+
+
+def format_header(fieldnames: list) -> str:
+    """
+    Serialises a header row the same way `obfuscate_csv` writes it.
+
+    Args:
+        fieldnames (list): The column names.
+
+    Returns:
+        str: The CSV header line, including its line terminator.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(fieldnames)
+    return buffer.getvalue()
+
+
+def is_unquoted(data: bytes) -> bool:
+    """
+    Tells whether a block of CSV records can be rewritten without the `csv` parser.
+
+    That is the case when it contains no quote character and no carriage
+    return other than in CRLF line endings, as every line is then exactly
+    its fields joined by commas.
+
+    Args:
+        data (bytes): Complete CSV records.
+
+    Returns:
+        bool: True if the block can take the byte-level fast path.
+    """
+    return b'"' not in data and data.count(b"\r") == data.count(b"\r\n")
+
+
+def obfuscate_unquoted(records: bytes, plan: RowPlan) -> bytes:
+    """
+    Obfuscates complete unquoted CSV records without decoding them.
+
+    Lines are split on the delimiter as raw bytes and rewritten by the encoded
+    row function of the plan. The output is byte for byte what `obfuscate_csv`
+    would write: blank lines are dropped, short rows are padded and lines end
+    with CRLF. The transforms only ever return substrings or hex digests of
+    unquoted values, so their results never need quoting.
+
+    Args:
+        records (bytes): Complete records accepted by `is_unquoted`, ending with a newline.
+        plan (RowPlan): The compiled plan of the header.
+
+    Returns:
+        bytes: The obfuscated records.
+    """
+    width = len(plan.fieldnames)
+    obfuscate_row = plan.encoded_row
+    # The csv module quotes a row made of a single empty field, so it is not read as a blank line
+    single_column = len(plan.header) == 1
+    output = []
+    append = output.append
+
+    for line in records.split(b"\n"):
+        if line.endswith(b"\r"):
+            line = line[:-1]
+        if not line:
+            continue
+
+        fields = line.split(b",")
+        if len(fields) < width:
+            fields += [b""] * (width - len(fields))
+        line = b",".join(obfuscate_row(fields))
+        append(b'""' if single_column and not line else line)
+
+    # Adds the terminator of the last line
+    append(b"")
+    return b"\r\n".join(output) if len(output) > 1 else b""
+
+
+def _parse_header(line: bytes) -> list:
+    """Parses an encoded header line the same way the `csv` parser does."""
+    return next(csv.reader([line.decode("utf-8")]), [])
+
+
+def obfuscate_csv_stream(
+    source,
+    pii_fields: list,
+    chunk_size: int,
+    fast_path: bool = True,
+    transforms: Optional[dict] = None,
+    metrics=None,
+    fieldnames: Optional[list] = None,
+) -> Iterator[bytes]:
+    """
+    Obfuscates a binary CSV stream, taking a byte-level fast path while it can.
+
+    Blocks are read from the source and cut after their last newline. As long
+    as the complete records contain no quotes they are rewritten directly as
+    bytes with `obfuscate_unquoted`, skipping the UTF-8 decoding and the `csv`
+    parser. As soon as a quote shows up, the rest of the stream, from the first
+    record not written yet, goes through `obfuscate_csv`. Both paths produce
+    exactly the same output.
+
+    Args:
+        source: Any object with a `read(size)` method returning bytes.
+        pii_fields (list): Names of the columns to obfuscate. Missing columns are skipped.
+        chunk_size (int): Number of bytes read from the source at a time.
+        fast_path (bool): Set to False to always use the `csv` parser.
+        transforms (dict, optional): Functions taking and returning a string,
+            by PII column name, used instead of the mask. `Drop` removes the column.
+        metrics (Metrics, optional): Where the 'rows' and 'pii_cells' counters are recorded.
+        fieldnames (list, optional): The header of the file, for a stream that
+            starts after it. No header is written to the output then.
+
+    Yields:
+        bytes: UTF-8 encoded pieces of the obfuscated CSV, each ending on a row boundary.
+    """
+    blocks = read_blocks(source, chunk_size)
+    plan = None if fieldnames is None else compile_plan(fieldnames, pii_fields, transforms)
+    pending = b""
+    rows = 0
+
+    try:
+        if fast_path:
+            for block in blocks:
+                data = pending + block
+                end = data.rfind(b"\n") + 1
+                records = data[:end]
+
+                if not is_unquoted(records):
+                    pending = data
+                    break
+
+                pending = data[end:]
+                if fieldnames is None:
+                    header_end = records.find(b"\n") + 1
+                    if not header_end:
+                        continue
+                    fieldnames = _parse_header(records[:header_end])
+                    plan = compile_plan(fieldnames, pii_fields, transforms)
+                    yield format_header(plan.header).encode("utf-8")
+                    records = records[header_end:]
+
+                if records:
+                    chunk = obfuscate_unquoted(records, plan)
+                    rows += chunk.count(b"\n")
+                    yield chunk
+            else:
+                # The whole stream was read, only a last line without newline may remain
+                if not pending or is_unquoted(pending):
+                    if fieldnames is None and pending:
+                        fieldnames = _parse_header(pending)
+                        plan = compile_plan(fieldnames, pii_fields, transforms)
+                        yield format_header(plan.header).encode("utf-8")
+                    elif pending:
+                        chunk = obfuscate_unquoted(pending + b"\n", plan)
+                        rows += chunk.count(b"\n")
+                        yield chunk
+                    return
+    finally:
+        # Rows of the fast path, the parser counts its own
+        if metrics is not None and rows:
+            metrics.count("rows", rows)
+            metrics.count("pii_cells", rows * plan.pii_cells)
+
+    # Full parser for everything that has not been written yet
+    lines = iter_lines(chain([pending], blocks))
+    for chunk in obfuscate_csv(
+        lines, pii_fields, chunk_size, fieldnames, transforms, metrics
+    ):
+        yield chunk.encode("utf-8")
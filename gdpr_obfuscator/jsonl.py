@@ -0,0 +1,169 @@
+""" Streaming obfuscation of JSON Lines (newline-delimited JSON) files """
+
+import io
+import json
+from typing import Callable, Iterator, Optional
+
+from .engine import MASK, iter_lines, read_blocks
+from .transforms import Drop, Null
+
+
+def compile_paths(pii_fields: list) -> list[tuple]:
+    """
+    Splits the PII fields into key paths, so 'address.postcode' reaches a nested key.
+
+    Args:
+        pii_fields (list): Names of the keys to obfuscate, with dots for nested keys.
+
+    Returns:
+        list: One tuple of keys per PII field.
+    """
+    return [tuple(pii_field.split(".")) for pii_field in pii_fields]
+
+
+def obfuscate_document(
+    document, paths: list[tuple], transforms: Optional[dict] = None
+) -> int:
+    """
+    Replaces the values of the PII keys of a JSON document with '***', in place.
+    Keys with a function in `transforms` get its result instead, keys with
+    `Null` become null and keys with `Drop` are removed.
+
+    A key containing dots is matched literally first, then as a nested path.
+    When a path goes through a list, it is applied to every element of the list.
+    Missing keys are skipped.
+
+    Args:
+        document: The parsed JSON value of one line.
+        paths (list): The key paths returned by `compile_paths`.
+        transforms (dict, optional): Functions taking and returning a string, by
+            PII field name. Values that are not strings are given to them as JSON.
+
+    Returns:
+        int: The number of values replaced, so 0 if the document is unchanged.
+    """
+    transforms = transforms or {}
+    replaced = 0
+    for path in paths:
+        transform = transforms.get(".".join(path))
+        replaced += _obfuscate_path(document, path, transform)
+    return replaced
+
+
+def _replacement(value, transform: Optional[Callable]):
+    if transform is None:
+        return MASK
+    if isinstance(transform, Null):
+        return None
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return transform(value)
+
+
+def _obfuscate_path(value, path: tuple, transform: Optional[Callable] = None) -> int:
+    if isinstance(value, list):
+        replaced = 0
+        for item in value:
+            replaced += _obfuscate_path(item, path, transform)
+        return replaced
+
+    if not isinstance(value, dict):
+        return 0
+
+    # A literal key with dots takes precedence over the nested path
+    dotted = ".".join(path)
+    if dotted in value:
+        _replace_key(value, dotted, transform)
+        return 1
+
+    key = path[0]
+    if key not in value:
+        return 0
+    if len(path) == 1:
+        _replace_key(value, key, transform)
+        return 1
+    return _obfuscate_path(value[key], path[1:], transform)
+
+
+def _replace_key(value: dict, key: str, transform: Optional[Callable]) -> None:
+    if isinstance(transform, Drop):
+        del value[key]
+    else:
+        value[key] = _replacement(value[key], transform)
+
+
+def obfuscate_jsonl_stream(
+    source,
+    pii_fields: list,
+    chunk_size: int,
+    transforms: Optional[dict] = None,
+    metrics=None,
+) -> Iterator[bytes]:
+    """
+    Obfuscates a binary JSON Lines stream one document at a time.
+
+    Lines are decoded and parsed one by one, so the whole document list is
+    never held in memory. Lines that cannot contain any PII key are copied
+    through unchanged without being parsed, and so are documents in which no
+    PII key was found. Blank lines are dropped.
+
+    Args:
+        source: Any object with a `read(size)` method returning bytes.
+        pii_fields (list): Names of the keys to obfuscate, with dots for nested keys.
+        chunk_size (int): Number of bytes read from the source at a time, and
+            approximate size of each emitted chunk.
+        transforms (dict, optional): Functions taking and returning a string,
+            by PII field name, used instead of the mask.
+        metrics (Metrics, optional): Where the 'rows' (documents) and 'pii_cells'
+            (values replaced) counters are recorded.
+
+    Yields:
+        bytes: UTF-8 encoded pieces of the obfuscated file, each ending on a line boundary.
+
+    Raises:
+        ValueError: If a line is not valid JSON.
+    """
+    paths = compile_paths(pii_fields)
+
+    # A document can only hold a PII key if the start of its top-level key appears
+    # in the line. The closing quote is left out so literal dotted keys match too
+    tokens = {json.dumps(path[0], ensure_ascii=False)[:-1] for path in paths}
+
+    buffer = io.StringIO()
+    rows = 0
+    replaced = 0
+
+    try:
+        for number, line in enumerate(iter_lines(read_blocks(source, chunk_size)), start=1):
+            stripped = line.strip()
+            if not stripped:
+                continue
+
+            # Escapes could hide a key from the text search, so such lines are always parsed
+            if "\\" in stripped or any(token in stripped for token in tokens):
+                try:
+                    document = json.loads(stripped)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Invalid JSON on line {number}: {e.msg}") from e
+
+                count = obfuscate_document(document, paths, transforms)
+                if count:
+                    stripped = json.dumps(document, ensure_ascii=False)
+                    replaced += count
+
+            buffer.write(stripped)
+            buffer.write("\n")
+            rows += 1
+
+            # Hand out the buffer once it is full and start a new one
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+    finally:
+        if metrics is not None:
+            metrics.count("rows", rows)
+            metrics.count("pii_cells", replaced)
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
@@ -1,53 +1,170 @@
 import json
-import boto3
 import logging
-from obfuscator import Obfuscator
+import os
+from urllib.parse import unquote_plus
+from gdpr_obfuscator import obfuscate_many
+from gdpr_obfuscator.cache import cache_stats
+from gdpr_obfuscator.metrics import emf_document
+
+# PII fields obfuscated in the files of S3 event notifications
+DEFAULT_PII_FIELDS = ["name", "email_address"]
+
+# Optional keys of a direct invocation passed through to the Obfuscator
+REQUEST_OPTIONS = [
+    'format', 'compression', 'output_compression', 'compression_level', 'transforms', 'on_missing_fields',
+    'detect_pii'
+]
+
+# Maximum number of files of one event processed at the same time
+MAX_WORKERS = int(os.environ.get("OBFUSCATOR_MAX_WORKERS", "8"))
+
+# Whether each file is downloaded, obfuscated and uploaded in overlapping threads
+PIPELINED = os.environ.get("OBFUSCATOR_PIPELINED", "true").lower() == "true"
+
+# Metrics of every file: 'emf' for CloudWatch Embedded Metric Format records,
+# 'log' for structured log lines, anything else to turn them off
+METRICS_MODE = os.environ.get("OBFUSCATOR_METRICS", "").lower()
+METRICS_NAMESPACE = os.environ.get("OBFUSCATOR_METRICS_NAMESPACE", "GDPRObfuscator")
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
 
 def lambda_handler(event, context):
+    """
+    Obfuscates the files of a direct invocation, an S3 event or an SQS batch.
 
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
+    - A direct invocation names one file with 'file_to_obfuscate' and 'pii_fields'.
+    - An S3 event may hold several records: all of them are processed
+      concurrently and the status of each one is returned.
+    - An SQS batch of S3 event notifications returns the ids of the messages
+      that failed in 'batchItemFailures', so only those are retried when the
+      event source mapping reports batch item failures.
 
-    pii_fields = []
+    Each obfuscated file overwrites its source object.
 
-    if "Records" in event:
-        bucket_name = event['Records'][0]['s3']['bucket']['name']
-        file_key = event['Records'][0]['s3']['object']['key']
-        file_to_obfuscate = f"s3://{bucket_name}/{file_key}"
-        pii_fields = ["name", "email_address"]
-    else:
-        file_to_obfuscate = event.get('file_to_obfuscate')
-        pii_fields = event.get('pii_fields')
-        bucket_name, file_key = file_to_obfuscate.replace("s3://", "").split("/", 1)
+    The S3 client, the validated options of the requests, the compiled plans of
+    the CSV headers, the detected schemas and the tokens are kept in bounded
+    process-wide caches, so warm invocations of the container reuse them. Their
+    hit rates are logged with the metrics.
+    """
+    if "Records" not in event:
+        return _handle_direct_invocation(event)
+
+    records = event["Records"]
+    if records and records[0].get("eventSource") == "aws:sqs":
+        return _handle_sqs_batch(records)
+
+    results = _obfuscate_files(
+        [(_s3_url(record), DEFAULT_PII_FIELDS) for record in records]
+    )
+    failed = [result for result in results if result['statusCode'] != 200]
+
+    return {
+        'statusCode': max([result['statusCode'] for result in failed], default=200),
+        'body': json.dumps(results)
+    }
+
+
+def _handle_direct_invocation(event):
+    file_to_obfuscate = event.get('file_to_obfuscate')
 
     if not file_to_obfuscate:
         return {
             'statusCode': 500,
             'body': 'file_to_obfuscate is missing'
         }
-    
-    json_string = json.dumps({"file_to_obfuscate": file_to_obfuscate, "pii_fields": pii_fields})
-    obfuscator = Obfuscator(json_string)
 
-    try:
-        obfuscated_file = obfuscator.obfuscate()
-    except ValueError as ve:
-        return {
-            'statusCode': 400,
-            'body': json.dumps(f"ValueError: {str(ve)}")
-        }
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'body': json.dumps(f"Error: {str(e)}")
-        }
+    options = {key: event[key] for key in REQUEST_OPTIONS if key in event}
+    result = _obfuscate_files([(file_to_obfuscate, event.get('pii_fields'))], options)[0]
+    return {'statusCode': result['statusCode'], 'body': result['body']}
+
+
+def _handle_sqs_batch(records):
+    # Every message carries an S3 event notification, with one or more records
+    files = []
+    failed_messages = []
+    for record in records:
+        # A message that is not a notification fails alone, instead of the whole batch
+        try:
+            notification = json.loads(record['body'])
+            urls = [_s3_url(s3_record) for s3_record in notification.get('Records', [])]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"Message {record['messageId']} is not an S3 event notification: {e!r}")
+            failed_messages.append(record['messageId'])
+            continue
+        files.extend((record['messageId'], url) for url in urls)
 
-    s3 = boto3.client('s3')
-    s3.put_object(Bucket=bucket_name, Key=file_key, Body=obfuscated_file.getvalue().encode('utf-8'))    
-    logger.info(f"Processing file: {file_to_obfuscate}")
+    results = _obfuscate_files([(url, DEFAULT_PII_FIELDS) for _, url in files])
+
+    for (message_id, _), result in zip(files, results):
+        if result['statusCode'] != 200 and message_id not in failed_messages:
+            failed_messages.append(message_id)
 
     return {
-        'statusCode': 200,
-        'body': 'File obfuscated successfully'
+        'batchItemFailures': [
+            {'itemIdentifier': message_id} for message_id in failed_messages
+        ]
     }
 
+
+def _s3_url(s3_record):
+    # Keys are URL-encoded in S3 event notifications
+    bucket_name = s3_record['s3']['bucket']['name']
+    file_key = unquote_plus(s3_record['s3']['object']['key'])
+    return f"s3://{bucket_name}/{file_key}"
+
+
+def _obfuscate_files(files, options=None):
+    """
+    Obfuscates (file_to_obfuscate, pii_fields) pairs concurrently in place.
+
+    The format and compression of each file are detected unless set in `options`.
+    A compressed file stays compressed with the same codec by default.
+
+    Returns:
+        list: One status per file, in order, with the file, a 'statusCode'
+        (200, 400 for invalid inputs or 500) and a 'body'.
+    """
+    requests = [
+        {'file_to_obfuscate': url, 'pii_fields': pii_fields or [], 'output': url, **(options or {})}
+        for url, pii_fields in files
+    ]
+
+    collect_metrics = METRICS_MODE in ('emf', 'log')
+    batch = obfuscate_many(
+        requests, max_workers=MAX_WORKERS, collect_metrics=collect_metrics, pipelined=PIPELINED
+    )
+
+    results = []
+    for request, result in zip(requests, batch):
+        if collect_metrics:
+            _emit_metrics(request['file_to_obfuscate'], result)
+
+        if result.ok:
+            logger.info(f"Processed file: {request['file_to_obfuscate']}")
+            status = {'statusCode': 200, 'body': 'File obfuscated successfully'}
+        elif isinstance(result.error, ValueError):
+            status = {'statusCode': 400, 'body': json.dumps(f"ValueError: {str(result.error)}")}
+        else:
+            logger.error(f"Failed to process file {request['file_to_obfuscate']}: {result.error}")
+            status = {'statusCode': 500, 'body': json.dumps(f"Error: {str(result.error)}")}
+
+        results.append({'file': request['file_to_obfuscate'], **status})
+
+    if collect_metrics:
+        # Shows how much of the work warm invocations of this container reuse
+        logger.info(json.dumps({'caches': cache_stats()}))
+
+    return results
+
+
+def _emit_metrics(file_to_obfuscate, result):
+    properties = {'file': file_to_obfuscate, 'ok': result.ok}
+
+    if METRICS_MODE == 'emf':
+        # EMF records must be printed as bare JSON lines to be turned into metrics
+        dimensions = {'FunctionName': os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'gdpr_obfuscator')}
+        print(json.dumps(emf_document(result.metrics, METRICS_NAMESPACE, dimensions, properties)))
+    else:
+        logger.info(json.dumps({**properties, 'metrics': result.metrics.to_dict()}))
@@ -0,0 +1,275 @@
+""" Manifest of the files already obfuscated, to skip or extend them on later runs """
+
+import hashlib
+import json
+import os
+import threading
+from typing import Optional, Union
+from urllib.parse import urlparse
+
+from .clients import get_s3_client
+from .metrics import Metrics, stage
+from .obfuscator import Obfuscator
+from .parallel import first_record_end, read_header
+from .sinks import open_sink
+
+
+# Keys of a request that change its output, and so its configuration hash
+CONFIG_KEYS = (
+    "pii_fields",
+    "transforms",
+    "detect_pii",
+    "format",
+    "compression",
+    "output_compression",
+    "compression_level",
+    "output",
+)
+
+# Bytes before the recorded offset of an append-only file that must be unchanged
+TAIL_SIZE = 1024
+
+# Bytes read to find the header of an append-only CSV file
+HEADER_SIZE = 64 * 1024
+
+
+def load_document(location: str, s3_client=None) -> Optional[dict]:
+    """
+    Reads a JSON document from a local path or an S3 URL.
+
+    Args:
+        location (str): A local path or an S3 URL ('s3://bucket/key').
+        s3_client (optional): The boto3 S3 client of S3 locations. Defaults to
+            the process-wide client.
+
+    Returns:
+        dict: The document, or None if it does not exist.
+    """
+    if location.startswith("s3://"):
+        s3 = s3_client or get_s3_client()
+        parsed_url = urlparse(location)
+        try:
+            response = s3.get_object(Bucket=parsed_url.netloc, Key=parsed_url.path.lstrip("/"))
+        except s3.exceptions.NoSuchKey:
+            return None
+        return json.loads(response["Body"].read())
+
+    if not os.path.exists(location):
+        return None
+    with open(location, "rb") as document_file:
+        return json.load(document_file)
+
+
+def save_document(location: str, document: dict, s3_client=None) -> None:
+    """
+    Writes a JSON document to a local path, replaced atomically, or to an S3 URL.
+
+    Args:
+        location (str): A local path or an S3 URL ('s3://bucket/key').
+        document (dict): The document to write.
+        s3_client (optional): The boto3 S3 client of S3 locations. Defaults to
+            the process-wide client.
+    """
+    body = json.dumps(document, sort_keys=True, indent=1).encode("utf-8")
+
+    if location.startswith("s3://"):
+        s3 = s3_client or get_s3_client()
+        parsed_url = urlparse(location)
+        s3.put_object(Bucket=parsed_url.netloc, Key=parsed_url.path.lstrip("/"), Body=body)
+        return
+
+    temporary_path = f"{location}.tmp"
+    with open(temporary_path, "wb") as document_file:
+        document_file.write(body)
+    os.replace(temporary_path, location)
+
+
+def config_hash(request: dict) -> str:
+    """
+    Hashes the options of a request that change its output.
+
+    Args:
+        request (dict): A request, as the `Obfuscator` constructor accepts it.
+
+    Returns:
+        str: A SHA-256 hex digest, the same for requests with the same options.
+    """
+    config = {key: request[key] for key in CONFIG_KEYS if key in request}
+    canonical = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    """
+    Records, by source file, the state of each file obfuscated and the options used.
+
+    An entry holds the 'etag' and 'size' of the source, the 'config' hash of
+    the request and, for append-only files, the 'offset' processed so far, a
+    digest of the 'tail' before it and the CSV 'fieldnames'. Entries are kept in
+    memory and written by `save`. The manifest is safe to share between threads.
+
+    Args:
+        location (str): A local path or an S3 URL ('s3://bucket/key'). The
+            manifest starts empty if it does not exist yet.
+        s3_client (optional): The boto3 S3 client of S3 locations. Defaults to
+            the process-wide client.
+    """
+
+    def __init__(self, location: str, s3_client=None):
+        self.location = location
+        self.__s3_client = s3_client
+        self.__lock = threading.Lock()
+        self.__entries = load_document(location, s3_client) or {}
+
+    def get(self, source: str) -> Optional[dict]:
+        """
+        Args:
+            source (str): The file to obfuscate.
+
+        Returns:
+            dict: The entry of the file, or None if it was never obfuscated.
+        """
+        with self.__lock:
+            return self.__entries.get(source)
+
+    def put(self, source: str, entry: dict) -> None:
+        """
+        Records the entry of a file, replacing the previous one.
+
+        Args:
+            source (str): The file that was obfuscated.
+            entry (dict): Its state after the obfuscation.
+        """
+        with self.__lock:
+            self.__entries[source] = entry
+
+    def save(self) -> None:
+        """Writes the manifest to its location. Local files are replaced atomically."""
+        with self.__lock:
+            entries = dict(self.__entries)
+        save_document(self.location, entries, self.__s3_client)
+
+
+def obfuscate_incrementally(
+    request: Union[str, dict],
+    manifest: Manifest,
+    s3_client=None,
+    metrics: Metrics = None,
+    pipelined: bool = False,
+) -> tuple[str, int]:
+    """
+    Obfuscates a file unless the manifest shows it was already done with the same options.
+
+    The state of the source is checked with a single HEAD request (a `stat` for
+    local files). A file whose ETag and options are unchanged is skipped.
+    With `"append": true` in the request, a CSV or JSON Lines file that only
+    grew since the last run, and still has the same bytes before the offset
+    recorded then, only has its new records obfuscated and added at the end
+    of the existing output. Anything else is obfuscated again from scratch.
+
+    Appending assumes the file is only ever appended to with complete records,
+    and is not available for compressed inputs or Parquet files.
+
+    Args:
+        request (str | dict): The request, with the 'output' to write to.
+        manifest (Manifest): The manifest, updated in memory. The caller saves it.
+        s3_client (optional): The boto3 S3 client of the source and the output.
+        metrics (Metrics, optional): Records the stages and counters of the obfuscation.
+        pipelined (bool): If True, a full obfuscation runs in pipelined mode.
+
+    Returns:
+        tuple: The status of the file, 'skipped', 'appended' or 'processed',
+        and the number of bytes written.
+
+    Raises:
+        ValueError: If the request has no 'output'.
+    """
+    if isinstance(request, str):
+        request = json.loads(request)
+    output = request.get("output")
+    if not output or output == "-":
+        raise ValueError("Incremental obfuscation needs an 'output' file or S3 URL")
+
+    source = request.get("file_to_obfuscate")
+    config = config_hash(request)
+
+    obfuscator = Obfuscator(
+        json.dumps(request), s3_client=s3_client, lazy_validation=True, metrics=metrics
+    )
+    with stage(metrics, "validate"):
+        state = obfuscator.source_state
+
+    entry = manifest.get(source)
+    if entry is not None and entry["config"] == config:
+        if entry["etag"] == state["etag"]:
+            return "skipped", 0
+
+        if (
+            request.get("append")
+            and entry.get("offset")
+            and state["size"] > entry["offset"]
+            and _tail_digest(obfuscator, entry["offset"]) == entry["tail"]
+        ):
+            written = 0
+            with open_sink(output, s3_client, append=True) as sink:
+                for chunk in obfuscator.obfuscate_appended(entry["offset"], entry.get("fieldnames")):
+                    with stage(metrics, "write"):
+                        sink.write(chunk)
+                    written += len(chunk)
+                with stage(metrics, "publish"):
+                    sink.close()
+
+            new_entry = {**state, "config": config, "output": output}
+            new_entry.update(_append_state(obfuscator, state["size"], entry.get("fieldnames")))
+            manifest.put(source, new_entry)
+            return "appended", written
+
+    with open_sink(output, s3_client) as sink:
+        written = obfuscator.obfuscate_to(sink, pipelined=pipelined)
+        with stage(metrics, "publish"):
+            sink.close()
+
+    new_entry = {**state, "config": config, "output": output}
+    if request.get("append"):
+        new_entry.update(_append_state(obfuscator, state["size"]))
+    manifest.put(source, new_entry)
+    return "processed", written
+
+
+def _tail_digest(obfuscator: Obfuscator, offset: int) -> str:
+    """Hashes the `TAIL_SIZE` bytes of the source before `offset`."""
+    data = obfuscator.read_range(max(0, offset - TAIL_SIZE), offset - 1)
+    return hashlib.sha256(data).hexdigest()
+
+
+def _append_state(obfuscator: Obfuscator, size: int, fieldnames: list = None) -> dict:
+    """
+    Records where the next run can resume an append-only file.
+
+    Nothing is recorded for compressed or Parquet files, or files whose last
+    record has no newline yet: their next change is obfuscated from scratch.
+
+    Args:
+        obfuscator (Obfuscator): The obfuscator of the file, already run.
+        size (int): The size of the file that was obfuscated.
+        fieldnames (list, optional): The CSV header, if it is already known.
+
+    Returns:
+        dict: The 'offset', 'tail' and, for CSV files, 'fieldnames' of the entry.
+    """
+    if obfuscator.file_format == "parquet" or obfuscator.input_compression is not None:
+        return {}
+
+    tail = obfuscator.read_range(max(0, size - TAIL_SIZE), size - 1)
+    if not tail.endswith(b"\n"):
+        return {}
+    state = {"offset": size, "tail": hashlib.sha256(tail).hexdigest()}
+
+    if obfuscator.file_format == "csv":
+        if fieldnames is None:
+            head = obfuscator.read_range(0, min(size, HEADER_SIZE) - 1)
+            if first_record_end(head) is None:
+                return {}
+            fieldnames, _ = read_header(head)
+        state["fieldnames"] = fieldnames
+    return state
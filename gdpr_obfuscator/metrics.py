@@ -0,0 +1,180 @@
+""" Per-stage timing and counters of an obfuscation, and their log emitters """
+
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Iterable, Iterator, Optional
+
+
+# Counters recorded during an obfuscation, with their CloudWatch units
+COUNTERS = {"bytes_in": "Bytes", "bytes_out": "Bytes", "rows": "Count", "pii_cells": "Count"}
+
+
+class Metrics:
+    """
+    Collects the duration of each stage of an obfuscation and its counters.
+
+    Stages can be nested, as they are when the obfuscation pulls data from
+    the source: the duration of a stage excludes the stages run inside it,
+    so the durations of all the stages add up to the time measured.
+
+    The stages recorded by the `Obfuscator` are 'validate' (the HEAD request),
+    'detect' and 'preflight' (the detection and the check of the PII fields,
+    if requested), 'open' (the GET request), 'read' (downloading and
+    decompressing), 'obfuscate' (parsing, replacing and serialising),
+    'compress', 'write' (handing chunks to the sink) and, in batches,
+    'publish' (closing the sink, which completes S3 uploads).
+    The counters are `COUNTERS`.
+
+    Timing is done per chunk rather than per row, and an `Obfuscator` without
+    metrics skips it entirely. Stages can be recorded from several threads; in
+    pipelined mode they overlap, so their durations add up to more than the
+    time measured.
+
+    Example:
+        metrics = Metrics()
+        obfuscator = Obfuscator(json_string, metrics=metrics)
+        obfuscator.obfuscate_to(sink)
+        print(metrics.to_dict())
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Times the block it wraps as the stage `name`. Repeated stages add up.
+
+        Args:
+            name (str): The name of the stage.
+        """
+        stack = getattr(self.__local, "stack", None)
+        if stack is None:
+            stack = self.__local.stack = []
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            with self.__lock:
+                self.durations[name] = self.durations.get(name, 0.0) + elapsed - nested
+            if stack:
+                stack[-1] += elapsed
+
+    def timed(self, iterable: Iterable, name: str) -> Iterator:
+        """
+        Wraps an iterable so the time spent producing each item counts as the stage `name`.
+
+        Args:
+            iterable (Iterable): Typically a generator of chunks.
+            name (str): The name of the stage.
+
+        Yields:
+            The items of the iterable.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def count(self, name: str, value: int) -> None:
+        """
+        Adds a value to a counter.
+
+        Args:
+            name (str): The name of the counter, usually one of `COUNTERS`.
+            value (int): The amount to add.
+        """
+        with self.__lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self) -> dict:
+        """
+        Returns:
+            dict: The counters, and the stage durations in seconds under 'durations'.
+        """
+        return {
+            **self.counters,
+            "durations": {name: round(seconds, 6) for name, seconds in self.durations.items()},
+        }
+
+
+class MeasuredReader:
+    """
+    Binary reader that times the reads of a source and counts their bytes.
+
+    Args:
+        source: Any object with `read(size)` and `close()` methods returning bytes.
+        metrics (Metrics): Where the 'read' stage and the 'bytes_in' counter are recorded.
+    """
+
+    def __init__(self, source, metrics: Metrics):
+        self.__source = source
+        self.__metrics = metrics
+
+    def read(self, size: int = -1) -> bytes:
+        with self.__metrics.stage("read"):
+            data = self.__source.read(size)
+        self.__metrics.count("bytes_in", len(data))
+        return data
+
+    def close(self) -> None:
+        self.__source.close()
+
+
+def stage(metrics: Optional[Metrics], name: str):
+    """
+    Returns the `stage` context manager of `metrics`, or a no-op one if it is None.
+    """
+    return nullcontext() if metrics is None else metrics.stage(name)
+
+
+def emf_document(
+    metrics: Metrics, namespace: str, dimensions: dict, properties: Optional[dict] = None
+) -> dict:
+    """
+    Formats metrics as a CloudWatch Embedded Metric Format log record.
+
+    Printed as one JSON line from a Lambda function, the record is turned into
+    CloudWatch metrics without any API call. Stage durations become
+    '<stage>_time' metrics in milliseconds.
+
+    Args:
+        metrics (Metrics): The metrics of one obfuscation.
+        namespace (str): The CloudWatch namespace of the metrics.
+        dimensions (dict): Dimension names and values, such as the function name.
+        properties (dict, optional): Extra searchable keys, such as the file name.
+
+    Returns:
+        dict: The EMF record.
+    """
+    values = dict(metrics.counters)
+    definitions = [{"Name": name, "Unit": COUNTERS.get(name, "Count")} for name in values]
+    for name, seconds in metrics.durations.items():
+        values[f"{name}_time"] = round(seconds * 1000, 3)
+        definitions.append({"Name": f"{name}_time", "Unit": "Milliseconds"})
+
+    return {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": namespace,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": definitions,
+                }
+            ],
+        },
+        **dimensions,
+        **(properties or {}),
+        **values,
+    }
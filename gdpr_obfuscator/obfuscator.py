@@ -1,16 +1,88 @@
 import json
+import logging
 import os
-import boto3
-import csv
 import io
+import csv
+from itertools import chain
+from typing import Iterator
 from urllib.parse import urlparse
-import argparse
+
+from .cache import request_configs
+from .clients import get_s3_client
+from .compression import (
+    MAGIC_SIZE,
+    BoundedReader,
+    compress_chunks,
+    decompress_head,
+    detect_magic,
+    open_decompressed,
+    split_extension,
+    validate_codec,
+    validate_level,
+)
+from .detection import (
+    DEFAULT_SAMPLE_ROWS,
+    SchemaRegistry,
+    detect_pii_fields,
+    get_schema_registry,
+    sample_csv,
+    sample_jsonl,
+    schema_fingerprint,
+)
+from .engine import DEFAULT_CHUNK_SIZE, obfuscate_csv_stream
+from .jsonl import compile_paths, obfuscate_document, obfuscate_jsonl_stream
+from .metrics import MeasuredReader, Metrics, stage
+from .parquet import RangeReader, obfuscate_parquet_stream, parquet_column_names, parquet_sample
+from .parallel import (
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_RANGE_SIZE,
+    first_record_end,
+    obfuscate_local_file,
+    obfuscate_ranges,
+)
+from .pipeline import DEFAULT_QUEUE_SIZE, PrefetchingReader, write_behind
+from .pseudonymise import Pseudonymiser, get_pseudonymiser
+from .sinks import Sink
+from .transforms import build_transform, parse_transform
+
+
+# Keys of a request that name the files rather than how they are obfuscated
+FILE_KEYS = ("file_to_obfuscate", "output")
+
+# File formats supported, and the extensions they are detected from
+FORMATS = ("csv", "jsonl", "parquet")
+FORMAT_EXTENSIONS = {".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet"}
+
+# What to do with PII fields missing from the file: skip them, log a warning or raise
+MISSING_FIELDS_ACTIONS = ("ignore", "warn", "error")
+
+# Size of the read of the start of a file checked before it is obfuscated
+PREFLIGHT_SIZE = 16 * 1024
+
+# Size of the read of the start of a file sampled to detect its PII fields
+DETECTION_SAMPLE_SIZE = 64 * 1024
+
+# Largest compressed bz2 block, at the default level of 900 KB, with room for its headers
+BZ2_BLOCK_SIZE = 1024 * 1024
+
+# Size of the reads of a Parquet file, which is read in ranges rather than streamed
+PARQUET_BUFFER_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
 
 
 class Obfuscator:
     """ """
 
-    def __init__(self, json_string: str):
+    def __init__(
+        self,
+        json_string: str,
+        s3_client=None,
+        lazy_validation: bool = False,
+        pseudonymiser: Pseudonymiser = None,
+        metrics: Metrics = None,
+        schema_registry: SchemaRegistry = None,
+    ):
         """
         Initializes an instance of the class by parsing the provided JSON string.
 
@@ -22,11 +94,29 @@ class Obfuscator:
             json_string (str): A JSON-formatted string containing the file location
             and optional fields to obfuscate. The string should include the key
             'file_to_obfuscate' and optionally 'pii_fields'.
+            s3_client (optional): A boto3 S3 client used for every S3 request of
+            this instance. Sharing one client between instances reuses its
+            connection pool. The process-wide client of `gdpr_obfuscator.clients`
+            is used if omitted.
+            lazy_validation (bool): If True, S3 files are not checked with a HEAD
+            request here but when they are fetched, so obfuscating a file takes a
+            single S3 request. A missing file then raises the same ValueError
+            from the obfuscation methods instead of from the constructor.
+            pseudonymiser (Pseudonymiser, optional): Produces the tokens of the
+            fields with the 'token' transform. The process-wide pseudonymiser of
+            `gdpr_obfuscator.pseudonymise`, keyed by the `OBFUSCATOR_SECRET`
+            environment variable, is used if omitted.
+            metrics (Metrics, optional): Records the duration of each stage and
+            the bytes, rows and PII cells processed. Nothing is measured if omitted.
+            schema_registry (SchemaRegistry, optional): Remembers the PII fields
+            detected by schema, with 'detect_pii'. The process-wide registry of
+            `gdpr_obfuscator.detection` is used if omitted.
 
         Raises:
             ValueError: If the provided JSON string is empty.
             KeyError: If the 'file_to_obfuscate' key is missing in the JSON string.
             ValueError: If the 'file_to_obfuscate' key is empty in the JSON string.
+            ValueError: If a 'token' transform is requested without a secret key.
         """
 
         # If the json string is empty then a Value error is raised
@@ -34,12 +124,26 @@ class Obfuscator:
             raise ValueError("JSON string cannot be empty")
 
         # Set attributes
+        self.metrics = metrics
+        self.__s3_client = s3_client
+        self.__lazy_validation = lazy_validation
+        self.__s3_head = None
+        self.__local_size = None
         self.__pii_fields = []
-        file_location, fields = self.__get_data(json_string)
-        self.file_to_obfuscate = file_location
+        self.__schema_registry = schema_registry
+        self.__detected = None
+        file_location, fields, self.__file_format, compression, transforms, on_missing, detect = (
+            self.__get_data(json_string)
+        )
+        self.__on_missing_fields = on_missing
+        self.__detect_pii = detect
+        self.__input_compression, self.__output_compression, self.compression_level = compression
+        self.__transforms = self.__get_transforms(transforms, pseudonymiser)
+        with stage(metrics, "validate"):
+            self.file_to_obfuscate = file_location
         self.pii_fields = fields
 
-    def __get_data(self, json_string: str) -> tuple[str, list]:
+    def __get_data(self, json_string: str) -> tuple[str, list, str, tuple, dict, str, bool]:
         """
         Parses a JSON string to extract the file location and optional fields to obfuscate.
 
@@ -50,18 +154,44 @@ class Obfuscator:
         Arguments:
             json_string (str): A JSON-formatted string containing the file path
             and optional fields to obfuscate. The string must include the key
-            'file_to_obfuscate' and optionally 'pii_fields'.
+            'file_to_obfuscate' and optionally 'pii_fields', 'format',
+            'compression', 'output_compression', 'compression_level', 'transforms',
+            'on_missing_fields' and 'detect_pii'. An entry of 'pii_fields' may be an object
+            with the name of the field under 'field' and its transform under
+            'transform', with the options of the transform alongside, such as
+            {"field": "card", "transform": "partial_mask", "keep": 4}.
 
         Returns:
             tuple: A tuple containing:
                 - file_name (str): The value associated with the 'file_to_obfuscate' key.
-                - pii_fields (list): A list of fields to obfuscate, defaults to an empty list
-                if the key 'pii_fields' is missing.
+                - pii_fields (list): The names of the fields to obfuscate, defaults
+                to an empty list if the key 'pii_fields' is missing.
+                - file_format (str): The value of the 'format' key, or the format
+                detected from the extension of the file ('jsonl' for .jsonl and
+                .ndjson files, 'parquet' for .parquet files, 'csv' otherwise).
+                A compression extension such as .gz is ignored for the detection.
+                - compression (tuple): The codec of the input ('auto' to detect it
+                from the extension or the magic bytes), the codec of the output
+                ('auto' for the same as the input) and the compression level.
+                - transforms (dict): The parsed transform of some PII fields, a
+                (name, options) pair by field name. The other PII fields are masked.
+                - on_missing_fields (str): What to do when PII fields are not
+                in the file, one of `MISSING_FIELDS_ACTIONS`. Defaults to 'ignore'.
+                - detect_pii (bool): Whether the PII fields of the file are also
+                detected from a sample of its rows. Defaults to False.
 
         Raises:
             json.JSONDecodeError: If the input string is not a valid JSON.
             KeyError: If the key 'file_to_obfuscate' is missing from the JSON string.
             ValueError: If the 'file_to_obfuscate' key is empty.
+            ValueError: If the 'format' key is not a supported format.
+            ValueError: If a compression key is not a supported codec, or the
+            compression level is not an integer in the range of the codec.
+            ValueError: If an entry of 'pii_fields' is neither a name nor an object with a 'field'.
+            ValueError: If a transform or one of its options is not supported, or
+            names a field that is not in 'pii_fields'.
+            ValueError: If 'on_missing_fields' is not one of `MISSING_FIELDS_ACTIONS`.
+            ValueError: If 'detect_pii' is not a boolean.
         """
         try:
             # Parse the json string for file location and fields to obfuscate
@@ -85,8 +215,154 @@ class Obfuscator:
         if not file_name:
             raise ValueError("The field 'file_to_obfuscate' cannot be empty")
 
-        pii_fields = data.get("pii_fields", [])
-        return file_name, pii_fields
+        # The options do not depend on the file, so warm processes validate them once
+        options = {key: value for key, value in data.items() if key not in FILE_KEYS}
+        pii_fields, transforms, on_missing_fields, detect_pii = request_configs.get_or_create(
+            json.dumps(options, sort_keys=True), lambda: self.__get_options(options)
+        )
+
+        # The extension of the file, without the compression one, gives the defaults
+        path, extension_codec = split_extension(urlparse(file_name).path)
+
+        # An explicit format wins over the extension of the file
+        file_format = data.get("format")
+        if file_format is None:
+            extension = os.path.splitext(path)[1].lower()
+            file_format = FORMAT_EXTENSIONS.get(extension, "csv")
+        if file_format not in FORMATS:
+            raise ValueError(
+                f"The format '{file_format}' is not supported, use one of {', '.join(FORMATS)}"
+            )
+
+        input_compression = data.get("compression", "auto")
+        if input_compression == "auto":
+            input_compression = extension_codec or "auto"
+        else:
+            input_compression = validate_codec(input_compression)
+
+        output_compression = data.get("output_compression", "auto")
+        if output_compression != "auto":
+            output_compression = validate_codec(output_compression)
+
+        # The level applies to the codec of the output, which may be the one of the input
+        level_codec = input_compression if output_compression == "auto" else output_compression
+        compression_level = validate_level(data.get("compression_level"), level_codec)
+        compression = (input_compression, output_compression, compression_level)
+
+        return (
+            file_name,
+            list(pii_fields),
+            file_format,
+            compression,
+            transforms,
+            on_missing_fields,
+            detect_pii,
+        )
+
+    def __get_options(self, options: dict) -> tuple[list, dict, str, bool]:
+        """
+        Validates the options of a request that do not depend on the file to obfuscate.
+
+        Args:
+            options (dict): The request, without 'file_to_obfuscate' and 'output'.
+
+        Returns:
+            tuple: The PII field names, their parsed transforms, the value of
+            'on_missing_fields' and the value of 'detect_pii', as `__get_data`
+            returns them. The result is cached, so it must not be modified.
+
+        Raises:
+            ValueError: If an option is invalid, as described in `__get_data`.
+        """
+        pii_fields = []
+        transforms = {}
+        for pii_field in options.get("pii_fields", []):
+            if isinstance(pii_field, dict):
+                spec = dict(pii_field)
+                name = spec.pop("field", None)
+                if not isinstance(name, str):
+                    raise ValueError("An object in 'pii_fields' must name its field under 'field'")
+                spec["type"] = spec.pop("transform", "mask")
+                transforms[name] = parse_transform(spec)
+                pii_field = name
+            pii_fields.append(pii_field)
+
+        for field, spec in options.get("transforms", {}).items():
+            if field not in pii_fields:
+                raise ValueError(f"The field '{field}' has a transform but is not in 'pii_fields'")
+            transforms[field] = parse_transform(spec)
+
+        on_missing_fields = options.get("on_missing_fields", "ignore")
+        if on_missing_fields not in MISSING_FIELDS_ACTIONS:
+            raise ValueError(
+                f"'on_missing_fields' must be one of {', '.join(MISSING_FIELDS_ACTIONS)}"
+            )
+
+        detect_pii = options.get("detect_pii", False)
+        if not isinstance(detect_pii, bool):
+            raise ValueError("'detect_pii' must be true or false")
+
+        return pii_fields, transforms, on_missing_fields, detect_pii
+
+    def __get_transforms(self, transforms: dict, pseudonymiser: Pseudonymiser) -> dict:
+        """
+        Resolves the transforms of the request to the functions given to the row engines.
+
+        Args:
+            transforms (dict): The parsed transform of some PII fields, by field name.
+            pseudonymiser (Pseudonymiser): The pseudonymiser of the 'token' transform, if any.
+
+        Returns:
+            dict: The function replacing the values of each field that is not
+            masked, by field name.
+
+        Raises:
+            ValueError: If a 'token' transform is requested without a secret key.
+        """
+        if pseudonymiser is None and any(name == "token" for name, _ in transforms.values()):
+            pseudonymiser = get_pseudonymiser()
+
+        functions = {}
+        for field, (name, options) in transforms.items():
+            function = build_transform(name, options, pseudonymiser)
+            if function is not None:
+                functions[field] = function
+        return functions
+
+    @property
+    def file_format(self):
+        return self.__file_format
+
+    @property
+    def input_compression(self):
+        """The codec of the input, None if uncompressed, or 'auto' until it is opened."""
+        return self.__input_compression
+
+    @property
+    def output_compression(self):
+        """The codec of the output, None if uncompressed. Defaults to the codec of the input."""
+        if self.__output_compression == "auto":
+            return None if self.__input_compression == "auto" else self.__input_compression
+        return self.__output_compression
+
+    @property
+    def source_state(self) -> dict:
+        """
+        The 'etag' and 'size' of the file to obfuscate.
+
+        For S3 files they come from the HEAD response of the validation, which
+        is requested here with lazy validation, and every later read is pinned
+        to that version. Local files get an ETag made of their modification
+        time and size, and are then only read up to that size, so records
+        appended meanwhile are left to the next run.
+        """
+        if self.file_to_obfuscate.startswith("s3://"):
+            head = self.__get_s3_head()
+            return {"etag": head["ETag"], "size": head["ContentLength"]}
+
+        stat = os.stat(self.file_to_obfuscate)
+        self.__local_size = stat.st_size
+        return {"etag": f"{stat.st_mtime_ns:x}-{stat.st_size:x}", "size": stat.st_size}
 
     @property
     def pii_fields(self):
@@ -107,6 +383,7 @@ class Obfuscator:
 
         This method validates whether the provided file name is a valid file and checks if it exists in a S3 bucket.
         If the file is invalid or does not exist, it raises a `ValueError` with a descriptive error message.
+        With lazy validation, S3 files are only checked when they are fetched.
 
         Args:
             file_name (str): The name or S3 URI of the file to be obfuscated.
@@ -122,6 +399,14 @@ class Obfuscator:
             obfuscator.file_to_obfuscate(file_name)
         """
 
+        self.__s3_head = None
+        self.__local_size = None
+
+        # The existence of S3 files is checked by the GET itself in lazy mode
+        if self.__lazy_validation and file_name.startswith("s3://"):
+            self.__file_to_obfuscate = file_name
+            return
+
         # If not a valid file, raise an error
         if not self.__is_valid_file(file_name):
             raise ValueError(
@@ -163,21 +448,35 @@ class Obfuscator:
         """
         Validates if a given S3 URL points to an existing file in an AWS S3 bucket.
 
+        The response of the HEAD request is kept, so the fetch can be pinned to
+        the version that was validated and the parallel mode can reuse its size.
+
         Args:
             s3_url (str): The URL of the file (key) in the S3 bucket, typically in the format 's3://bucket-name/key'.
 
         Returns:
             bool: True if the file exists and is accessible in the specified S3 bucket, otherwise False.
         """
-        s3 = boto3.client("s3")
+        s3 = self.__get_s3_client()
         bucket_name, key = self.__get_bucket_name_and_key(s3_url)
 
         try:
-            s3.head_object(Bucket=bucket_name, Key=key)
+            self.__s3_head = s3.head_object(Bucket=bucket_name, Key=key)
             return True
         except s3.exceptions.ClientError:
             return False
 
+    def __get_s3_client(self):
+        """
+        Returns the S3 client of this instance, creating it on first use.
+
+        Returns:
+            The boto3 S3 client given to the constructor, or the process-wide one.
+        """
+        if self.__s3_client is None:
+            self.__s3_client = get_s3_client()
+        return self.__s3_client
+
     def __get_bucket_name_and_key(self, s3_url: str) -> tuple[str, str]:
         """
         Extracts the bucket name and key from an S3 URL.
@@ -199,86 +498,685 @@ class Obfuscator:
         key = parsed_url.path.lstrip("/")
         return bucket_name, key
 
-    def obfuscate(self) -> io.StringIO:
+    def __get_object(self, **kwargs) -> dict:
         """
-        Obfuscates the PII fields in a CSV file.
-        Each PII field will be replaced with '***'.
+        Fetches the S3 file to obfuscate, pinned to the validated version if any.
+
+        If the file was validated with a HEAD request, the GET carries its ETag
+        in `IfMatch` (and its version id, on versioned buckets), so the content
+        obfuscated is exactly the one that was validated.
+
+        Args:
+            **kwargs: Extra arguments for `get_object`, such as `Range`.
 
         Returns:
-            A byte-stream representation of the obfuscated file.
+            dict: The `get_object` response.
+
+        Raises:
+            ValueError: If the file does not exist, is not accessible or has
+            changed since it was validated.
+        """
+        s3 = self.__get_s3_client()
+        bucket_name, file_name = self.__get_bucket_name_and_key(self.file_to_obfuscate)
+
+        if self.__s3_head is not None:
+            kwargs["IfMatch"] = self.__s3_head["ETag"]
+            if "VersionId" in self.__s3_head:
+                kwargs["VersionId"] = self.__s3_head["VersionId"]
+
+        try:
+            return s3.get_object(Bucket=bucket_name, Key=file_name, **kwargs)
+        except s3.exceptions.ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code == "PreconditionFailed":
+                raise ValueError(
+                    f"The file '{self.file_to_obfuscate}' has changed since it was validated"
+                ) from e
+            if code == "InvalidRange":
+                raise ValueError(f"The file '{self.file_to_obfuscate}' is empty") from e
+            if code in ("NoSuchKey", "NoSuchBucket", "NoSuchVersion", "AccessDenied", "404", "403"):
+                raise ValueError(
+                    f"The file '{self.file_to_obfuscate}' does not exist or is not a valid file"
+                ) from e
+            raise
+
+    def __get_s3_head(self) -> dict:
+        """
+        Returns the HEAD response of the S3 file, requesting it if it was not validated.
+
+        Returns:
+            dict: The `head_object` response.
+
+        Raises:
+            ValueError: If the file does not exist or is not accessible.
+        """
+        if self.__s3_head is None and not self.__is_valid_s3_file(self.file_to_obfuscate):
+            raise ValueError(
+                f"The file '{self.file_to_obfuscate}' does not exist or is not a valid file"
+            )
+        return self.__s3_head
+
+    def __open_source(self):
+        """
+        Opens the file to obfuscate as a decompressed binary stream.
+
+        Compressed files are decompressed incrementally as they are read. When
+        the compression is not known from the request or the extension, it is
+        detected from the magic bytes, and recorded in `input_compression`.
+
+        Returns:
+            A reader of the S3 `StreamingBody` of the object for S3 URLs, or of
+            the local file otherwise. The caller is responsible for closing it.
+        """
+        with stage(self.metrics, "open"):
+            if self.file_to_obfuscate.startswith("s3://"):
+                source = self.__get_object()["Body"]
+            else:
+                source = self.__open_local_file()
+
+        # Reads are measured before decompression, so 'bytes_in' is the size of the file
+        if self.metrics is not None:
+            source = MeasuredReader(source, self.metrics)
+
+        if self.__input_compression is None:
+            return source
+
+        codec = None if self.__input_compression == "auto" else self.__input_compression
+        source, self.__input_compression = open_decompressed(source, codec)
+        return source
+
+    def __open_local_file(self, offset: int = 0):
+        """
+        Opens the local file to obfuscate from an offset, up to the size recorded
+        by `source_state` if it was requested.
+
+        Returns:
+            A binary reader. The caller is responsible for closing it.
+        """
+        source = open(self.file_to_obfuscate, "rb")
+        source.seek(offset)
+        if self.__local_size is None:
+            return source
+        return BoundedReader(source, self.__local_size - offset)
+
+    def __read_range(self, start: int, end: int) -> bytes:
         """
-        s3 = boto3.client("s3")
+        Downloads a byte range of the S3 file, pinned to the validated version.
+
+        Args:
+            start (int): The offset of the first byte.
+            end (int): The offset of the last byte, included.
+
+        Returns:
+            bytes: The content of the range.
+        """
+        with stage(self.metrics, "read"):
+            data = self.__get_object(Range=f"bytes={start}-{end}")["Body"].read()
+        if self.metrics is not None:
+            self.metrics.count("bytes_in", len(data))
+        return data
+
+    def read_range(self, start: int, end: int) -> bytes:
+        """
+        Reads a byte range of the raw file to obfuscate, without decompressing it.
+
+        S3 ranges are pinned to the validated version of the file.
 
+        Args:
+            start (int): The offset of the first byte.
+            end (int): The offset of the last byte, included.
+
+        Returns:
+            bytes: The content of the range.
+        """
         if self.file_to_obfuscate.startswith("s3://"):
-            bucket_name, file_name = self.__get_bucket_name_and_key(self.file_to_obfuscate)
-            file_obj = s3.get_object(Bucket=bucket_name,Key=file_name)
-            file_content = file_obj["Body"].read().decode("utf-8")
-            file = io.StringIO(file_content)
+            return self.__read_range(start, end)
+
+        with open(self.file_to_obfuscate, "rb") as source:
+            source.seek(start)
+            return source.read(end - start + 1)
+
+    def find_missing_fields(self, head_size: int = PREFLIGHT_SIZE) -> list:
+        """
+        Checks which PII fields are not in the file, reading only its start.
+
+        A single ranged read of `head_size` bytes (a `Range` GET for S3 files)
+        gets the CSV header, or the first records of a JSON Lines file, which
+        are decompressed first if needed. Only the footer of a Parquet file is read.
+        A JSON Lines field counts as missing if none of those first records has it.
+
+        Args:
+            head_size (int): Number of bytes read from the start of the file.
+
+        Returns:
+            list: The PII fields missing from the file, in the order of `pii_fields`.
+
+        Raises:
+            ValueError: If the header is malformed, is not complete within
+            `head_size` bytes, or the first record is not valid JSON.
+        """
+        if self.file_format == "parquet":
+            with self.__open_seekable_source() as source:
+                names = parquet_column_names(source)
+            return [field for field in self.pii_fields if field not in names]
+
+        head, complete = self.__read_head(head_size)
+        if self.file_format == "jsonl":
+            return self.__find_missing_keys(head, complete)
+
+        fieldnames = self.__parse_header(head, complete, head_size)
+        return [field for field in self.pii_fields if field not in fieldnames]
+
+    def __read_head(self, head_size: int) -> tuple[bytes, bool]:
+        """
+        Reads the start of the file with a single ranged read, decompressed if needed.
+
+        The head of a compressed file is `head_size` decompressed bytes. As bz2
+        only decompresses whole blocks, the read of a bz2 file is extended to
+        the largest size of a compressed block.
+
+        Args:
+            head_size (int): Number of bytes read from the start of the file.
+
+        Returns:
+            tuple: The decompressed bytes, and True if they are the whole file.
+        """
+        head = self.read_range(0, head_size - 1)
+        complete = len(head) < head_size
+
+        codec = self.__input_compression
+        if codec == "auto":
+            codec = detect_magic(head[:MAGIC_SIZE])
+        if codec is None:
+            return head, complete
+
+        if codec == "bz2" and not complete and head_size < BZ2_BLOCK_SIZE:
+            head += self.read_range(head_size, BZ2_BLOCK_SIZE - 1)
+            complete = len(head) < BZ2_BLOCK_SIZE
+        head = decompress_head(head, codec, head_size)
+        return head, complete and len(head) < head_size
+
+    def __parse_header(self, head: bytes, complete: bool, head_size: int) -> list:
+        """
+        Parses the header of a CSV file from the start of the file.
+
+        Raises:
+            ValueError: If the header is malformed or not complete within `head_size` bytes.
+        """
+        end = first_record_end(head)
+        if end is None and not complete:
+            raise ValueError(
+                f"The header of '{self.file_to_obfuscate}' is not within its first {head_size} bytes"
+            )
+        try:
+            header = head[: end or len(head)].decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise ValueError(f"The header of '{self.file_to_obfuscate}' is not valid UTF-8") from e
+
+        fieldnames = next(csv.reader([header]), None)
+        if not fieldnames or not any(fieldnames):
+            raise ValueError(f"The file '{self.file_to_obfuscate}' has no header")
+        return fieldnames
+
+    def detect_pii_fields(
+        self, sample_rows: int = DEFAULT_SAMPLE_ROWS, head_size: int = DETECTION_SAMPLE_SIZE
+    ) -> dict:
+        """
+        Detects the PII fields of the file from a sample of its first rows.
+
+        A single ranged read of `head_size` bytes gets the CSV header and at
+        most `sample_rows` rows (or JSON Lines documents). Only the footer and
+        the first batch of string values are read from a Parquet file. Each
+        field is checked by its name (such as 'surname' or 'dob') and by the
+        shape of its values (emails, phone numbers, UK postcodes and National
+        Insurance numbers), see `gdpr_obfuscator.detection`.
+
+        The result is remembered in the schema registry under the fingerprint of
+        the field names, and files with the same CSV header or Parquet columns
+        then skip the sampling and the detection. Samples without any value,
+        such as a header-only file, are not remembered.
+
+        Args:
+            sample_rows (int): Maximum number of rows sampled.
+            head_size (int): Number of bytes read from the start of a CSV or JSON Lines file.
+
+        Returns:
+            dict: The kind of PII of each detected field, such as 'email' or
+            'header:name', by field name in file order.
+
+        Raises:
+            ValueError: If the CSV header is malformed or not complete within
+            `head_size` bytes, or a sampled line is not valid JSON.
+        """
+        registry = self.__schema_registry
+        if registry is None:
+            registry = get_schema_registry()
+
+        if self.file_format == "parquet":
+            with self.__open_seekable_source() as source:
+                fingerprint = schema_fingerprint("parquet", parquet_column_names(source))
+                detected = registry.get(fingerprint)
+                if detected is None:
+                    columns = parquet_sample(source, sample_rows)
+            fieldnames = None
         else:
-            file = open(self.file_to_obfuscate, "r")
+            head, complete = self.__read_head(head_size)
+            if self.file_format == "jsonl":
+                # The keys of a JSON Lines file are only known from its documents
+                try:
+                    columns = sample_jsonl(head, complete, sample_rows)
+                except ValueError as e:
+                    raise ValueError(
+                        f"The file '{self.file_to_obfuscate}' does not start with JSON records"
+                    ) from e
+                fieldnames = list(columns)
+            else:
+                fieldnames = self.__parse_header(head, complete, head_size)
+            fingerprint = schema_fingerprint(self.file_format, fieldnames)
+            detected = registry.get(fingerprint)
+            if detected is None and self.file_format == "csv":
+                columns = sample_csv(head, complete, sample_rows)
 
-        # Create a byte stream
-        byte_stream = io.StringIO()
+        if detected is None:
+            detected = detect_pii_fields(columns)
+            # A sample without rows only checked the names, so later files are sampled again
+            if any(columns.values()):
+                registry.put(fingerprint, fieldnames or list(columns), detected)
+        return detected
 
-        reader = csv.DictReader(file)
-        rows = list(reader)
-        fieldnames = reader.fieldnames
+    def __detect_fields(self) -> None:
+        """
+        Adds the detected PII fields to `pii_fields` if 'detect_pii' asks for it.
 
-        # Process the rows and obfuscate PII fields
-        for row in rows:
-            for pii_field in self.pii_fields:
-                if pii_field in row:
-                    row[pii_field] = "***"
+        The detection runs once per instance. Detected fields are masked,
+        unless the request gives them a transform.
+        """
+        if not self.__detect_pii or self.__detected is not None:
+            return
 
-        # Writing the obfuscated data to the byte-stream
-        writer = csv.DictWriter(byte_stream, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
+        with stage(self.metrics, "detect"):
+            self.__detected = self.detect_pii_fields()
 
-        # Reset the pointer to the beginning of the byte stream
-        byte_stream.seek(0)
+        added = [field for field in self.__detected if field not in self.pii_fields]
+        if added:
+            logger.info(
+                "Detected PII fields %s in '%s'", ", ".join(added), self.file_to_obfuscate
+            )
+            self.pii_fields = self.pii_fields + added
 
-        if not isinstance(file, io.StringIO):
-            file.close()
+    def __find_missing_keys(self, head: bytes, complete: bool) -> list:
+        """
+        Lists the PII fields that none of the records at the start of a JSON Lines file has.
 
-        # Return the byte stream directly (no encoding needed)
-        return byte_stream
+        Args:
+            head (bytes): The decompressed start of the file.
+            complete (bool): True if `head` is the whole file, so its last line is complete.
+        """
+        lines = head.split(b"\n")
+        if not complete:
+            lines = lines[:-1]
+
+        found = set()
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                document = json.loads(line)
+            except ValueError as e:
+                raise ValueError(
+                    f"The file '{self.file_to_obfuscate}' does not start with JSON records"
+                ) from e
+            # Masking the parsed record, which is then dropped, tells whether the path reaches a value
+            for field, path in zip(self.pii_fields, compile_paths(self.pii_fields)):
+                if field not in found and obfuscate_document(document, [path]):
+                    found.add(field)
+
+        return [field for field in self.pii_fields if field not in found]
+
+    def __check_fields(self) -> None:
+        """
+        Runs the pre-flight detection and check of the PII fields, if the request asks for them.
+
+        Raises:
+            ValueError: If PII fields are missing and 'on_missing_fields' is 'error'.
+        """
+        self.__detect_fields()
+        if self.__on_missing_fields == "ignore" or not self.pii_fields:
+            return
+
+        with stage(self.metrics, "preflight"):
+            missing = self.find_missing_fields()
+        if not missing:
+            return
+
+        message = f"The file '{self.file_to_obfuscate}' has no field {', '.join(missing)}"
+        if self.__on_missing_fields == "error":
+            raise ValueError(message)
+        logger.warning(message)
+
+    def __open_seekable_source(self):
+        """
+        Opens the file to obfuscate as a seekable binary file, as Parquet readers need.
+
+        S3 files are read through ranged GETs pinned to the validated version,
+        so only the footer and the column chunks that are read are downloaded.
+
+        Returns:
+            A seekable binary file. The caller is responsible for closing it.
+        """
+        if self.file_to_obfuscate.startswith("s3://"):
+            size = self.__get_s3_head()["ContentLength"]
+            return io.BufferedReader(RangeReader(self.__read_range, size), PARQUET_BUFFER_SIZE)
+
+        return open(self.file_to_obfuscate, "rb")
+
+    def __obfuscated_chunks(self, chunk_size: int, prefetch: int = 0) -> Iterator[bytes]:
+        """
+        Reads, obfuscates and serialises the file one block at a time.
+
+        Args:
+            chunk_size (int): Approximate size of each emitted chunk.
+            prefetch (int): Number of CSV or JSON Lines blocks read ahead in a
+                background thread, none if 0.
+
+        Yields:
+            bytes: Consecutive pieces of the obfuscated file. CSV and JSON Lines
+            chunks end on a row boundary.
+        """
+        self.__check_fields()
+
+        if self.file_format == "parquet":
+            if self.__input_compression not in ("auto", None):
+                raise ValueError("Compressed Parquet files are not supported")
+            self.__input_compression = None
+
+            with self.__open_seekable_source() as source:
+                yield from obfuscate_parquet_stream(
+                    source, self.pii_fields, self.__transforms, self.metrics
+                )
+            return
+
+        source = self.__open_source()
+        if prefetch:
+            source = PrefetchingReader(source, chunk_size, prefetch)
+
+        try:
+            if self.file_format == "jsonl":
+                yield from obfuscate_jsonl_stream(
+                    source, self.pii_fields, chunk_size, self.__transforms, self.metrics
+                )
+            else:
+                yield from obfuscate_csv_stream(
+                    source,
+                    self.pii_fields,
+                    chunk_size,
+                    transforms=self.__transforms,
+                    metrics=self.metrics,
+                )
+        finally:
+            source.close()
+
+    def obfuscate_stream(
+        self, chunk_size: int = DEFAULT_CHUNK_SIZE, prefetch: int = 0
+    ) -> Iterator[bytes]:
+        """
+        Obfuscates the PII fields in a CSV, JSON Lines or Parquet file as a stream of encoded chunks.
+        Each PII field will be replaced with '***', or with a keyed token if its transform is 'token'.
+
+        The source is read incrementally, so peak memory stays roughly constant
+        whatever the size of the file. Nothing is read until the iterator is consumed.
+        Files without quoted fields are rewritten at byte level without being decoded.
+        Compressed inputs are decompressed on the fly, and the output is compressed
+        with `output_compression` (by default the codec of the input).
+
+        Args:
+            chunk_size (int): Approximate size in bytes of the blocks read from
+                the source and of the emitted chunks.
+            prefetch (int): If set, this many blocks of a CSV or JSON Lines file
+                are downloaded and decompressed ahead in a background thread,
+                while the current one is obfuscated.
 
+        Yields:
+            bytes: Pieces of the obfuscated file. Uncompressed text chunks end on a row boundary.
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Obfuscate PII fields in a CSV file using the Obfuscator class."
-    )
-    parser.add_argument(
-        "json_string",
-        type=str,
-        help="JSON string containing 'file_to_obfuscate' and optional 'pii_fields'.",
-    )
-    parser.add_argument(
-        "--output",
-        type=str,
-        default=None,
-        help="Optional path to save the obfuscated file. Defaults to stdout.",
-    )
-
-    args = parser.parse_args()
-
-    try:
-        # Create an instance of Obfuscator and process the file
-        obfuscator = Obfuscator(args.json_string)
-        obfuscated_file = obfuscator.obfuscate()
-
-        # Save to file or print to stdout
-        if args.output:
-            with open(args.output, "w") as out_file:
-                out_file.write(obfuscated_file.getvalue())
-            print(f"Obfuscated file saved to {args.output}")
+        Example:
+            with open("obfuscated.csv", "wb") as out_file:
+                for chunk in obfuscator.obfuscate_stream():
+                    out_file.write(chunk)
+        """
+        chunks = self.__obfuscated_chunks(chunk_size, prefetch)
+        if self.metrics is not None:
+            chunks = self.metrics.timed(chunks, "obfuscate")
+
+        # Opening the source detects its compression, the default of the output
+        first_chunk = next(chunks, b"")
+        chunks = compress_chunks(
+            chain([first_chunk], chunks), self.output_compression, self.compression_level
+        )
+        if self.metrics is None:
+            yield from chunks
+            return
+
+        if self.output_compression is not None:
+            chunks = self.metrics.timed(chunks, "compress")
+        for chunk in chunks:
+            self.metrics.count("bytes_out", len(chunk))
+            yield chunk
+
+    def obfuscate_appended(
+        self, offset: int, fieldnames: list = None, chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """
+        Obfuscates the records of an append-only file from a byte offset onwards.
+
+        Only that end of the file is read, with a `Range` GET for S3 files. The
+        output has no CSV header and can be added at the end of the output of a
+        previous run, compressed as a new member if `output_compression` is set.
+
+        Args:
+            offset (int): The offset of the first record to obfuscate, just after a newline.
+            fieldnames (list, optional): The header of a CSV file, read at the previous run.
+            chunk_size (int): Approximate size in bytes of the emitted chunks.
+
+        Yields:
+            bytes: Pieces of the obfuscated records.
+
+        Raises:
+            ValueError: If the file is compressed or in Parquet format, or the
+            header of a CSV file is missing.
+        """
+        if self.file_format == "parquet":
+            raise ValueError("Parquet files cannot be obfuscated from an offset")
+        if self.__input_compression not in ("auto", None):
+            raise ValueError("Compressed files cannot be obfuscated from an offset")
+        if self.file_format == "csv" and fieldnames is None:
+            raise ValueError("The header of the file is needed to obfuscate a CSV file from an offset")
+        self.__detect_fields()
+        self.__input_compression = None
+
+        with stage(self.metrics, "open"):
+            if self.file_to_obfuscate.startswith("s3://"):
+                source = self.__get_object(Range=f"bytes={offset}-")["Body"]
+            else:
+                source = self.__open_local_file(offset)
+        if self.metrics is not None:
+            source = MeasuredReader(source, self.metrics)
+
+        try:
+            if self.file_format == "jsonl":
+                chunks = obfuscate_jsonl_stream(
+                    source, self.pii_fields, chunk_size, self.__transforms, self.metrics
+                )
+            else:
+                chunks = obfuscate_csv_stream(
+                    source,
+                    self.pii_fields,
+                    chunk_size,
+                    transforms=self.__transforms,
+                    metrics=self.metrics,
+                    fieldnames=fieldnames,
+                )
+            if self.metrics is not None:
+                chunks = self.metrics.timed(chunks, "obfuscate")
+
+            for chunk in compress_chunks(chunks, self.output_compression, self.compression_level):
+                if self.metrics is not None:
+                    self.metrics.count("bytes_out", len(chunk))
+                yield chunk
+        finally:
+            source.close()
+
+    def obfuscate_parallel(
+        self,
+        max_workers: int = None,
+        range_size: int = DEFAULT_RANGE_SIZE,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    ) -> Iterator[bytes]:
+        """
+        Obfuscates the PII fields of a large CSV file using several cores.
+
+        An S3 object is downloaded as concurrent `Range` GETs, every range is cut on
+        a record boundary (newlines inside quoted fields are respected) and the
+        records are obfuscated in a process pool. All range requests are pinned
+        to the ETag of the object with `IfMatch`, so the file cannot change while
+        it is being read. A local file is memory-mapped instead, and every
+        worker reads its record-aligned range from its own mapping.
+        The output is reassembled in order behind a single header row and
+        matches `obfuscate_stream`, compressed with `output_compression` if set.
+
+        Args:
+            max_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+            range_size (int): Size in bytes of each range given to a worker.
+            max_connections (int): Maximum number of S3 ranges downloaded at the same time.
+
+        Yields:
+            bytes: UTF-8 encoded pieces of the obfuscated file, in order.
+
+        Raises:
+            ValueError: If the file to obfuscate is not an uncompressed CSV file.
+        """
+        if self.file_format != "csv":
+            raise ValueError("Parallel mode is only available for CSV files")
+        if self.__input_compression not in ("auto", None):
+            raise ValueError("Parallel mode is not available for compressed files")
+        self.__check_fields()
+
+        if self.file_to_obfuscate.startswith("s3://"):
+            # The HEAD of the validation is reused, and pins every range to the same version
+            head = self.__get_s3_head()
+
+            chunks = obfuscate_ranges(
+                self.__read_range,
+                head["ContentLength"],
+                self.pii_fields,
+                max_workers=max_workers,
+                range_size=range_size,
+                max_connections=max_connections,
+                transforms=self.__transforms,
+            )
         else:
-            print(obfuscated_file.getvalue())
+            # Compression is only known from the extension, magic bytes are checked here
+            with open(self.file_to_obfuscate, "rb") as source:
+                if detect_magic(source.read(MAGIC_SIZE)) is not None:
+                    raise ValueError("Parallel mode is not available for compressed files")
+
+            if self.metrics is not None:
+                self.metrics.count("bytes_in", os.path.getsize(self.file_to_obfuscate))
+            chunks = obfuscate_local_file(
+                self.file_to_obfuscate,
+                self.pii_fields,
+                max_workers=max_workers,
+                range_size=range_size,
+                transforms=self.__transforms,
+            )
+        if self.metrics is not None:
+            chunks = self.metrics.timed(chunks, "obfuscate")
+        chunks = compress_chunks(chunks, self.output_compression, self.compression_level)
+
+        for chunk in chunks:
+            if self.metrics is not None:
+                self.metrics.count("bytes_out", len(chunk))
+            yield chunk
+
+    def obfuscate_to(
+        self, sink: Sink, chunk_size: int = DEFAULT_CHUNK_SIZE, pipelined: bool = False
+    ) -> int:
+        """
+        Obfuscates the PII fields in a CSV, JSON Lines or Parquet file and writes the result to a sink.
+
+        The output is written chunk by chunk as it is produced. The sink is not
+        closed, so it should normally be used as a context manager by the caller.
+
+        In pipelined mode the download, the obfuscation and the writes run in
+        three threads linked by bounded queues: the next blocks are downloaded
+        while the current one is obfuscated, and the previous chunks are written
+        meanwhile. The time taken approaches that of the slowest stage rather
+        than the sum of all three, and at most `DEFAULT_QUEUE_SIZE` chunks wait
+        between two stages, so memory stays bounded.
+
+        Args:
+            sink (Sink): The destination of the obfuscated file.
+            chunk_size (int): Approximate size in bytes of each chunk written to the sink.
+            pipelined (bool): If True, overlaps the reads, the obfuscation and the writes.
+
+        Returns:
+            int: The number of bytes written to the sink.
+
+        Example:
+            with S3MultipartSink("my-bucket", "obfuscated/file.csv") as sink:
+                obfuscator.obfuscate_to(sink)
+        """
+        if pipelined:
+
+            def write(chunk: bytes) -> None:
+                with stage(self.metrics, "write"):
+                    sink.write(chunk)
+
+            chunks = self.obfuscate_stream(chunk_size, prefetch=DEFAULT_QUEUE_SIZE)
+            return write_behind(chunks, write, DEFAULT_QUEUE_SIZE)
+
+        written = 0
+        for chunk in self.obfuscate_stream(chunk_size):
+            with stage(self.metrics, "write"):
+                sink.write(chunk)
+            written += len(chunk)
+        return written
+
+    def obfuscate(self) -> io.StringIO:
+        """
+        Obfuscates the PII fields in a CSV or JSON Lines file.
+        Each PII field will be replaced with '***'.
 
-    except Exception as e:
-        print(f"Error: {e}")
+        The whole result is kept in memory; use `obfuscate_stream` for large files.
+        Compressed inputs are decompressed, and the result is never compressed.
 
-if __name__ == "__main__":
-    main()
+        Returns:
+            A byte-stream representation of the obfuscated file.
 
+        Raises:
+            ValueError: For Parquet files, which are binary: use `obfuscate_stream`
+            or `obfuscate_to` instead.
+        """
+        if self.file_format == "parquet":
+            raise ValueError(
+                "Parquet files are binary, use obfuscate_stream or obfuscate_to instead"
+            )
+
+        # Create a byte stream
+        byte_stream = io.StringIO()
+
+        chunks = self.__obfuscated_chunks(DEFAULT_CHUNK_SIZE)
+        if self.metrics is not None:
+            chunks = self.metrics.timed(chunks, "obfuscate")
+
+        # Every chunk ends on a row boundary, so it can be decoded on its own
+        for chunk in chunks:
+            if self.metrics is not None:
+                self.metrics.count("bytes_out", len(chunk))
+            byte_stream.write(chunk.decode("utf-8"))
+
+        # Reset the pointer to the beginning of the byte stream
+        byte_stream.seek(0)
+
+        # Return the byte stream directly (no encoding needed)
+        return byte_stream
@@ -0,0 +1,375 @@
+""" Parallel obfuscation of large files read as independent byte ranges """
+
+import csv
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+
+from .engine import compile_plan, format_header, obfuscate_csv_chunk
+
+
+DEFAULT_RANGE_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_CONNECTIONS = 8
+
+QUOTE = b'"'
+NEWLINE = b"\n"
+
+
+def first_record_end(data: bytes) -> Optional[int]:
+    """
+    Finds the end of the first record of a block that starts on a record boundary.
+
+    A newline only ends a record if it is not inside a quoted field, which is
+    the case when an even number of quote characters precede it. Escaped quotes
+    are written twice in CSV, so they never change that parity.
+
+    Args:
+        data (bytes): CSV data starting at the beginning of a record.
+
+    Returns:
+        int: The offset just after the newline ending the first record, or None
+        if the block does not contain a complete record.
+    """
+    quotes = 0
+    start = 0
+    position = data.find(NEWLINE)
+
+    while position != -1:
+        quotes += data.count(QUOTE, start, position)
+        if quotes % 2 == 0:
+            return position + 1
+        start = position
+        position = data.find(NEWLINE, position + 1)
+
+    return None
+
+
+def split_complete_records(data: bytes) -> tuple[bytes, bytes]:
+    """
+    Splits a block into its complete records and the unfinished record after them.
+
+    The block is scanned backwards from its last newline, so only the tail of
+    the block is inspected in the common case. Quote handling follows the same
+    parity rule as `first_record_end`.
+
+    Args:
+        data (bytes): CSV data starting at the beginning of a record.
+
+    Returns:
+        tuple: A tuple containing:
+            - records (bytes): The complete records, possibly empty.
+            - rest (bytes): The bytes after the last complete record.
+    """
+    total_quotes = data.count(QUOTE)
+    tail_quotes = 0
+    end = len(data)
+    position = data.rfind(NEWLINE)
+
+    while position != -1:
+        tail_quotes += data.count(QUOTE, position, end)
+        if (total_quotes - tail_quotes) % 2 == 0:
+            return data[: position + 1], data[position + 1 :]
+        end = position
+        position = data.rfind(NEWLINE, 0, position)
+
+    return b"", data
+
+
+def _count_quotes(data, start: int, end: int) -> int:
+    """
+    Counts the quote characters between two offsets of bytes or of a memory map.
+
+    Memory maps have no `count`, so the range is only copied when it holds a quote.
+    """
+    if data.find(QUOTE, start, end) == -1:
+        return 0
+    return data[start:end].count(QUOTE)
+
+
+def iter_record_ranges(data, start: int, range_size: int) -> Iterator[tuple[int, int]]:
+    """
+    Cuts CSV data into ranges of about `range_size` bytes that end on record boundaries.
+
+    Each range is extended up to the first newline after its nominal end
+    that is not inside a quoted field, using the parity rule of
+    `first_record_end`. The quotes of every range are counted, but ranges
+    without quotes are never copied.
+
+    Args:
+        data: The whole file, as bytes or as a memory map.
+        start (int): The offset of the first record, just after the header.
+        range_size (int): The nominal size of each range in bytes.
+
+    Yields:
+        tuple: The start and end offsets of each range, end excluded, in file order.
+    """
+    size = len(data)
+
+    while start < size:
+        end = min(start + range_size, size)
+        quotes = _count_quotes(data, start, end)
+        position = end
+        newline = data.find(NEWLINE, end) if end < size else -1
+
+        while newline != -1:
+            quotes += _count_quotes(data, position, newline)
+            if quotes % 2 == 0:
+                break
+            position = newline
+            newline = data.find(NEWLINE, newline + 1)
+
+        # Without a record boundary after the nominal end, the range goes to the end of the file
+        end = size if newline == -1 else newline + 1
+        yield start, end
+        start = end
+
+
+def read_header(data) -> tuple[Optional[list], int]:
+    """
+    Parses the header of CSV data.
+
+    Args:
+        data: The whole file, as bytes or as a memory map.
+
+    Returns:
+        tuple: A tuple containing:
+            - fieldnames (list): The column names, or None for an empty file.
+            - end (int): The offset of the first data record.
+    """
+    length = 64 * 1024
+    while True:
+        head = data[:length]
+        end = first_record_end(head)
+        if end is None and length < len(data):
+            length *= 2
+            continue
+
+        end = len(head) if end is None else end
+        fieldnames = next(csv.reader([head[:end].decode("utf-8")]), None)
+        return fieldnames, end
+
+
+def obfuscate_file_range(
+    path: str,
+    start: int,
+    end: int,
+    fieldnames: list,
+    pii_fields: list,
+    transforms: Optional[dict] = None,
+) -> bytes:
+    """
+    Obfuscates the records between two offsets of a local file, in a worker process.
+
+    The worker maps the file itself, so only the offsets are sent to it and
+    the records are read from the page cache shared with the other workers.
+
+    Args:
+        path (str): The path of the file.
+        start (int): The offset of the first record of the range.
+        end (int): The offset just after the last record of the range.
+        fieldnames (list): The header of the file.
+        pii_fields (list): Names of the columns to obfuscate.
+        transforms (dict, optional): Picklable functions used instead of the mask, by column name.
+
+    Returns:
+        bytes: The UTF-8 encoded obfuscated records.
+    """
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return obfuscate_csv_chunk(data[start:end], fieldnames, pii_fields, transforms)
+
+
+def process_pool(max_workers: int):
+    """
+    Creates the worker process pool of the parallel modes.
+
+    Ranges are downloaded by threads, and forking a multi-threaded process can
+    deadlock, so workers are started from a fork server where available.
+    multiprocessing is only imported here, as the Lambda function never uses it.
+
+    Args:
+        max_workers (int): Number of worker processes.
+
+    Returns:
+        ProcessPoolExecutor: A new, empty process pool.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+
+def _iter_ranges(
+    read_range: Callable[[int, int], bytes],
+    size: int,
+    range_size: int,
+    max_connections: int,
+) -> Iterator[bytes]:
+    """
+    Downloads consecutive byte ranges concurrently and yields them in order.
+
+    At most `max_connections` ranges are requested ahead of the consumer,
+    which bounds both the number of connections and the memory in use.
+
+    Args:
+        read_range (Callable): Function returning the bytes between two inclusive offsets.
+        size (int): Total size of the source in bytes.
+        range_size (int): Size of each range in bytes.
+        max_connections (int): Maximum number of ranges downloaded at the same time.
+
+    Yields:
+        bytes: The content of each range, in file order.
+    """
+    with ThreadPoolExecutor(max_workers=max_connections) as pool:
+        pending = deque()
+
+        for start in range(0, size, range_size):
+            end = min(start + range_size, size) - 1
+            pending.append(pool.submit(read_range, start, end))
+
+            if len(pending) >= max_connections:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def obfuscate_ranges(
+    read_range: Callable[[int, int], bytes],
+    size: int,
+    pii_fields: list,
+    max_workers: Optional[int] = None,
+    range_size: int = DEFAULT_RANGE_SIZE,
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    transforms: Optional[dict] = None,
+) -> Iterator[bytes]:
+    """
+    Obfuscates a CSV source read as byte ranges, using a pool of worker processes.
+
+    Ranges are downloaded concurrently, cut on the last record boundary they
+    contain (the unfinished record is carried over to the next range) and
+    obfuscated in worker processes. The results are emitted in file order
+    behind a single header row, so the output is identical to the one of
+    `Obfuscator.obfuscate_stream`.
+
+    Args:
+        read_range (Callable): Function returning the bytes between two inclusive offsets.
+        size (int): Total size of the source in bytes.
+        pii_fields (list): Names of the columns to obfuscate.
+        max_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        range_size (int): Size in bytes of each downloaded range.
+        max_connections (int): Maximum number of ranges downloaded at the same time.
+        transforms (dict, optional): Picklable functions used instead of the mask,
+            by PII column name. Every worker process gets its own copy.
+
+    Yields:
+        bytes: UTF-8 encoded pieces of the obfuscated file, in order.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    fieldnames = None
+    carry = b""
+
+    with process_pool(max_workers) as pool:
+        pending = deque()
+
+        for block in _iter_ranges(read_range, size, range_size, max_connections):
+            data = carry + block
+
+            # The header is parsed once, here, and sent to every worker
+            if fieldnames is None:
+                header_end = first_record_end(data)
+                if header_end is None:
+                    carry = data
+                    continue
+                fieldnames = next(csv.reader([data[:header_end].decode("utf-8")]))
+                header = compile_plan(fieldnames, pii_fields, transforms).header
+                yield format_header(header).encode("utf-8")
+                data = data[header_end:]
+
+            records, carry = split_complete_records(data)
+            if records:
+                pending.append(
+                    pool.submit(obfuscate_csv_chunk, records, fieldnames, pii_fields, transforms)
+                )
+
+            # Keep every worker busy without queueing the whole file
+            while len(pending) > max_workers * 2:
+                yield pending.popleft().result()
+
+        # A file whose last line has no newline leaves its last record in the carry
+        if fieldnames is None and carry:
+            fieldnames = next(csv.reader([carry.decode("utf-8")]))
+            header = compile_plan(fieldnames, pii_fields, transforms).header
+            yield format_header(header).encode("utf-8")
+        elif carry:
+            pending.append(pool.submit(obfuscate_csv_chunk, carry, fieldnames, pii_fields, transforms))
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def obfuscate_local_file(
+    path: str,
+    pii_fields: list,
+    max_workers: Optional[int] = None,
+    range_size: int = DEFAULT_RANGE_SIZE,
+    transforms: Optional[dict] = None,
+) -> Iterator[bytes]:
+    """
+    Obfuscates a large local CSV file using a pool of worker processes.
+
+    The file is memory-mapped and cut into record-aligned ranges with
+    `iter_record_ranges`, and each worker obfuscates a range it reads from
+    its own mapping of the file, so no input data goes through the pool.
+    The results are emitted in file order behind a single header row, so the
+    output is identical to the one of `Obfuscator.obfuscate_stream`.
+
+    Args:
+        path (str): The path of the file.
+        pii_fields (list): Names of the columns to obfuscate.
+        max_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        range_size (int): Size in bytes of the range given to a worker at a time.
+        transforms (dict, optional): Picklable functions used instead of the mask,
+            by PII column name. Every worker process gets its own copy.
+
+    Yields:
+        bytes: UTF-8 encoded pieces of the obfuscated file, in order.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            fieldnames, header_end = read_header(data)
+            if fieldnames is None:
+                return
+            header = compile_plan(fieldnames, pii_fields, transforms).header
+            yield format_header(header).encode("utf-8")
+
+            with process_pool(max_workers) as pool:
+                pending = deque()
+
+                for start, end in iter_record_ranges(data, header_end, range_size):
+                    pending.append(
+                        pool.submit(
+                            obfuscate_file_range,
+                            path,
+                            start,
+                            end,
+                            fieldnames,
+                            pii_fields,
+                            transforms,
+                        )
+                    )
+
+                    # Keep every worker busy without queueing the whole file
+                    while len(pending) > max_workers * 2:
+                        yield pending.popleft().result()
+
+                while pending:
+                    yield pending.popleft().result()
@@ -0,0 +1,291 @@
+""" Column-wise obfuscation of Parquet files. Requires the optional pyarrow dependency """
+
+import io
+from typing import Callable, Iterator, Optional
+
+from .engine import MASK
+from .transforms import Drop, Null
+
+
+def _import_pyarrow():
+    """
+    Imports pyarrow on first use, so it is only loaded for Parquet files.
+
+    Returns:
+        tuple: The `pyarrow` and `pyarrow.parquet` modules.
+
+    Raises:
+        ImportError: If pyarrow is not installed.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError(
+            "Parquet support requires pyarrow: pip install 'gdpr_obfuscator[parquet]'"
+        ) from e
+    return pyarrow, pyarrow.parquet
+
+
+def parquet_column_names(source) -> list:
+    """
+    Reads the column names of a Parquet file from its footer, without reading its data.
+
+    Args:
+        source: A seekable binary file.
+
+    Returns:
+        list: The names of the columns.
+    """
+    _, parquet = _import_pyarrow()
+    return parquet.ParquetFile(source).schema_arrow.names
+
+
+def parquet_sample(source, max_rows: int) -> dict:
+    """
+    Reads the first rows of the string columns of a Parquet file.
+
+    Only the first batch of the first row group is decoded, and only for the
+    string columns, since the values of the other columns are never PII by
+    their shape.
+
+    Args:
+        source: A seekable binary file.
+        max_rows (int): Maximum number of rows read.
+
+    Returns:
+        dict: The sampled values of each column, by column name in file order.
+        Columns that are not strings have no values.
+    """
+    pyarrow, parquet = _import_pyarrow()
+    parquet_file = parquet.ParquetFile(source)
+    schema = parquet_file.schema_arrow
+    columns = {name: [] for name in schema.names}
+
+    strings = [
+        field.name
+        for field in schema
+        if pyarrow.types.is_string(field.type) or pyarrow.types.is_large_string(field.type)
+    ]
+    if not strings or not parquet_file.metadata.num_row_groups:
+        return columns
+
+    batch = next(parquet_file.iter_batches(batch_size=max_rows, columns=strings), None)
+    if batch is not None:
+        for name, values in batch.to_pydict().items():
+            columns[name] = [value for value in values if value is not None]
+    return columns
+
+
+class RangeReader(io.RawIOBase):
+    """
+    Seekable, read-only file whose reads are served by a range function.
+
+    Parquet readers jump to the footer and then to the column chunks they
+    need, so reading an S3 object through ranged GETs only downloads those
+    parts. Wrap it in `io.BufferedReader` to avoid tiny requests.
+
+    Args:
+        read_range (Callable): Function returning the bytes between two inclusive offsets.
+        size (int): Total size of the file in bytes.
+    """
+
+    def __init__(self, read_range: Callable[[int, int], bytes], size: int):
+        self.__read_range = read_range
+        self.__size = size
+        self.__position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.__position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.__position
+        elif whence == io.SEEK_END:
+            offset += self.__size
+        self.__position = max(0, offset)
+        return self.__position
+
+    def readinto(self, buffer) -> int:
+        end = min(self.__position + len(buffer), self.__size)
+        if end <= self.__position:
+            return 0
+
+        data = self.__read_range(self.__position, end - 1)
+        buffer[: len(data)] = data
+        self.__position += len(data)
+        return len(data)
+
+
+class _ChunkCollector(io.RawIOBase):
+    """Write-only file that keeps what is written until it is collected."""
+
+    def __init__(self):
+        self.__chunks = []
+        self.__position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.__position
+
+    def write(self, data) -> int:
+        self.__chunks.append(bytes(data))
+        self.__position += len(data)
+        return len(data)
+
+    def collect(self) -> bytes:
+        chunk = b"".join(self.__chunks)
+        self.__chunks = []
+        return chunk
+
+
+def _masked_column(pyarrow, column, field):
+    """
+    Builds the replacement of a PII column in one vectorised operation.
+
+    String columns become a constant '***' column. Columns of any other type
+    cannot hold the mask, so they become null columns of the same type.
+
+    Args:
+        pyarrow: The pyarrow module.
+        column: The original column.
+        field: The schema field of the column.
+
+    Returns:
+        The replacement array, with as many rows as the original column.
+    """
+    value_type = field.type
+    if pyarrow.types.is_dictionary(value_type):
+        value_type = value_type.value_type
+
+    if pyarrow.types.is_string(value_type) or pyarrow.types.is_large_string(value_type):
+        return pyarrow.repeat(pyarrow.scalar(MASK, value_type), len(column)).cast(field.type)
+    return pyarrow.nulls(len(column), field.type)
+
+
+def _transformed_column(pyarrow, column, transform: Callable):
+    """
+    Applies a function to a PII column once per distinct value.
+
+    Each chunk is dictionary-encoded, the function is applied to its dictionary
+    and the results are gathered back with the indices, so the Python cost
+    grows with the number of distinct values rather than the number of rows.
+    Values that are not strings are given to the function as strings, and
+    nulls stay null.
+
+    Args:
+        pyarrow: The pyarrow module.
+        column: The original column.
+        transform (Callable): Function taking and returning a string.
+
+    Returns:
+        The replacement string column, with as many rows as the original column.
+    """
+    chunks = []
+    for chunk in column.chunks:
+        if pyarrow.types.is_dictionary(chunk.type):
+            chunk = chunk.dictionary_decode()
+        encoded = chunk.cast(pyarrow.string()).dictionary_encode()
+        values = [transform(value) for value in encoded.dictionary.to_pylist()]
+        chunks.append(pyarrow.array(values, pyarrow.string()).take(encoded.indices))
+    return pyarrow.chunked_array(chunks, pyarrow.string())
+
+
+def obfuscate_parquet_stream(
+    source, pii_fields: list, transforms: Optional[dict] = None, metrics=None
+) -> Iterator[bytes]:
+    """
+    Obfuscates a Parquet file row group by row group.
+
+    Each PII column of a row group is swapped for a constant (or null) column
+    in a single vectorised operation, and the other columns are passed through
+    as they are, so the cost grows with the number of PII columns and never
+    involves Python code per row. The output keeps the schema (PII columns
+    that are not strings become nullable), the row groups and the compression
+    codec of every column. PII fields that are not top-level columns are skipped.
+    Columns with a function in `transforms` get its result instead of the mask,
+    and become string columns. Columns with `Null` become null columns of the
+    same type, and columns with `Drop` are left out of the output.
+
+    Args:
+        source: A seekable binary file, such as a local file or a buffered `RangeReader`.
+        pii_fields (list): Names of the columns to obfuscate.
+        transforms (dict, optional): Functions taking and returning a string,
+            by PII column name, used instead of the mask.
+        metrics (Metrics, optional): Where the 'rows' and 'pii_cells' counters are recorded.
+
+    Yields:
+        bytes: Consecutive pieces of the obfuscated Parquet file.
+    """
+    pyarrow, parquet = _import_pyarrow()
+
+    parquet_file = parquet.ParquetFile(source)
+    schema = parquet_file.schema_arrow
+    metadata = parquet_file.metadata
+    pii_names = set(pii_fields)
+    pii_indices = [index for index, name in enumerate(schema.names) if name in pii_names]
+    transforms = {
+        index: transforms[schema.names[index]]
+        for index in pii_indices
+        if transforms and schema.names[index] in transforms
+    }
+    dropped = [index for index in pii_indices if isinstance(transforms.get(index), Drop)]
+    replaced = [index for index in pii_indices if index not in dropped]
+
+    # Null replacements need nullable fields, and transformed columns hold strings
+    for index in replaced:
+        field = schema.field(index).with_nullable(True)
+        if index in transforms and not isinstance(transforms[index], Null):
+            field = field.with_type(pyarrow.string())
+        schema = schema.set(index, field)
+    output_schema = schema
+    for index in reversed(dropped):
+        output_schema = output_schema.remove(index)
+
+    # Keep the codec of every column as found in the first row group
+    compression = "snappy"
+    if metadata.num_row_groups:
+        first_row_group = metadata.row_group(0)
+        compression = {}
+        for index in range(first_row_group.num_columns):
+            column = first_row_group.column(index)
+            codec = column.compression.lower()
+            compression[column.path_in_schema] = "none" if codec == "uncompressed" else codec
+
+    output = _ChunkCollector()
+    writer = parquet.ParquetWriter(output, output_schema, compression=compression)
+
+    try:
+        for row_group in range(metadata.num_row_groups):
+            table = parquet_file.read_row_group(row_group)
+            for index in replaced:
+                field = schema.field(index)
+                transform = transforms.get(index)
+                if isinstance(transform, Null):
+                    replacement = pyarrow.nulls(table.num_rows, field.type)
+                elif transform is not None:
+                    replacement = _transformed_column(pyarrow, table.column(index), transform)
+                else:
+                    replacement = _masked_column(pyarrow, table.column(index), field)
+                table = table.set_column(index, field, replacement)
+            for index in reversed(dropped):
+                table = table.remove_column(index)
+            writer.write_table(table, row_group_size=max(table.num_rows, 1))
+
+            if metrics is not None:
+                metrics.count("rows", table.num_rows)
+                metrics.count("pii_cells", table.num_rows * len(pii_indices))
+
+            yield output.collect()
+    finally:
+        writer.close()
+
+    yield output.collect()
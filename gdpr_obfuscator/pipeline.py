@@ -0,0 +1,167 @@
+""" Background threads that overlap the download, the obfuscation and the upload of a file """
+
+import queue
+import threading
+from typing import Callable, Iterable, Iterator
+
+from .engine import read_blocks
+
+
+# Items queued between two stages: with the default chunk size, about 4 MiB in flight per queue
+DEFAULT_QUEUE_SIZE = 4
+
+# Marks the end of a queue
+_DONE = object()
+
+
+class _Failure:
+    """Carries the exception of a background stage to the thread consuming its queue."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def read_ahead(iterable: Iterable, queue_size: int = DEFAULT_QUEUE_SIZE) -> Iterator:
+    """
+    Produces the items of an iterable in a background thread, ahead of their consumer.
+
+    At most `queue_size` items wait in the queue: when it is full the background
+    thread blocks, so memory stays bounded however slow the consumer is. An
+    exception of the iterable is raised to the consumer, and closing the
+    returned iterator stops the thread and closes the iterable.
+
+    Args:
+        iterable (Iterable): Typically a generator doing I/O, such as reading blocks.
+        queue_size (int): Maximum number of items produced but not consumed yet.
+
+    Yields:
+        The items of the iterable, in order.
+    """
+    items = queue.Queue(queue_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    thread = threading.Thread(target=produce, name="obfuscator-reader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class PrefetchingReader:
+    """
+    Binary reader that reads its source in a background thread, a few blocks ahead.
+
+    While the caller parses one block, the next ones are downloaded (and
+    decompressed) by the background thread, which releases the GIL during
+    network I/O and most decompression.
+
+    Args:
+        source: Any object with `read(size)` and `close()` methods returning bytes.
+        block_size (int): Size of the reads of the source.
+        queue_size (int): Maximum number of blocks read ahead.
+    """
+
+    def __init__(self, source, block_size: int, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.__source = source
+        self.__blocks = read_ahead(read_blocks(source, block_size), queue_size)
+        self.__pending = b""
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.__pending:
+            self.__pending = next(self.__blocks, b"")
+
+        if size < 0:
+            data = self.__pending + b"".join(self.__blocks)
+            self.__pending = b""
+            return data
+
+        data, self.__pending = self.__pending[:size], self.__pending[size:]
+        return data
+
+    def close(self) -> None:
+        self.__blocks.close()
+        self.__source.close()
+
+
+def write_behind(
+    chunks: Iterable[bytes], write: Callable[[bytes], None], queue_size: int = DEFAULT_QUEUE_SIZE
+) -> int:
+    """
+    Writes chunks from a background thread while the next ones are produced.
+
+    The producer blocks when `queue_size` chunks are waiting, so a slow sink
+    slows the obfuscation down instead of letting memory grow. An exception
+    of `write` stops the production and is raised here.
+
+    Args:
+        chunks (Iterable): The chunks to write, produced in the calling thread.
+        write (Callable): Writes one chunk, such as the `write` method of a sink.
+        queue_size (int): Maximum number of chunks produced but not written yet.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    pending = queue.Queue(queue_size)
+    failures = []
+
+    def consume():
+        try:
+            while (chunk := pending.get()) is not _DONE:
+                write(chunk)
+        except BaseException as e:
+            failures.append(e)
+            # Unblocks the producer until it notices the failure
+            while pending.get() is not _DONE:
+                pass
+
+    thread = threading.Thread(target=consume, name="obfuscator-writer", daemon=True)
+    thread.start()
+
+    written = 0
+    try:
+        for chunk in chunks:
+            if failures:
+                break
+            pending.put(chunk)
+            written += len(chunk)
+    finally:
+        pending.put(_DONE)
+        thread.join()
+        # Stops the producer early on a failure, releasing its source and threads
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+    if failures:
+        raise failures[0]
+    return written
@@ -0,0 +1,157 @@
+""" Deterministic keyed pseudonymisation of PII values """
+
+import functools
+import hashlib
+import hmac
+import os
+import threading
+from typing import Optional, Union
+
+
+# Environment variable holding the secret key of the process-wide pseudonymiser
+SECRET_ENV = "OBFUSCATOR_SECRET"
+
+# Maximum number of value -> token pairs remembered by a pseudonymiser
+DEFAULT_CACHE_SIZE = 64 * 1024
+
+# Number of hexadecimal characters of a token (64 bits)
+DEFAULT_TOKEN_LENGTH = 16
+
+_lock = threading.Lock()
+_pseudonymiser = None
+
+
+class Pseudonymiser:
+    """
+    Replaces values with deterministic tokens derived from a secret key.
+
+    A token is the HMAC-SHA256 of the UTF-8 encoded value, truncated to
+    `token_length` hexadecimal characters. The same value always gets the same
+    token under the same key, so joins and group-bys still work on the
+    obfuscated data, while the values cannot be recovered or guessed by
+    hashing candidates without the key.
+
+    The most recent tokens are kept in a bounded LRU memo, so the values that
+    repeat across a file (or across files and warm Lambda invocations, when the
+    instance is shared) skip the hash. The memo is thread-safe.
+
+    Use `token(value)`, or call the instance, to get the token of a string.
+    The instance itself is what is given to the row engines, as it can be
+    pickled to worker processes.
+
+    Args:
+        secret (str or bytes, optional): The secret key. Read from the
+            `OBFUSCATOR_SECRET` environment variable if omitted.
+        cache_size (int): Maximum number of tokens remembered.
+        token_length (int): Number of hexadecimal characters of each token, up to 64.
+
+    Raises:
+        ValueError: If no secret is given nor set in the environment.
+    """
+
+    def __init__(
+        self,
+        secret: Optional[Union[str, bytes]] = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        token_length: int = DEFAULT_TOKEN_LENGTH,
+    ):
+        if secret is None:
+            secret = os.environ.get(SECRET_ENV)
+        if not secret:
+            raise ValueError(
+                f"The token transform needs a secret key, set the {SECRET_ENV} environment variable"
+            )
+
+        self.__secret = secret.encode("utf-8") if isinstance(secret, str) else secret
+        self.__cache_size = cache_size
+        self.__token_length = token_length
+        self.token = functools.lru_cache(maxsize=cache_size)(self.__digest)
+
+    def __digest(self, value: str) -> str:
+        """Computes the token of a value, when it is not in the memo."""
+        digest = hmac.digest(self.__secret, value.encode("utf-8"), hashlib.sha256)
+        return digest.hex()[: self.__token_length]
+
+    def __call__(self, value: str) -> str:
+        return self.token(value)
+
+    def stats(self) -> dict:
+        """
+        Reports how well the memo is doing.
+
+        Returns:
+            dict: The number of 'hits' and 'misses', the current 'size' and
+            'max_size' of the memo, and the 'hit_rate' between 0 and 1.
+        """
+        info = self.token.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+            "hit_rate": info.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        """Empties the memo and resets its statistics."""
+        self.token.cache_clear()
+
+    def __getstate__(self) -> dict:
+        # Worker processes get the key and the settings, and start with an empty memo
+        return {
+            "secret": self.__secret,
+            "cache_size": self.__cache_size,
+            "token_length": self.__token_length,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["secret"], state["cache_size"], state["token_length"])
+
+
+def get_pseudonymiser() -> Pseudonymiser:
+    """
+    Returns the process-wide pseudonymiser, creating it on first use.
+
+    Its key comes from the `OBFUSCATOR_SECRET` environment variable. Sharing
+    it lets every file of a batch, and every warm Lambda invocation, reuse
+    the same memo.
+
+    Returns:
+        Pseudonymiser: The shared pseudonymiser.
+
+    Raises:
+        ValueError: If the secret is not set in the environment.
+    """
+    global _pseudonymiser
+
+    with _lock:
+        if _pseudonymiser is None:
+            _pseudonymiser = Pseudonymiser()
+        return _pseudonymiser
+
+
+def pseudonymiser_stats() -> Optional[dict]:
+    """
+    Reports the memo of the process-wide pseudonymiser, without creating it.
+
+    Returns:
+        dict: Its `Pseudonymiser.stats`, or None if it is not in use.
+    """
+    with _lock:
+        pseudonymiser = _pseudonymiser
+    return None if pseudonymiser is None else pseudonymiser.stats()
+
+
+def set_pseudonymiser(pseudonymiser: Optional[Pseudonymiser]) -> None:
+    """
+    Replaces the process-wide pseudonymiser, for example with one using a key from a secret store.
+
+    Args:
+        pseudonymiser (Pseudonymiser): The pseudonymiser to share, or None to
+            create a new one from the environment on next use.
+    """
+    global _pseudonymiser
+
+    with _lock:
+        _pseudonymiser = pseudonymiser
@@ -0,0 +1,402 @@
+""" Destinations the obfuscated output can be written to, one chunk at a time """
+
+import base64
+import hashlib
+import io
+import os
+import re
+import secrets
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from .clients import get_s3_client
+
+
+# S3 rejects multipart parts smaller than 5 MiB, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+# Name of the temporary file of a FileSink, next to its output
+TEMPORARY_NAME = re.compile(r"\..+\.[0-9a-f]{16}\.tmp")
+
+# Size of the parts copied server-side from an existing object when appending to it
+COPY_PART_SIZE = 1024 * 1024 * 1024
+
+
+class Sink:
+    """
+    Base class of the output sinks.
+
+    A sink receives the obfuscated file as a sequence of byte chunks through
+    `write` and is finalised with `close`. When used as a context manager the
+    sink is closed on success and aborted if an exception is raised, so a
+    partially written output is never published.
+    """
+
+    def write(self, data: bytes) -> None:
+        """
+        Writes a chunk of the output.
+
+        Args:
+            data (bytes): The next chunk of the obfuscated file.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Flushes any buffered data and finalises the output."""
+
+    def abort(self) -> None:
+        """Discards the output. By default this simply closes the sink."""
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class FileSink(Sink):
+    """
+    Writes the output to a local file.
+
+    The output is written to a temporary file next to `path`, which replaces
+    it on `close`. So the file keeps its previous content until the output is
+    complete, an aborted sink leaves it untouched, and the output may be the
+    file being obfuscated.
+
+    Args:
+        path (str): The path of the file.
+        append (bool): If True, the output is added at the end of the file, and
+            an aborted sink truncates the file back to its original size.
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self.__append = append
+        self.__closed = False
+        if append:
+            self.__temporary_path = None
+            self.__file = open(path, "ab")
+        else:
+            directory, name = os.path.split(path)
+            self.__temporary_path = os.path.join(directory, f".{name}.{secrets.token_hex(8)}.tmp")
+            self.__file = open(self.__temporary_path, "xb")
+        self.__initial_size = self.__file.tell()
+
+    def write(self, data: bytes) -> None:
+        self.__file.write(data)
+
+    def close(self) -> None:
+        if self.__closed:
+            return
+        self.__closed = True
+
+        self.__file.close()
+        if self.__temporary_path is not None:
+            os.replace(self.__temporary_path, self.path)
+
+    def abort(self) -> None:
+        if self.__closed:
+            return
+        self.__closed = True
+
+        if self.__append:
+            self.__file.truncate(self.__initial_size)
+            self.__file.close()
+            return
+
+        self.__file.close()
+        os.remove(self.__temporary_path)
+
+
+def is_temporary_file(path: str) -> bool:
+    """Tells whether a path is the temporary file of a `FileSink`, such as one left by a crash."""
+    return TEMPORARY_NAME.fullmatch(os.path.basename(path)) is not None
+
+
+class StdoutSink(Sink):
+    """Writes the output to the standard output of the process."""
+
+    def write(self, data: bytes) -> None:
+        sys.stdout.buffer.write(data)
+
+    def close(self) -> None:
+        # The standard output belongs to the process, so it is only flushed
+        sys.stdout.buffer.flush()
+
+
+class BytesSink(Sink):
+    """Keeps the output in memory. Only suitable for small files."""
+
+    def __init__(self):
+        self.__buffer = io.BytesIO()
+
+    def write(self, data: bytes) -> None:
+        self.__buffer.write(data)
+
+    def getvalue(self) -> bytes:
+        """
+        Returns:
+            bytes: Everything written to the sink so far.
+        """
+        return self.__buffer.getvalue()
+
+
+class S3MultipartSink(Sink):
+    """
+    Uploads the output to S3 as a multipart upload while it is being produced.
+
+    Chunks are accumulated until a part is full, and full parts are uploaded
+    by a small pool of background threads, so the upload overlaps with the
+    obfuscation and at most `max_concurrency + 1` parts are held in memory.
+    The SHA-256 checksum of every part is computed locally and sent with it
+    for S3 to verify, and a SHA-256 of the whole object is kept in `sha256`.
+    Outputs smaller than one part are sent with a single `put_object`.
+
+    S3 objects cannot be appended to, so in append mode the object is rewritten
+    with its current content first: objects of at least one part are copied
+    server-side with `upload_part_copy`, smaller ones are downloaded into the
+    first part. `sha256` then only covers what is written to the sink.
+
+    Args:
+        bucket_name (str): The destination bucket.
+        key (str): The destination key.
+        s3_client: Optional boto3 S3 client. The process-wide client is used if omitted.
+        part_size (int): Size in bytes of each uploaded part, 5 MiB at least.
+        max_concurrency (int): Maximum number of parts uploaded at the same time.
+        append (bool): If True, the output is added at the end of the existing object, if any.
+
+    Raises:
+        ValueError: If `part_size` is smaller than the S3 minimum part size.
+
+    Example:
+        with S3MultipartSink("my-bucket", "obfuscated/file.csv") as sink:
+            obfuscator.obfuscate_to(sink)
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        key: str,
+        s3_client=None,
+        part_size: int = DEFAULT_PART_SIZE,
+        max_concurrency: int = 4,
+        append: bool = False,
+    ):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"The part size must be at least {MIN_PART_SIZE} bytes")
+
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.__s3 = s3_client or get_s3_client()
+        self.__buffer = bytearray()
+        self.__object_hash = hashlib.sha256()
+        self.__upload_id = None
+        self.__executor = None
+        self.__pending = []
+        self.__parts = []
+        self.__closed = False
+
+        if append:
+            self.__copy_existing_object()
+
+    @property
+    def sha256(self) -> str:
+        """Hex digest of the SHA-256 of everything written so far."""
+        return self.__object_hash.hexdigest()
+
+    def write(self, data: bytes) -> None:
+        self.__object_hash.update(data)
+        self.__buffer += data
+
+        while len(self.__buffer) >= self.part_size:
+            part = bytes(self.__buffer[: self.part_size])
+            del self.__buffer[: self.part_size]
+            self.__submit_part(part)
+
+    def close(self) -> None:
+        if self.__closed:
+            return
+        self.__closed = True
+
+        # Small outputs never start a multipart upload
+        if self.__upload_id is None:
+            body = bytes(self.__buffer)
+            self.__s3.put_object(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                Body=body,
+                ChecksumSHA256=_sha256_base64(body),
+            )
+            return
+
+        try:
+            if self.__buffer:
+                self.__submit_part(bytes(self.__buffer))
+                self.__buffer.clear()
+
+            for future in self.__pending:
+                self.__parts.append(future.result())
+            self.__pending = []
+            self.__executor.shutdown()
+
+            self.__s3.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self.__upload_id,
+                MultipartUpload={
+                    "Parts": sorted(self.__parts, key=lambda part: part["PartNumber"])
+                },
+            )
+        except Exception:
+            self.__abort_upload()
+            raise
+
+    def abort(self) -> None:
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__buffer.clear()
+
+        if self.__upload_id is not None:
+            self.__abort_upload()
+
+    def __copy_existing_object(self) -> None:
+        """
+        Starts the output with the current content of the destination object, if it exists.
+        """
+        try:
+            size = self.__s3.head_object(Bucket=self.bucket_name, Key=self.key)["ContentLength"]
+        except self.__s3.exceptions.ClientError:
+            return
+
+        if size < MIN_PART_SIZE:
+            if size:
+                body = self.__s3.get_object(Bucket=self.bucket_name, Key=self.key)["Body"]
+                self.__buffer += body.read()
+            return
+
+        self.__start_upload()
+        start = 0
+        while start < size:
+            end = min(start + COPY_PART_SIZE, size)
+            # Every part but the last one must reach the minimum part size
+            if size - end < MIN_PART_SIZE:
+                end = size
+
+            response = self.__s3.upload_part_copy(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self.__upload_id,
+                PartNumber=len(self.__parts) + 1,
+                CopySource={"Bucket": self.bucket_name, "Key": self.key},
+                CopySourceRange=f"bytes={start}-{end - 1}",
+            )
+            part = {"PartNumber": len(self.__parts) + 1, "ETag": response["CopyPartResult"]["ETag"]}
+            if "ChecksumSHA256" in response["CopyPartResult"]:
+                part["ChecksumSHA256"] = response["CopyPartResult"]["ChecksumSHA256"]
+            self.__parts.append(part)
+            start = end
+
+    def __start_upload(self) -> None:
+        """Creates the multipart upload and the pool of upload threads."""
+        response = self.__s3.create_multipart_upload(
+            Bucket=self.bucket_name, Key=self.key, ChecksumAlgorithm="SHA256"
+        )
+        self.__upload_id = response["UploadId"]
+        self.__executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+
+    def __submit_part(self, part: bytes) -> None:
+        """
+        Hands a full part to the upload threads, starting the upload if needed.
+
+        If the maximum number of parts is already in flight, this waits for
+        the oldest one to finish, which bounds the memory used by the sink.
+
+        Args:
+            part (bytes): The content of the part.
+        """
+        if self.__upload_id is None:
+            self.__start_upload()
+
+        if len(self.__pending) >= self.max_concurrency:
+            self.__parts.append(self.__pending.pop(0).result())
+
+        part_number = len(self.__parts) + len(self.__pending) + 1
+        self.__pending.append(
+            self.__executor.submit(self.__upload_part, part_number, part)
+        )
+
+    def __upload_part(self, part_number: int, part: bytes) -> dict:
+        """
+        Uploads a single part of the multipart upload.
+
+        Args:
+            part_number (int): The 1-based position of the part in the object.
+            part (bytes): The content of the part.
+
+        Returns:
+            dict: The part description expected by `complete_multipart_upload`.
+        """
+        checksum = _sha256_base64(part)
+        response = self.__s3.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.__upload_id,
+            PartNumber=part_number,
+            Body=part,
+            ChecksumAlgorithm="SHA256",
+            ChecksumSHA256=checksum,
+        )
+        return {
+            "PartNumber": part_number,
+            "ETag": response["ETag"],
+            "ChecksumSHA256": checksum,
+        }
+
+    def __abort_upload(self) -> None:
+        """Cancels the pending parts and aborts the multipart upload in S3."""
+        for future in self.__pending:
+            future.cancel()
+        self.__pending = []
+        if self.__executor is not None:
+            self.__executor.shutdown()
+
+        self.__s3.abort_multipart_upload(
+            Bucket=self.bucket_name, Key=self.key, UploadId=self.__upload_id
+        )
+
+
+def _sha256_base64(data: bytes) -> str:
+    """Returns the base64 encoded SHA-256 digest of `data`, as S3 expects it."""
+    return base64.b64encode(hashlib.sha256(data).digest()).decode("ascii")
+
+
+def open_sink(destination: str = None, s3_client=None, append: bool = False) -> Sink:
+    """
+    Creates the sink matching a destination string.
+
+    Args:
+        destination (str, optional): An S3 URL ('s3://bucket/key'), '-' for the
+            standard output or a local path. The output is kept in memory if omitted.
+        s3_client (optional): The boto3 S3 client used by S3 destinations.
+        append (bool): If True, files and S3 objects are appended to rather than replaced.
+
+    Returns:
+        Sink: A sink writing to the destination.
+    """
+    if destination is None:
+        return BytesSink()
+    if destination == "-":
+        return StdoutSink()
+    if destination.startswith("s3://"):
+        bucket_name, _, key = destination[len("s3://") :].partition("/")
+        return S3MultipartSink(bucket_name, key, s3_client, append=append)
+    return FileSink(destination, append=append)
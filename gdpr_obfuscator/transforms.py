@@ -0,0 +1,176 @@
+""" Transforms that can replace the '***' mask of a PII field, and the parsing of their specs """
+
+import datetime
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Optional, Union
+
+
+# Transforms of a PII field, by name, with their options and defaults
+TRANSFORMS = {
+    "mask": {},
+    "token": {},
+    "partial_mask": {"keep": 4},
+    "hash": {"salt": ""},
+    "null": {},
+    "truncate": {"length": 1},
+    "generalise_date": {"granularity": "year"},
+    "drop": {},
+}
+
+DATE_GRANULARITIES = ("year", "month")
+
+# ISO dates (2024-03-17, with or without a time) and day-first dates (17/03/2024)
+ISO_DATE = re.compile(r"(\d{4})-(\d{1,2})(?:-(\d{1,2}))?(?:[ T].*)?")
+DAY_FIRST_DATE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})")
+
+
+@dataclass(frozen=True)
+class PartialMask:
+    """Masks every character of a value but the last `keep` ones, and short values entirely."""
+
+    keep: int = 4
+
+    def __call__(self, value: str) -> str:
+        if len(value) <= self.keep:
+            return "*" * len(value)
+        # Not value[-keep:], which is the whole value when keep is 0
+        return "*" * (len(value) - self.keep) + value[len(value) - self.keep :]
+
+
+@dataclass(frozen=True)
+class Hash:
+    """
+    Replaces a value with the SHA-256 hex digest of the salt and the value.
+
+    Unlike the keyed 'token' transform, anyone with the salt can check a guess,
+    so it suits values that are not guessable.
+    """
+
+    salt: str = ""
+
+    def __call__(self, value: str) -> str:
+        return hashlib.sha256((self.salt + value).encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class Truncate:
+    """Keeps the first `length` characters of a value."""
+
+    length: int = 1
+
+    def __call__(self, value: str) -> str:
+        return value[: self.length]
+
+
+@dataclass(frozen=True)
+class GeneraliseDate:
+    """
+    Reduces a date to its year ('2024') or month ('2024-03').
+
+    ISO dates, optionally with a time, and day-first dates are recognised.
+    Other non-empty values, impossible dates such as '2024-13-40' included,
+    are masked, since they cannot be generalised.
+    """
+
+    granularity: str = "year"
+
+    def __call__(self, value: str) -> str:
+        match = ISO_DATE.fullmatch(value)
+        if match:
+            year, month, day = match.groups()
+        else:
+            match = DAY_FIRST_DATE.fullmatch(value)
+            if not match:
+                return "***" if value else value
+            day, month, year = match.groups()
+        try:
+            datetime.date(int(year), int(month), int(day or 1))
+        except ValueError:
+            return "***"
+
+        if self.granularity == "year":
+            return year
+        return f"{year}-{int(month):02d}"
+
+
+@dataclass(frozen=True)
+class Null:
+    """Empties a value: an empty CSV field, a JSON null or a Parquet null."""
+
+    def __call__(self, value: str) -> str:
+        return ""
+
+
+@dataclass(frozen=True)
+class Drop:
+    """Removes the field from the output altogether: the CSV column, JSON key or Parquet column."""
+
+    def __call__(self, value: str) -> str:
+        return ""
+
+
+def parse_transform(spec: Union[str, dict]) -> tuple[str, dict]:
+    """
+    Validates the transform spec of a PII field.
+
+    Args:
+        spec (str | dict): A transform name, or a dictionary with its name under
+            'type' and its options, such as {"type": "partial_mask", "keep": 4}.
+
+    Returns:
+        tuple: The name of the transform and its options, defaults included.
+
+    Raises:
+        ValueError: If the transform or one of its options is not supported.
+    """
+    options = dict(spec) if isinstance(spec, dict) else {"type": spec}
+    name = options.pop("type", None)
+    if name not in TRANSFORMS:
+        raise ValueError(
+            f"The transform '{name}' is not supported, use one of {', '.join(TRANSFORMS)}"
+        )
+
+    unknown = set(options) - set(TRANSFORMS[name])
+    if unknown:
+        raise ValueError(f"The transform '{name}' has no option {', '.join(sorted(unknown))}")
+    options = {**TRANSFORMS[name], **options}
+
+    for option in ("keep", "length"):
+        value = options.get(option, 0)
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise ValueError(f"The option '{option}' of '{name}' must be a non-negative integer")
+    if name == "generalise_date" and options["granularity"] not in DATE_GRANULARITIES:
+        raise ValueError(f"The granularity must be one of {', '.join(DATE_GRANULARITIES)}")
+    return name, options
+
+
+def build_transform(name: str, options: dict, pseudonymiser=None) -> Optional[object]:
+    """
+    Creates the function of a parsed transform.
+
+    Args:
+        name (str): A transform name returned by `parse_transform`.
+        options (dict): Its options.
+        pseudonymiser (Pseudonymiser, optional): The pseudonymiser of the 'token' transform.
+
+    Returns:
+        A picklable function taking and returning a string, or None for the
+        default '***' mask.
+    """
+    if name == "mask":
+        return None
+    if name == "token":
+        return pseudonymiser
+    if name == "partial_mask":
+        return PartialMask(options["keep"])
+    if name == "hash":
+        return Hash(options["salt"])
+    if name == "truncate":
+        return Truncate(options["length"])
+    if name == "generalise_date":
+        return GeneraliseDate(options["granularity"])
+    if name == "null":
+        return Null()
+    return Drop()
@@ -7,6 +7,7 @@ setup(
     version="1.0",
     packages=find_packages(),
     install_requires=[],
+    extras_require={"parquet": ["pyarrow"], "zstd": ["zstandard"]},
     test_requires=["pytest"],
     setup_requires=["pytest-runner"], # Allow pytest to be run directly via python setup.py test
     classifiers=[
@@ -8,7 +8,7 @@ data "archive_file" "lambda_obfuscator" {
 data "archive_file" "lambda_layer" {
     type = "zip"
     output_file_mode = "0666"
-    source_dir = "${path.module}/../layer/"
+    source_dir = "${path.module}/../build/layer/"
     output_path = "${path.module}/../layer.zip"
 }
 
@@ -26,7 +26,7 @@ resource "aws_lambda_function" "lambda_obfuscator" {
     ]
 }
 
-# Layer with the Obfuscator Class
+# Layer with the gdpr_obfuscator package, built by `make layer`
 resource "aws_lambda_layer_version" "libraries_layer" {
     layer_name = "libraries_layer"
     compatible_runtimes = [var.python_version]
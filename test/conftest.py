@@ -0,0 +1,35 @@
+import pytest
+import os
+import boto3
+from moto import mock_aws
+from gdpr_obfuscator.clients import set_s3_client
+
+
+@pytest.fixture(scope="class")
+def aws_credentials():
+    os.environ["AWS_ACCESS_KEY_ID"] = "test"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "test"
+    os.environ["AWS_SECURITY_TOKEN"] = "test"
+    os.environ["AWS_SESSION_TOKEN"] = "test"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(scope="function")
+def s3_client(request, aws_credentials):
+    """
+    Mocked S3 client, shared with the obfuscator for the duration of the test.
+
+    The bucket named by the `BUCKET_NAME` of the test module, when it has one,
+    is created beforehand.
+    """
+    with mock_aws():
+        client = boto3.client("s3", region_name="eu-west-2")
+        bucket_name = getattr(request.module, "BUCKET_NAME", None)
+        if bucket_name:
+            client.create_bucket(
+                Bucket=bucket_name,
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+        set_s3_client(client)
+        yield client
+        set_s3_client(None)
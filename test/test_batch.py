@@ -0,0 +1,72 @@
+from gdpr_obfuscator.batch import obfuscate_in_processes, obfuscate_many
+
+
+BUCKET_NAME = "my-ingestion-bucket"
+
+
+class TestObfuscateMany:
+
+    def test_results_are_returned_in_request_order(self, s3_client):
+        for index in range(10):
+            s3_client.put_object(
+                Bucket=BUCKET_NAME, Key=f"in/{index}.csv", Body=f"id,name\n{index},Ana\n"
+            )
+        requests = [
+            {
+                "file_to_obfuscate": f"s3://{BUCKET_NAME}/in/{index}.csv",
+                "pii_fields": ["name"],
+                "output": f"s3://{BUCKET_NAME}/out/{index}.csv",
+            }
+            for index in range(10)
+        ]
+
+        results = obfuscate_many(requests, max_workers=4, s3_client=s3_client)
+
+        assert [result.file_to_obfuscate for result in results] == [
+            request["file_to_obfuscate"] for request in requests
+        ]
+        for index, result in enumerate(results):
+            assert result.ok
+            body = s3_client.get_object(Bucket=BUCKET_NAME, Key=f"out/{index}.csv")["Body"].read()
+            assert body == f"id,name\r\n{index},***\r\n".encode()
+            assert result.bytes_written == len(body)
+
+    def test_errors_are_reported_per_request(self, tmp_path):
+        output = tmp_path / "simple.csv"
+        requests = [
+            '{"file_to_obfuscate": "data/simple.csv", "pii_fields": ["name"]}',
+            '{"file_to_obfuscate": "data/missing.csv"}',
+            "{not json",
+            {"file_to_obfuscate": "data/medium.csv", "pii_fields": ["age"], "output": str(output)},
+        ]
+
+        results = obfuscate_many(requests, max_workers=2)
+
+        assert results[0].ok
+        assert results[0].content == b"name,email_address\r\n***,alice@example.com\r\n***,bob@example.com\r\n"
+        assert isinstance(results[1].error, ValueError)
+        assert results[2].error is not None
+        assert results[3].ok and results[3].content is None
+        assert output.read_bytes().endswith(b"Bob,bob@example.com,***\r\n")
+
+
+class TestObfuscateInProcesses:
+
+    def test_files_are_obfuscated_by_worker_processes(self, tmp_path):
+        requests = []
+        for index in range(4):
+            (tmp_path / f"{index}.csv").write_text(f"id,name\n{index},Ana\n")
+            requests.append(
+                {
+                    "file_to_obfuscate": str(tmp_path / f"{index}.csv"),
+                    "pii_fields": ["name"],
+                    "output": str(tmp_path / f"out_{index}.csv"),
+                }
+            )
+        requests.append({"file_to_obfuscate": str(tmp_path / "missing.csv"), "output": "x.csv"})
+
+        results = list(obfuscate_in_processes(requests, max_workers=2))
+
+        assert [result.ok for result in results] == [True] * 4 + [False]
+        assert "does not exist" in str(results[-1].error)
+        assert (tmp_path / "out_3.csv").read_bytes() == b"id,name\r\n3,***\r\n"
@@ -0,0 +1,114 @@
+import pytest
+import json
+import os
+from gdpr_obfuscator import bulk
+from gdpr_obfuscator.bulk import iter_pages, obfuscate_prefix, output_location
+from gdpr_obfuscator.manifest import Manifest
+
+
+BUCKET_NAME = "my-ingestion-bucket"
+
+
+class TestListing:
+
+    def test_s3_prefix_is_listed_in_pages_after_the_start_key(self, s3_client):
+        for index in range(5):
+            s3_client.put_object(Bucket=BUCKET_NAME, Key=f"in/{index}.csv", Body=b"id\n1\n")
+        s3_client.put_object(Bucket=BUCKET_NAME, Key="in/folder/", Body=b"")
+
+        pages = list(iter_pages(f"s3://{BUCKET_NAME}/in/", f"s3://{BUCKET_NAME}/in/1.csv", s3_client, 2))
+
+        assert pages == [
+            [f"s3://{BUCKET_NAME}/in/2.csv", f"s3://{BUCKET_NAME}/in/3.csv"],
+            [f"s3://{BUCKET_NAME}/in/4.csv"],
+        ]
+
+    def test_outputs_keep_the_relative_path(self):
+        assert output_location("s3://in/2024/a.csv", "s3://in/", "s3://out/x") == "s3://out/x/2024/a.csv"
+        assert output_location("/data/in/a/b.csv", "/data/in", "/data/out") == "/data/out/a/b.csv"
+
+
+class TestObfuscatePrefix:
+
+    def test_local_directory_is_obfuscated(self, tmp_path):
+        (tmp_path / "in" / "2024").mkdir(parents=True)
+        (tmp_path / "in" / "a.csv").write_bytes(b"id,name\n1,Ana\n")
+        (tmp_path / "in" / "2024" / "b.jsonl").write_bytes(b'{"name": "Bob"}\n')
+
+        result = obfuscate_prefix(str(tmp_path / "in"), str(tmp_path / "out"), {"pii_fields": ["name"]})
+
+        assert result.ok and result.processed == 2
+        assert (tmp_path / "out" / "a.csv").read_bytes() == b"id,name\r\n1,***\r\n"
+        assert (tmp_path / "out" / "2024" / "b.jsonl").read_bytes() == b'{"name": "***"}\n'
+
+    def test_destination_inside_the_location_is_rejected(self, tmp_path):
+        with pytest.raises(ValueError, match="cannot be inside"):
+            obfuscate_prefix(str(tmp_path), str(tmp_path / "out"), {})
+
+    def test_local_directory_is_obfuscated_in_place(self, tmp_path):
+        (tmp_path / "2024").mkdir()
+        (tmp_path / "a.csv").write_bytes(b"id,email\n1,ana@example.com\n")
+        (tmp_path / "2024" / "b.csv").write_bytes(b"id,email\n2,bob@example.com\n")
+
+        result = obfuscate_prefix(str(tmp_path), str(tmp_path), {"pii_fields": ["email"]})
+
+        assert result.ok and result.processed == 2
+        assert (tmp_path / "a.csv").read_bytes() == b"id,email\r\n1,***\r\n"
+        assert (tmp_path / "2024" / "b.csv").read_bytes() == b"id,email\r\n2,***\r\n"
+        assert sorted(os.listdir(tmp_path)) == ["2024", "a.csv"]
+
+    def test_documents_of_the_run_are_not_obfuscated(self, tmp_path):
+        (tmp_path / "in").mkdir()
+        (tmp_path / "in" / "a.csv").write_bytes(b"id,name\n1,Ana\n")
+        (tmp_path / "in" / ".a.csv.0123456789abcdef.tmp").write_bytes(b"id,name\n1,Ana\n")
+        checkpoint = tmp_path / "in" / "checkpoint.json"
+        manifest = Manifest(str(tmp_path / "in" / "manifest.json"))
+        manifest.save()
+
+        result = obfuscate_prefix(
+            str(tmp_path / "in"), str(tmp_path / "out"), {"pii_fields": ["name"]}, str(checkpoint), manifest=manifest
+        )
+
+        assert result.ok and result.processed == 1
+        assert os.listdir(tmp_path / "out") == ["a.csv"]
+        assert json.loads(checkpoint.read_bytes())["processed"] == 1
+
+    def test_s3_checkpoint_under_the_prefix_is_not_listed(self, s3_client):
+        s3_client.put_object(Bucket=BUCKET_NAME, Key="in/a.csv", Body=b"id,name\n1,Ana\n")
+        s3_client.put_object(Bucket=BUCKET_NAME, Key="in/checkpoint.json", Body=b"{}")
+
+        pages = list(iter_pages(f"s3://{BUCKET_NAME}/in/", exclude=[f"s3://{BUCKET_NAME}/in/checkpoint.json"]))
+
+        assert pages == [[f"s3://{BUCKET_NAME}/in/a.csv"]]
+
+    def test_manifest_in_place_is_rejected(self, tmp_path):
+        with pytest.raises(ValueError, match="in place"):
+            obfuscate_prefix(str(tmp_path), str(tmp_path), {}, manifest=Manifest(str(tmp_path / "manifest.json")))
+
+    def test_interrupted_run_resumes_from_its_checkpoint(self, s3_client, monkeypatch):
+        for index in range(6):
+            s3_client.put_object(Bucket=BUCKET_NAME, Key=f"in/{index}.csv", Body=b"id,name\n1,Ana\n")
+        s3_client.put_object(Bucket=BUCKET_NAME, Key="in/bad.csv", Body=b"\xff\xfe\n")
+        location, destination = f"s3://{BUCKET_NAME}/in/", f"s3://{BUCKET_NAME}/out/"
+        checkpoint = f"s3://{BUCKET_NAME}/checkpoint.json"
+
+        calls = []
+        obfuscate_many = bulk.obfuscate_many
+
+        def crash_on_second_page(requests, **kwargs):
+            calls.append([request["file_to_obfuscate"] for request in requests])
+            if len(calls) == 2:
+                raise TimeoutError("the function timed out")
+            return obfuscate_many(requests, **kwargs)
+
+        monkeypatch.setattr(bulk, "obfuscate_many", crash_on_second_page)
+        with pytest.raises(TimeoutError):
+            obfuscate_prefix(location, destination, {"pii_fields": ["name"]}, checkpoint, page_size=3)
+        result = obfuscate_prefix(location, destination, {"pii_fields": ["name"]}, checkpoint, page_size=3)
+
+        assert calls[0] == [f"s3://{BUCKET_NAME}/in/{index}.csv" for index in range(3)]
+        assert f"s3://{BUCKET_NAME}/in/0.csv" not in sum(calls[2:], [])
+        assert result.processed == 6
+        assert list(result.failed) == [f"s3://{BUCKET_NAME}/in/bad.csv"]
+        saved = json.loads(s3_client.get_object(Bucket=BUCKET_NAME, Key="checkpoint.json")["Body"].read())
+        assert saved["start_after"] == f"s3://{BUCKET_NAME}/in/bad.csv"
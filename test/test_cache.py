@@ -0,0 +1,79 @@
+import pytest
+import json
+from gdpr_obfuscator.cache import TTLCache, cache_stats, request_configs, row_plans
+from gdpr_obfuscator.engine import compile_plan
+from gdpr_obfuscator.obfuscator import Obfuscator
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = TTLCache(max_size=2, ttl=None)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    def test_entries_expire_after_their_time_to_live(self):
+        clock = Clock()
+        cache = TTLCache(max_size=8, ttl=10, clock=clock)
+        cache.put("a", 1)
+
+        clock.now = 9.5
+        assert cache.get("a") == 1
+        clock.now = 10
+        assert cache.get("a", "gone") == "gone"
+        assert cache.stats()["expirations"] == 1
+        assert len(cache) == 0
+
+    def test_get_or_create_counts_hits_and_does_not_store_failures(self):
+        cache = TTLCache(max_size=8, ttl=None)
+
+        def fail():
+            raise ValueError("invalid")
+
+        with pytest.raises(ValueError):
+            cache.get_or_create("a", fail)
+        assert cache.get_or_create("a", lambda: 1) == 1
+        assert cache.get_or_create("a", fail) == 1
+
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["size"]) == (1, 2, 1)
+        assert stats["hit_rate"] == pytest.approx(1 / 3)
+
+
+class TestWarmCaches:
+
+    def test_options_are_validated_once_for_every_file(self, tmp_path):
+        options = {"pii_fields": ["name", {"field": "card", "transform": "partial_mask", "keep": 2}]}
+        for name in ("a.csv", "b.csv"):
+            (tmp_path / name).write_bytes(b"id,name,card\n1,Ana,1234\n")
+        request_configs.clear()
+
+        for name in ("a.csv", "b.csv"):
+            obfuscator = Obfuscator(json.dumps({"file_to_obfuscate": str(tmp_path / name), **options}))
+            assert b"".join(obfuscator.obfuscate_stream()) == b"id,name,card\r\n1,***,**34\r\n"
+
+        assert request_configs.stats()["hits"] == 1
+        assert cache_stats()["request_configs"]["size"] == 1
+
+    def test_plans_are_kept_in_the_row_plan_cache(self):
+        row_plans.clear()
+
+        plan = compile_plan(["id", "name"], ["name"])
+
+        assert compile_plan(["id", "name"], ["name"]) is plan
+        assert row_plans.stats()["hits"] == 1
@@ -0,0 +1,59 @@
+import pytest
+import json
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_modules(statement):
+    # A fresh interpreter, as this one already has everything the tests imported
+    completed = subprocess.run(
+        [sys.executable, "-c", f"{statement}; import sys, json; print(json.dumps(sorted(sys.modules)))"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        check=True,
+    )
+    return set(json.loads(completed.stdout))
+
+
+class TestColdStart:
+
+    @pytest.mark.parametrize("module", ["boto3", "botocore", "argparse", "multiprocessing", "pyarrow"])
+    def test_the_lambda_handler_does_not_load_heavy_modules(self, module):
+        modules = loaded_modules("import gdpr_obfuscator.lambda_obfuscator")
+
+        assert module not in modules
+        assert "gdpr_obfuscator.cli" not in modules
+
+    def test_boto3_is_loaded_on_first_use_of_s3(self):
+        modules = loaded_modules(
+            "from gdpr_obfuscator.clients import create_s3_client; "
+            "create_s3_client(region_name='eu-west-2')"
+        )
+
+        assert "boto3" in modules
+
+    def test_local_files_are_obfuscated_without_boto3(self, tmp_path):
+        (tmp_path / "in").mkdir()
+        (tmp_path / "in" / "a.csv").write_text("id,name\n1,Ana\n")
+        location, destination = str(tmp_path / "in"), str(tmp_path / "out")
+
+        modules = loaded_modules(
+            "from gdpr_obfuscator.cli import main; "
+            f"main([{location + '/a.csv'!r}, '--pii-fields', 'name', '--output', {destination + '.csv'!r}]); "
+            "from gdpr_obfuscator.bulk import obfuscate_prefix; "
+            f"assert obfuscate_prefix({location!r}, {destination!r}, {{'pii_fields': ['name']}}).processed == 1"
+        )
+
+        assert (tmp_path / "out.csv").read_bytes() == b"id,name\r\n1,***\r\n"
+        assert (tmp_path / "out" / "a.csv").read_bytes() == b"id,name\r\n1,***\r\n"
+        assert "boto3" not in modules
+
+    def test_the_command_line_loads_argparse(self):
+        modules = loaded_modules("import gdpr_obfuscator.__main__")
+
+        assert "argparse" in modules
@@ -0,0 +1,158 @@
+import pytest
+import bz2
+import gzip
+import importlib.util
+import io
+import json
+import tracemalloc
+from gdpr_obfuscator.batch import obfuscate_many
+from gdpr_obfuscator.compression import (
+    DecompressingReader,
+    compress_chunks,
+    detect_magic,
+    split_extension,
+)
+from gdpr_obfuscator.obfuscator import Obfuscator
+
+
+BUCKET_NAME = "my-ingestion-bucket"
+CONTENT = "name,email_address,city\nAna,a@x.com,Zürich\nBob,b@x.com,Leeds\n".encode("utf-8")
+OBFUSCATED = "name,email_address,city\r\n***,a@x.com,Zürich\r\n***,b@x.com,Leeds\r\n".encode("utf-8")
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    return b"".join(compress_chunks([data], codec))
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    return DecompressingReader(io.BytesIO(data), codec, block_size=7).read()
+
+
+CODECS = [
+    "gzip",
+    "bz2",
+    pytest.param(
+        "zstd",
+        marks=pytest.mark.skipif(
+            importlib.util.find_spec("zstandard") is None, reason="zstandard is not installed"
+        ),
+    ),
+]
+
+
+class TestCompression:
+
+    def test_split_extension(self):
+        assert split_extension("s3://bucket/file.csv.gz") == ("s3://bucket/file.csv", "gzip")
+        assert split_extension("file.jsonl.ZST") == ("file.jsonl", "zstd")
+        assert split_extension("file.csv") == ("file.csv", None)
+
+    @pytest.mark.parametrize("codec", CODECS)
+    def test_round_trip_and_magic_bytes(self, codec):
+        compressed = compress(CONTENT, codec)
+
+        assert detect_magic(compressed[:4]) == codec
+        assert decompress(compressed, codec) == CONTENT
+
+    def test_concatenated_gzip_members_are_all_read(self):
+        data = gzip.compress(b"a,b\n") + gzip.compress(b"1,2\n")
+        assert decompress(data, "gzip") == b"a,b\n1,2\n"
+
+    @pytest.mark.parametrize("codec", CODECS)
+    def test_concatenated_streams_are_read_in_small_pieces(self, codec):
+        data = compress(CONTENT * 500, codec) + compress(CONTENT, codec)
+        reader = DecompressingReader(io.BytesIO(data), codec, block_size=100)
+
+        pieces = iter(lambda: reader.read(33), b"")
+        assert b"".join(pieces) == CONTENT * 501
+
+    @pytest.mark.parametrize("codec", CODECS)
+    def test_memory_stays_bounded_on_highly_compressed_streams(self, codec):
+        data = compress(b"1,Ana,a@x.com\n" * 1_500_000, codec)
+        reader = DecompressingReader(io.BytesIO(data), codec)
+
+        tracemalloc.start()
+        try:
+            size = sum(len(piece) for piece in iter(lambda: reader.read(64 * 1024), b""))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        assert size == 21_000_000
+        assert peak < 8 * 1024 * 1024
+
+    def test_truncated_stream_raises_value_error(self):
+        with pytest.raises(ValueError, match="truncated"):
+            decompress(gzip.compress(CONTENT)[:-10], "gzip")
+
+
+class TestCompressedFiles:
+
+    @pytest.mark.parametrize("codec, extension", [("gzip", ".gz"), ("bz2", ".bz2")])
+    def test_output_keeps_the_codec_of_the_input(self, tmp_path, codec, extension):
+        path = tmp_path / f"file.csv{extension}"
+        path.write_bytes(compress(CONTENT, codec))
+        obfuscator = Obfuscator(json.dumps({"file_to_obfuscate": str(path), "pii_fields": ["name"]}))
+
+        output = b"".join(obfuscator.obfuscate_stream(chunk_size=16))
+
+        assert obfuscator.output_compression == codec
+        assert decompress(output, codec) == OBFUSCATED
+
+    def test_compression_is_detected_from_magic_bytes(self, s3_client):
+        s3_client.put_object(Bucket=BUCKET_NAME, Key="export", Body=gzip.compress(CONTENT))
+        obfuscator = Obfuscator(
+            json.dumps(
+                {
+                    "file_to_obfuscate": f"s3://{BUCKET_NAME}/export",
+                    "pii_fields": ["name"],
+                    "output_compression": "bz2",
+                    "compression_level": 1,
+                }
+            )
+        )
+
+        output = b"".join(obfuscator.obfuscate_stream())
+
+        assert obfuscator.input_compression == "gzip"
+        assert bz2.decompress(output) == OBFUSCATED
+
+    def test_output_compression_can_be_disabled(self, tmp_path):
+        path = tmp_path / "file.jsonl.gz"
+        path.write_bytes(gzip.compress(b'{"name": "Ana"}\n'))
+        obfuscator = Obfuscator(
+            json.dumps({"file_to_obfuscate": str(path), "pii_fields": ["name"], "output_compression": "none"})
+        )
+
+        assert obfuscator.file_format == "jsonl"
+        assert b"".join(obfuscator.obfuscate_stream()) == b'{"name": "***"}\n'
+        assert obfuscator.obfuscate().getvalue() == '{"name": "***"}\n'
+
+    def test_unsupported_codec_is_rejected(self):
+        with pytest.raises(ValueError, match="The compression 'lzma' is not supported"):
+            Obfuscator('{"file_to_obfuscate": "data/simple.csv", "output_compression": "lzma"}')
+
+    @pytest.mark.parametrize(
+        "file_name, options",
+        [
+            ("file.csv.gz", {"compression_level": "9"}),
+            ("file.csv.gz", {"compression_level": 42}),
+            ("file.csv.gz", {"compression_level": -5}),
+            ("file.csv.gz", {"compression_level": True}),
+            ("file.csv", {"output_compression": "bz2", "compression_level": 0}),
+            ("file.csv", {"output_compression": "zstd", "compression_level": 23}),
+            ("export", {"compression_level": 19}),
+        ],
+    )
+    def test_invalid_compression_levels_are_rejected_before_any_output(self, tmp_path, file_name, options):
+        path = tmp_path / file_name
+        path.write_bytes(gzip.compress(CONTENT))
+        output = tmp_path / "out"
+        request = {"file_to_obfuscate": str(path), "pii_fields": ["name"], "output": str(output), **options}
+
+        with pytest.raises(ValueError, match="compression level"):
+            Obfuscator(json.dumps(request))
+        [result] = obfuscate_many([request])
+
+        assert isinstance(result.error, ValueError)
+        assert not output.exists()
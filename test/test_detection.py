@@ -0,0 +1,117 @@
+import pytest
+import json
+from gdpr_obfuscator.obfuscator import Obfuscator
+from gdpr_obfuscator.detection import (
+    SchemaRegistry,
+    detect_column,
+    detect_pii_fields,
+    sample_csv,
+    sample_jsonl,
+    schema_fingerprint,
+)
+
+
+class TestDetection:
+
+    @pytest.mark.parametrize(
+        "name, kind",
+        [
+            ("surname", "header:name"),
+            ("firstName", "header:name"),
+            ("Email Address", "header:email"),
+            ("mobile_number", "header:phone"),
+            ("customer.date_of_birth", "header:date_of_birth"),
+            ("file_name", None),
+            ("id", None),
+        ],
+    )
+    def test_columns_are_detected_by_name(self, name, kind):
+        assert detect_column(name, []) == kind
+
+    @pytest.mark.parametrize(
+        "values, kind",
+        [
+            (["ana@x.com", "bob@example.co.uk", ""], "email"),
+            (["07700 900123", "+44 7700 900456"], "phone"),
+            (["SW1A 1AA", "m1 1ae"], "postcode"),
+            (["AB123456C", "CE 12 34 56 D"], "ni_number"),
+            (["0123456", "2024-03-17", "12345678901"], None),
+            (["ana@x.com", "no", "no", "no"], None),
+        ],
+    )
+    def test_columns_are_detected_by_value(self, values, kind):
+        assert detect_column("contact", values) == kind
+
+    def test_samples_are_bounded_and_skip_the_unfinished_record(self):
+        head = b'id,contact\n1,a@x.com\n2,"b@x.com"\n3,c@x'
+
+        assert sample_csv(head, complete=False) == {"id": ["1", "2"], "contact": ["a@x.com", "b@x.com"]}
+        assert sample_csv(head, complete=True, max_rows=1) == {"id": ["1"], "contact": ["a@x.com"]}
+
+    def test_json_documents_are_sampled_by_key_path(self):
+        head = b'{"id": 1, "user": {"contact": "a@x.com"}, "tags": [{"phone": null}]}\n{"id": 2'
+
+        columns = sample_jsonl(head, complete=False)
+
+        assert columns == {"id": ["1"], "user.contact": ["a@x.com"], "tags.phone": []}
+        assert detect_pii_fields(columns) == {"user.contact": "email", "tags.phone": "header:phone"}
+
+
+class TestDetectPii:
+
+    def test_detected_fields_are_masked_with_the_listed_ones(self, tmp_path):
+        path = tmp_path / "file.csv"
+        path.write_bytes(b"id,customer,contact,notes\n1,Ana,a@x.com,hi\n2,Bob,b@x.com,yo\n")
+        request = {"file_to_obfuscate": str(path), "pii_fields": ["customer"], "detect_pii": True}
+        obfuscator = Obfuscator(json.dumps(request), schema_registry=SchemaRegistry())
+
+        output = b"".join(obfuscator.obfuscate_stream())
+
+        assert output == b"id,customer,contact,notes\r\n1,***,***,hi\r\n2,***,***,yo\r\n"
+        assert obfuscator.pii_fields == ["customer", "contact"]
+
+    def test_detection_is_off_by_default(self, tmp_path):
+        path = tmp_path / "file.csv"
+        path.write_bytes(b"id,email\n1,a@x.com\n")
+        obfuscator = Obfuscator(json.dumps({"file_to_obfuscate": str(path)}))
+
+        assert b"".join(obfuscator.obfuscate_stream()) == b"id,email\r\n1,a@x.com\r\n"
+
+    def test_files_with_a_known_header_skip_the_detection(self, tmp_path):
+        registry = SchemaRegistry(str(tmp_path / "registry.json"))
+        registry.put(schema_fingerprint("csv", ["id", "code"]), ["id", "code"], {"code": "postcode"})
+        registry.save()
+        path = tmp_path / "file.csv"
+        path.write_bytes(b"id,code\n1,not a postcode\n")
+        request = {"file_to_obfuscate": str(path), "detect_pii": True}
+
+        obfuscator = Obfuscator(json.dumps(request), schema_registry=SchemaRegistry(registry.location))
+
+        assert b"".join(obfuscator.obfuscate_stream()) == b"id,code\r\n1,***\r\n"
+
+    def test_new_headers_are_added_to_the_registry(self, tmp_path):
+        path = tmp_path / "file.jsonl"
+        path.write_bytes(b'{"id": 1, "phone": "07700 900123"}\n')
+        registry = SchemaRegistry()
+        request = {"file_to_obfuscate": str(path), "detect_pii": True}
+
+        output = b"".join(Obfuscator(json.dumps(request), schema_registry=registry).obfuscate_stream())
+
+        assert json.loads(output) == {"id": 1, "phone": "***"}
+        assert registry.get(schema_fingerprint("jsonl", ["id", "phone"])) == {"phone": "header:phone"}
+
+    def test_header_only_files_are_not_added_to_the_registry(self, tmp_path):
+        registry = SchemaRegistry()
+        (tmp_path / "empty.csv").write_bytes(b"id,contact\n")
+        (tmp_path / "full.csv").write_bytes(b"id,contact\n1,ana@example.com\n")
+
+        for name in ("empty.csv", "full.csv"):
+            request = {"file_to_obfuscate": str(tmp_path / name), "detect_pii": True}
+            output = b"".join(Obfuscator(json.dumps(request), schema_registry=registry).obfuscate_stream())
+
+        assert output == b"id,contact\r\n1,***\r\n"
+        assert registry.get(schema_fingerprint("csv", ["id", "contact"])) == {"contact": "email"}
+
+    def test_detect_pii_must_be_a_boolean(self):
+        with pytest.raises(ValueError, match="'detect_pii' must be true or false"):
+            Obfuscator(json.dumps({"file_to_obfuscate": "file.csv", "detect_pii": "yes"}))
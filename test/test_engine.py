@@ -0,0 +1,115 @@
+import pytest
+import io
+from gdpr_obfuscator.engine import (
+    compile_plan,
+    is_unquoted,
+    obfuscate_csv,
+    obfuscate_csv_stream,
+    obfuscate_unquoted,
+    resolve_pii_indices,
+)
+from gdpr_obfuscator.transforms import Drop, Null, PartialMask
+
+
+def run(content: str, pii_fields: list) -> str:
+    lines = io.StringIO(content, newline="")
+    return "".join(obfuscate_csv(lines, pii_fields, 1024))
+
+
+class TestEngine:
+
+    def test_resolve_pii_indices_skips_missing_columns(self):
+        assert resolve_pii_indices(["id", "name", "email"], ["email", "phone", "name"]) == [1, 2]
+
+    def test_only_pii_columns_are_replaced(self):
+        output = run("id,name,email\n1,Ana,a@x.com\n", ["name", "phone"])
+        assert output == "id,name,email\r\n1,***,a@x.com\r\n"
+
+    def test_blank_lines_are_dropped_and_short_rows_padded(self):
+        output = run("id,name,email\n\n1\n", ["email"])
+        assert output == "id,name,email\r\n1,,***\r\n"
+
+    def test_quoted_fields_are_preserved(self):
+        output = run('id,name,notes\n1,"Smith, John","a ""b""\nc"\n', ["name"])
+        assert output == 'id,name,notes\r\n1,***,"a ""b""\nc"\r\n'
+
+    def test_empty_input_produces_no_output(self):
+        assert run("", ["name"]) == ""
+
+
+class TestRowPlan:
+
+    def test_plan_applies_each_column_spec(self):
+        plan = compile_plan(
+            ["id", "name", "card", "notes", "email"],
+            ["name", "card", "notes", "email"],
+            {"card": PartialMask(2), "notes": Drop(), "email": Null()},
+        )
+
+        assert plan.header == ["id", "name", "card", "email"]
+        assert plan.pii_cells == 4
+        assert plan.row(["1", "Ana", "4111", "hi", "a@x.com", "extra"]) == ["1", "***", "**11", "", "extra"]
+        assert plan.encoded_row([b"1", b"Ana", b"4111", b"hi", b"a@x.com"]) == [b"1", b"***", b"**11", b""]
+
+    def test_plans_are_shared_by_files_with_the_same_header(self):
+        first = compile_plan(["id", "name"], ["name"], {"name": PartialMask(1)})
+        second = compile_plan(["id", "name"], ["name"], {"name": PartialMask(1)})
+
+        assert first is second
+        assert compile_plan(["id", "name"], ["id"]) is not first
+
+    @pytest.mark.parametrize("chunk_size", [1, 16, 4096])
+    def test_dropped_columns_match_on_both_paths(self, chunk_size):
+        content = b"id,name,email\n1,Ana,a@x.com\n\n2\n"
+        transforms = {"email": Drop()}
+
+        def stream(fast_path):
+            chunks = obfuscate_csv_stream(
+                io.BytesIO(content), ["name", "email"], chunk_size, fast_path, transforms
+            )
+            return b"".join(chunks)
+
+        assert stream(True) == stream(False) == b"id,name\r\n1,***\r\n2,***\r\n"
+
+
+def run_stream(content: bytes, pii_fields: list, chunk_size: int, fast_path: bool = True) -> bytes:
+    return b"".join(obfuscate_csv_stream(io.BytesIO(content), pii_fields, chunk_size, fast_path))
+
+
+class TestFastPath:
+
+    def test_is_unquoted(self):
+        assert is_unquoted(b"a,b\r\n1,2\n")
+        assert not is_unquoted(b'a,b\n1,"2"\n')
+        assert not is_unquoted(b"a,b\r1,2\n")
+
+    def test_obfuscate_unquoted_matches_the_csv_writer(self):
+        records = b"1,Ana,a@x.com\r\n\n2\n3,Bob,b@x.com,extra\n"
+        assert obfuscate_unquoted(records, compile_plan(["id", "name", "email"], ["name"])) == (
+            b"1,***,a@x.com\r\n2,***,\r\n3,***,b@x.com,extra\r\n"
+        )
+
+    @pytest.mark.parametrize("chunk_size", [1, 5, 64, 4096])
+    @pytest.mark.parametrize(
+        "content",
+        [
+            "id,name,email\n1,José,j@x.com\r\n\n2,Bob\n3,Zoë,z@x.com",
+            "id,name,email\n1,Ana,a@x.com\n2,\"Smith, John\",s@x.com\n3,Bob,b@x.com\n",
+            "id,name\n",
+            "id,name",
+            "\nid,name\n1,Ana\n",
+            "",
+        ],
+    )
+    def test_fast_path_output_matches_the_csv_parser(self, content, chunk_size):
+        data = content.encode("utf-8")
+        expected = run_stream(data, ["name"], chunk_size, fast_path=False)
+
+        assert run_stream(data, ["name"], chunk_size) == expected
+        assert expected == run(content, ["name"]).encode("utf-8")
+
+    def test_falls_back_to_the_parser_when_a_quote_shows_up(self):
+        content = b'id,name\n1,Ana\n2,"Smith, John"\n3,Bob\n'
+        chunks = list(obfuscate_csv_stream(io.BytesIO(content), ["name"], 8))
+
+        assert b"".join(chunks) == b"id,name\r\n1,***\r\n2,***\r\n3,***\r\n"
@@ -0,0 +1,95 @@
+import pytest
+import io
+import json
+from gdpr_obfuscator.obfuscator import Obfuscator
+from gdpr_obfuscator.jsonl import compile_paths, obfuscate_document, obfuscate_jsonl_stream
+from gdpr_obfuscator.transforms import Drop, Null
+
+
+def run(content: str, pii_fields: list, chunk_size: int = 1024) -> list:
+    source = io.BytesIO(content.encode("utf-8"))
+    output = b"".join(obfuscate_jsonl_stream(source, pii_fields, chunk_size)).decode("utf-8")
+    return output.splitlines()
+
+
+class TestJsonLines:
+
+    def test_top_level_and_nested_keys_are_obfuscated(self):
+        document = {
+            "name": "Ana",
+            "address": {"postcode": "AB1 2CD", "city": "Leeds"},
+            "contacts": [{"email": "a@x.com"}, {"email": "b@x.com"}],
+        }
+
+        replaced = obfuscate_document(
+            document, compile_paths(["name", "address.postcode", "contacts.email", "phone"])
+        )
+
+        assert replaced == 4
+        assert document == {
+            "name": "***",
+            "address": {"postcode": "***", "city": "Leeds"},
+            "contacts": [{"email": "***"}, {"email": "***"}],
+        }
+
+    def test_literal_dotted_keys_take_precedence(self):
+        document = {"user.name": "Ana", "user": {"name": "Bob"}}
+
+        obfuscate_document(document, compile_paths(["user.name"]))
+
+        assert document == {"user.name": "***", "user": {"name": "Bob"}}
+
+    def test_null_and_dropped_keys(self):
+        document = {"name": "Ana", "user.email": "a@x.com", "address": {"postcode": "AB1 2CD"}}
+        transforms = {"name": Null(), "user.email": Drop(), "address.postcode": Drop()}
+
+        replaced = obfuscate_document(
+            document, compile_paths(["name", "user.email", "address.postcode"]), transforms
+        )
+
+        assert replaced == 3
+        assert document == {"name": None, "address": {}}
+
+    def test_lines_without_pii_are_copied_unchanged(self):
+        content = '{"id": 1,  "city": "Zürich"}\n\n{"id": 2, "name": "Zoë"}\n'
+
+        assert run(content, ["name"], chunk_size=4) == [
+            '{"id": 1,  "city": "Zürich"}',
+            '{"id": 2, "name": "***"}',
+        ]
+
+    def test_escaped_keys_are_found(self):
+        assert run('{"\\u006eame": "Ana"}', ["name"]) == ['{"name": "***"}']
+
+    def test_invalid_lines_raise_value_error(self):
+        with pytest.raises(ValueError, match="Invalid JSON on line 2"):
+            run('{"name": "Ana"}\n{"name": \n', ["name"])
+
+
+class TestJsonLinesFormat:
+
+    def test_format_is_detected_from_the_extension(self, tmp_path):
+        path = tmp_path / "people.jsonl"
+        path.write_text('{"name": "Ana", "age": 30}\n')
+
+        obfuscator = Obfuscator(json.dumps({"file_to_obfuscate": str(path), "pii_fields": ["name"]}))
+
+        assert obfuscator.file_format == "jsonl"
+        assert obfuscator.obfuscate().getvalue() == '{"name": "***", "age": 30}\n'
+
+    def test_explicit_format_wins_over_the_extension(self, tmp_path):
+        path = tmp_path / "people.txt"
+        path.write_text('{"name": "Ana"}\n')
+
+        obfuscator = Obfuscator(
+            json.dumps({"file_to_obfuscate": str(path), "pii_fields": ["name"], "format": "jsonl"})
+        )
+
+        assert obfuscator.obfuscate().getvalue() == '{"name": "***"}\n'
+
+    def test_csv_remains_the_default_format(self):
+        assert Obfuscator('{"file_to_obfuscate": "data/simple.csv"}').file_format == "csv"
+
+    def test_unsupported_format_is_rejected(self):
+        with pytest.raises(ValueError, match="The format 'xml' is not supported"):
+            Obfuscator('{"file_to_obfuscate": "data/simple.csv", "format": "xml"}')
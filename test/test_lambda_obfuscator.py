@@ -0,0 +1,127 @@
+import pytest
+import json
+from gdpr_obfuscator.lambda_obfuscator import lambda_handler
+
+
+BUCKET_NAME = "my-ingestion-bucket"
+
+
+@pytest.fixture(scope="function")
+def s3_client(s3_client):
+    for key in ["a.csv", "b.csv", "with space.csv"]:
+        s3_client.put_object(
+            Bucket=BUCKET_NAME, Key=key, Body="name,email_address,age\nAna,a@x.com,30\n"
+        )
+    return s3_client
+
+
+def s3_record(key: str) -> dict:
+    return {"s3": {"bucket": {"name": BUCKET_NAME}, "object": {"key": key}}}
+
+
+def read(s3_client, key: str) -> bytes:
+    return s3_client.get_object(Bucket=BUCKET_NAME, Key=key)["Body"].read()
+
+
+OBFUSCATED = b"name,email_address,age\r\n***,***,30\r\n"
+
+
+class TestLambdaHandler:
+
+    def test_direct_invocation(self, s3_client):
+        response = lambda_handler(
+            {"file_to_obfuscate": f"s3://{BUCKET_NAME}/a.csv", "pii_fields": ["name"]}, None
+        )
+
+        assert response == {"statusCode": 200, "body": "File obfuscated successfully"}
+        assert read(s3_client, "a.csv") == b"name,email_address,age\r\n***,a@x.com,30\r\n"
+
+    def test_direct_invocation_without_file(self):
+        assert lambda_handler({}, None)["statusCode"] == 500
+
+    def test_every_record_of_an_s3_event_is_processed(self, s3_client):
+        event = {"Records": [s3_record("a.csv"), s3_record("b.csv"), s3_record("with+space.csv")]}
+
+        response = lambda_handler(event, None)
+
+        assert response["statusCode"] == 200
+        assert [result["statusCode"] for result in json.loads(response["body"])] == [200, 200, 200]
+        for key in ["a.csv", "b.csv", "with space.csv"]:
+            assert read(s3_client, key) == OBFUSCATED
+
+    def test_failed_records_are_reported_individually(self, s3_client):
+        event = {"Records": [s3_record("a.csv"), s3_record("missing.csv")]}
+
+        response = lambda_handler(event, None)
+
+        results = json.loads(response["body"])
+        assert response["statusCode"] == 400
+        assert [result["statusCode"] for result in results] == [200, 400]
+        assert results[1]["file"] == f"s3://{BUCKET_NAME}/missing.csv"
+        assert read(s3_client, "a.csv") == OBFUSCATED
+
+    def test_sqs_batch_reports_batch_item_failures(self, s3_client):
+        def message(message_id, *keys):
+            return {
+                "eventSource": "aws:sqs",
+                "messageId": message_id,
+                "body": json.dumps({"Records": [s3_record(key) for key in keys]}),
+            }
+
+        event = {
+            "Records": [
+                message("m1", "a.csv"),
+                message("m2", "b.csv", "missing.csv"),
+                {"eventSource": "aws:sqs", "messageId": "m3", "body": '{"Event": "s3:TestEvent"}'},
+            ]
+        }
+
+        response = lambda_handler(event, None)
+
+        assert response == {"batchItemFailures": [{"itemIdentifier": "m2"}]}
+        assert read(s3_client, "a.csv") == OBFUSCATED
+        assert read(s3_client, "b.csv") == OBFUSCATED
+
+    def test_sqs_messages_that_are_not_notifications_fail_alone(self, s3_client):
+        event = {
+            "Records": [
+                {"eventSource": "aws:sqs", "messageId": "m1", "body": "not json"},
+                {"eventSource": "aws:sqs", "messageId": "m2", "body": '{"Records": [{"s3": {}}]}'},
+                {"eventSource": "aws:sqs", "messageId": "m3", "body": "[1, 2]"},
+                {"eventSource": "aws:sqs", "messageId": "m4", "body": json.dumps({"Records": [s3_record("a.csv")]})},
+            ]
+        }
+
+        response = lambda_handler(event, None)
+
+        assert response == {"batchItemFailures": [{"itemIdentifier": m} for m in ("m1", "m2", "m3")]}
+        assert read(s3_client, "a.csv") == OBFUSCATED
+
+    def test_warm_invocations_reuse_the_cached_work(self, s3_client, monkeypatch, caplog):
+        monkeypatch.setattr("gdpr_obfuscator.lambda_obfuscator.METRICS_MODE", "log")
+
+        with caplog.at_level("INFO"):
+            lambda_handler({"Records": [s3_record("a.csv")]}, None)
+            lambda_handler({"Records": [s3_record("b.csv")]}, None)
+
+        stats = [
+            json.loads(record.getMessage())["caches"]
+            for record in caplog.records
+            if record.getMessage().startswith('{"caches"')
+        ]
+        assert len(stats) == 2
+        assert stats[1]["request_configs"]["hits"] > stats[0]["request_configs"]["hits"]
+        assert stats[1]["row_plans"]["hits"] > stats[0]["row_plans"]["hits"]
+        assert stats[1]["s3_clients"]["hit_rate"] > 0
+
+    def test_metrics_are_printed_as_emf_records(self, s3_client, monkeypatch, capsys):
+        monkeypatch.setattr("gdpr_obfuscator.lambda_obfuscator.METRICS_MODE", "emf")
+
+        lambda_handler({"Records": [s3_record("a.csv")]}, None)
+
+        record = json.loads(capsys.readouterr().out)
+        assert record["_aws"]["CloudWatchMetrics"][0]["Namespace"] == "GDPRObfuscator"
+        assert record["file"] == f"s3://{BUCKET_NAME}/a.csv"
+        assert record["rows"] == 1
+        assert record["pii_cells"] == 2
+        assert "publish_time" in record
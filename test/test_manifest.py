@@ -0,0 +1,113 @@
+import json
+from gdpr_obfuscator.batch import obfuscate_many
+from gdpr_obfuscator.manifest import Manifest, config_hash, obfuscate_incrementally
+from gdpr_obfuscator.obfuscator import Obfuscator
+
+
+BUCKET_NAME = "my-ingestion-bucket"
+
+
+class TestManifest:
+
+    def test_config_hash_ignores_key_order_and_other_keys(self):
+        first = {"file_to_obfuscate": "a.csv", "pii_fields": ["name"], "output": "out.csv"}
+        second = {"output": "out.csv", "pii_fields": ["name"], "file_to_obfuscate": "b.csv"}
+
+        assert config_hash(first) == config_hash(second)
+        assert config_hash(first) != config_hash({**first, "pii_fields": ["email"]})
+
+    def test_manifest_is_saved_and_loaded(self, tmp_path):
+        location = str(tmp_path / "manifest.json")
+        manifest = Manifest(location)
+        manifest.put("a.csv", {"etag": "1", "size": 2, "config": "c"})
+        manifest.save()
+
+        assert Manifest(location).get("a.csv") == {"etag": "1", "size": 2, "config": "c"}
+        assert Manifest(location).get("b.csv") is None
+
+
+class TestObfuscateIncrementally:
+
+    def test_unchanged_file_is_skipped(self, tmp_path):
+        source = tmp_path / "in.csv"
+        source.write_bytes(b"id,name\n1,Ana\n")
+        request = {"file_to_obfuscate": str(source), "pii_fields": ["name"], "output": str(tmp_path / "out.csv")}
+        manifest = Manifest(str(tmp_path / "manifest.json"))
+
+        assert obfuscate_incrementally(request, manifest)[0] == "processed"
+        assert obfuscate_incrementally(request, manifest) == ("skipped", 0)
+        assert obfuscate_incrementally({**request, "pii_fields": ["id"]}, manifest)[0] == "processed"
+
+    def test_appended_records_are_added_to_the_output(self, tmp_path):
+        source = tmp_path / "in.csv"
+        source.write_bytes(b'id,name,notes\n1,Ana,"a, b"\n')
+        output = tmp_path / "out.csv"
+        request = {"file_to_obfuscate": str(source), "pii_fields": ["name"], "output": str(output), "append": True}
+        manifest = Manifest(str(tmp_path / "manifest.json"))
+        obfuscate_incrementally(request, manifest)
+
+        with open(source, "ab") as source_file:
+            source_file.write(b"2,Bob,plain\n")
+        status, written = obfuscate_incrementally(request, manifest)
+
+        assert status == "appended"
+        assert written == len(b"2,***,plain\r\n")
+        assert output.read_bytes() == b'id,name,notes\r\n1,***,"a, b"\r\n2,***,plain\r\n'
+
+    def test_records_appended_during_a_run_are_left_to_the_next_one(self, tmp_path, monkeypatch):
+        source = tmp_path / "in.csv"
+        source.write_bytes(b"id,name\n1,Ana\n")
+        output = tmp_path / "out.csv"
+        request = {"file_to_obfuscate": str(source), "pii_fields": ["name"], "output": str(output), "append": True}
+        manifest = Manifest(str(tmp_path / "manifest.json"))
+        source_state = Obfuscator.source_state
+
+        def growing_source_state(obfuscator):
+            state = source_state.fget(obfuscator)
+            with open(source, "ab") as source_file:
+                source_file.write(b"2,Bob\n")
+            return state
+
+        monkeypatch.setattr(Obfuscator, "source_state", property(growing_source_state))
+        assert obfuscate_incrementally(request, manifest)[0] == "processed"
+        assert obfuscate_incrementally(request, manifest)[0] == "appended"
+        monkeypatch.undo()
+        assert obfuscate_incrementally(request, manifest)[0] == "appended"
+
+        assert output.read_bytes() == b"id,name\r\n1,***\r\n2,***\r\n2,***\r\n"
+        assert source.read_bytes() == b"id,name\n1,Ana\n2,Bob\n2,Bob\n"
+
+    def test_rewritten_file_is_processed_from_scratch(self, tmp_path):
+        source = tmp_path / "in.jsonl"
+        source.write_bytes(b'{"name": "Ana"}\n')
+        output = tmp_path / "out.jsonl"
+        request = {"file_to_obfuscate": str(source), "pii_fields": ["name"], "output": str(output), "append": True}
+        manifest = Manifest(str(tmp_path / "manifest.json"))
+        obfuscate_incrementally(request, manifest)
+
+        source.write_bytes(b'{"name": "Bob"}\n{"name": "Eve", "id": 2}\n')
+
+        assert obfuscate_incrementally(request, manifest)[0] == "processed"
+        assert output.read_bytes().count(b"\n") == 2
+
+    def test_s3_files_are_appended_and_skipped_in_a_batch(self, s3_client):
+        s3_client.put_object(Bucket=BUCKET_NAME, Key="in.csv", Body=b"id,name\n1,Ana\n")
+        request = {
+            "file_to_obfuscate": f"s3://{BUCKET_NAME}/in.csv",
+            "pii_fields": ["name"],
+            "output": f"s3://{BUCKET_NAME}/out.csv",
+            "append": True,
+        }
+        manifest_url = f"s3://{BUCKET_NAME}/manifest.json"
+
+        obfuscate_many([request], manifest=Manifest(manifest_url, s3_client))
+        s3_client.put_object(Bucket=BUCKET_NAME, Key="in.csv", Body=b"id,name\n1,Ana\n2,Bob\n")
+        appended = obfuscate_many([request], manifest=Manifest(manifest_url, s3_client))
+        skipped = obfuscate_many([request], manifest=Manifest(manifest_url, s3_client))
+
+        assert appended[0].status == "appended"
+        assert skipped[0].status == "skipped"
+        body = s3_client.get_object(Bucket=BUCKET_NAME, Key="out.csv")["Body"].read()
+        assert body == b"id,name\r\n1,***\r\n2,***\r\n"
+        saved = json.loads(s3_client.get_object(Bucket=BUCKET_NAME, Key="manifest.json")["Body"].read())
+        assert saved[request["file_to_obfuscate"]]["offset"] == len(b"id,name\n1,Ana\n2,Bob\n")
@@ -0,0 +1,91 @@
+import pytest
+import json
+import time
+from gdpr_obfuscator.batch import obfuscate_many
+from gdpr_obfuscator.metrics import Metrics, emf_document
+from gdpr_obfuscator.obfuscator import Obfuscator
+from gdpr_obfuscator.sinks import BytesSink
+
+
+BUCKET_NAME = "my-ingestion-bucket"
+CONTENT = b"name,email_address,city\nAna,a@x.com,Leeds\nBob,b@x.com,York\n\nCai,c@x.com,Hull\n"
+
+
+@pytest.fixture(scope="function")
+def s3_client(s3_client):
+    s3_client.put_object(Bucket=BUCKET_NAME, Key="file.csv", Body=CONTENT)
+    return s3_client
+
+
+class TestMetrics:
+
+    def test_nested_stages_are_excluded_from_their_parent(self):
+        metrics = Metrics()
+
+        with metrics.stage("outer"):
+            time.sleep(0.02)
+            with metrics.stage("inner"):
+                time.sleep(0.05)
+
+        assert 0.02 <= metrics.durations["outer"] < 0.05
+        assert metrics.durations["inner"] >= 0.05
+
+    @pytest.mark.parametrize("content", [CONTENT, CONTENT.replace(b"Leeds", b'"Leeds"')])
+    def test_obfuscation_counts_rows_cells_and_bytes(self, tmp_path, content):
+        path = tmp_path / "file.csv"
+        path.write_bytes(content)
+        metrics = Metrics()
+        obfuscator = Obfuscator(
+            json.dumps({"file_to_obfuscate": str(path), "pii_fields": ["name", "email_address"]}),
+            metrics=metrics,
+        )
+
+        with BytesSink() as sink:
+            written = obfuscator.obfuscate_to(sink, chunk_size=16)
+
+        assert metrics.counters == {
+            "bytes_in": len(content),
+            "bytes_out": written,
+            "rows": 3,
+            "pii_cells": 6,
+        }
+        assert set(metrics.durations) == {"validate", "open", "read", "obfuscate", "write"}
+
+    def test_jsonl_counts_replaced_values(self, tmp_path):
+        path = tmp_path / "file.jsonl"
+        path.write_text('{"name": "Ana", "tags": [{"email": "a"}, {"email": "b"}]}\n{"id": 1}\n')
+        metrics = Metrics()
+        request = {"file_to_obfuscate": str(path), "pii_fields": ["name", "tags.email"]}
+
+        Obfuscator(json.dumps(request), metrics=metrics).obfuscate()
+
+        assert metrics.counters["rows"] == 2
+        assert metrics.counters["pii_cells"] == 3
+
+    def test_batch_results_hold_the_metrics_of_s3_requests(self, s3_client):
+        request = {
+            "file_to_obfuscate": f"s3://{BUCKET_NAME}/file.csv",
+            "pii_fields": ["name"],
+            "output": f"s3://{BUCKET_NAME}/out.csv",
+        }
+
+        result = obfuscate_many([request], collect_metrics=True)[0]
+
+        assert result.ok
+        assert result.metrics.counters["rows"] == 3
+        assert {"open", "read", "obfuscate", "write", "publish"} <= set(result.metrics.durations)
+        assert obfuscate_many([request])[0].metrics is None
+
+    def test_emf_document(self):
+        metrics = Metrics()
+        metrics.count("rows", 3)
+        metrics.durations["read"] = 0.25
+
+        document = emf_document(metrics, "Obfuscator", {"FunctionName": "f"}, {"file": "a.csv"})
+
+        assert document["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["FunctionName"]]
+        assert {"Name": "read_time", "Unit": "Milliseconds"} in document["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+        assert document["FunctionName"] == "f"
+        assert document["file"] == "a.csv"
+        assert document["rows"] == 3
+        assert document["read_time"] == 250.0
@@ -1,26 +1,15 @@
 import pytest
+import bz2
+import gzip
 import os
 import boto3
 import json
 import csv
-from moto import mock_aws
+from gdpr_obfuscator.clients import create_s3_client, get_s3_client, set_s3_client
+from gdpr_obfuscator.cli import main
 from gdpr_obfuscator.obfuscator import Obfuscator
 
 
-@pytest.fixture(scope="class")
-def aws_credentials():
-    os.environ["AWS_ACCESS_KEY_ID"] = "test"
-    os.environ["AWS_SECRET_ACCESS_KEY"] = "test"
-    os.environ["AWS_SECURITY_TOKEN"] = "test"
-    os.environ["AWS_SESSION_TOKEN"] = "test"
-    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
-
-
-@pytest.fixture(scope="function")
-def s3_client(aws_credentials):
-    with mock_aws():
-        yield boto3.client("s3", region_name="eu-west-2")
-
 @pytest.fixture
 def empty_file(tmp_path):
     """
@@ -210,3 +199,278 @@ class TestObfuscator:
         for row in reader:
             for pii_field in pii_fields:
                 assert row[pii_field] == "***"
+
+
+class TestObfuscateStream:
+
+    def test_obfuscate_stream_matches_obfuscate(self):
+        json_string = json_string_with_valid_file("data/medium.csv", ["name"])
+        obfuscator = Obfuscator(json_string)
+
+        streamed = b"".join(obfuscator.obfuscate_stream()).decode("utf-8")
+
+        assert streamed == obfuscator.obfuscate().getvalue()
+
+    def test_obfuscate_stream_emits_several_chunks_on_row_boundaries(self):
+        json_string = json_string_with_valid_file("data/medium.csv", ["email_address"])
+        obfuscator = Obfuscator(json_string)
+
+        chunks = list(obfuscator.obfuscate_stream(chunk_size=8))
+
+        assert len(chunks) > 1
+        assert all(chunk.endswith(b"\r\n") for chunk in chunks)
+        assert b"".join(chunks) == (
+            b"name,email_address,age\r\nAlice,***,25\r\nBob,***,30\r\n"
+        )
+
+    def test_obfuscate_stream_decodes_s3_body_incrementally(self, s3_client):
+        bucket_name = "my-ingestion-bucket"
+        file_name = "unicode.csv"
+        s3_client.create_bucket(
+            Bucket=bucket_name,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        content = 'name,city\nJosé Núñez,Zürich\n"Ström, Åsa","Line\nbreak"\n'
+        s3_client.put_object(Bucket=bucket_name, Key=file_name, Body=content.encode())
+
+        json_string = json_string_with_valid_file(f"s3://{bucket_name}/{file_name}", ["name"])
+        obfuscator = Obfuscator(json_string)
+
+        # A tiny chunk size splits multi-byte characters across reads
+        streamed = b"".join(obfuscator.obfuscate_stream(chunk_size=3)).decode("utf-8")
+
+        assert list(csv.reader(streamed.splitlines(keepends=True))) == [
+            ["name", "city"],
+            ["***", "Zürich"],
+            ["***", "Line\nbreak"],
+        ]
+
+
+class TestS3Client:
+
+    def test_instances_share_the_process_wide_client(self, s3_client):
+        json_string = json_string_with_valid_s3_file(s3_client, "my-ingestion-bucket", "file.csv")
+
+        first = Obfuscator(json_string)
+        second = Obfuscator(json_string)
+
+        assert first._Obfuscator__get_s3_client() is s3_client
+        assert second._Obfuscator__get_s3_client() is s3_client
+
+    def test_injected_client_takes_precedence(self, s3_client):
+        json_string = json_string_with_valid_s3_file(s3_client, "my-ingestion-bucket", "file.csv")
+        other_client = boto3.client("s3", region_name="eu-west-2")
+
+        obfuscator = Obfuscator(json_string, s3_client=other_client)
+
+        assert obfuscator._Obfuscator__get_s3_client() is other_client
+
+    def test_create_s3_client_reads_its_settings_from_the_environment(self, monkeypatch):
+        monkeypatch.setenv("OBFUSCATOR_S3_MAX_POOL_CONNECTIONS", "7")
+        monkeypatch.setenv("OBFUSCATOR_S3_MAX_ATTEMPTS", "2")
+
+        client = create_s3_client(region_name="eu-west-2")
+
+        assert client.meta.config.max_pool_connections == 7
+        assert client.meta.config.retries["total_max_attempts"] == 2
+
+    def test_get_s3_client_is_cached(self, aws_credentials):
+        set_s3_client(None)
+        try:
+            assert get_s3_client() is get_s3_client()
+        finally:
+            set_s3_client(None)
+
+
+def count_s3_requests(s3_client) -> list:
+    operations = []
+    s3_client.meta.events.register(
+        "before-call.s3", lambda model, **kwargs: operations.append(model.name)
+    )
+    return operations
+
+
+class TestValidation:
+
+    def test_lazy_validation_fetches_the_file_with_a_single_request(self, s3_client):
+        json_string = json_string_with_valid_s3_file(s3_client, "my-ingestion-bucket", "file.csv")
+        operations = count_s3_requests(s3_client)
+
+        obfuscator = Obfuscator(json_string, lazy_validation=True)
+        obfuscator.obfuscate()
+
+        assert operations == ["GetObject"]
+
+    def test_lazy_validation_raises_value_error_for_a_missing_file(self, s3_client):
+        s3_client.create_bucket(
+            Bucket="my-ingestion-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        json_string = '{"file_to_obfuscate": "s3://my-ingestion-bucket/missing.csv"}'
+
+        obfuscator = Obfuscator(json_string, lazy_validation=True)
+
+        expected_message = "The file 's3://my-ingestion-bucket/missing.csv' does not exist or is not a valid file"
+        with pytest.raises(ValueError, match=expected_message):
+            obfuscator.obfuscate()
+
+    def test_validated_file_is_pinned_to_its_etag(self, s3_client):
+        json_string = json_string_with_valid_s3_file(s3_client, "my-ingestion-bucket", "file.csv")
+        obfuscator = Obfuscator(json_string)
+
+        s3_client.put_object(Bucket="my-ingestion-bucket", Key="file.csv", Body="changed data")
+
+        with pytest.raises(ValueError, match="has changed since it was validated"):
+            obfuscator.obfuscate()
+
+
+class TestPreflight:
+
+    def test_missing_fields_stop_the_file_after_a_single_ranged_read(self, s3_client):
+        s3_client.create_bucket(
+            Bucket="my-ingestion-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        body = "id,name\n" + "1,Ana\n" * 10_000
+        s3_client.put_object(Bucket="my-ingestion-bucket", Key="file.csv", Body=body)
+        json_string = json.dumps(
+            {
+                "file_to_obfuscate": "s3://my-ingestion-bucket/file.csv",
+                "pii_fields": ["name", "email_address"],
+                "on_missing_fields": "error",
+            }
+        )
+        obfuscator = Obfuscator(json_string, lazy_validation=True)
+        ranges = []
+        s3_client.meta.events.register(
+            "provide-client-params.s3.GetObject", lambda params, **kwargs: ranges.append(params.get("Range"))
+        )
+
+        with pytest.raises(ValueError, match="has no field email_address"):
+            obfuscator.obfuscate()
+
+        assert ranges == ["bytes=0-16383"]
+
+    def test_missing_fields_are_reported_for_compressed_json_lines(self, tmp_path):
+        path = tmp_path / "file.jsonl.gz"
+        path.write_bytes(gzip.compress(b'{"id": 1, "user": {"name": "Ana"}}\n{"id": 2, "email": "a@b.c"}\n'))
+        obfuscator = Obfuscator(
+            json.dumps({"file_to_obfuscate": str(path), "pii_fields": ["user.name", "email", "phone"]})
+        )
+
+        assert obfuscator.find_missing_fields() == ["phone"]
+
+    def test_missing_fields_are_reported_for_bz2_files_of_several_blocks(self, tmp_path):
+        # Random codes keep the first block, of 900 KB, well beyond the pre-flight read once compressed
+        rows = b"".join(b"%d,%s\n" % (index, os.urandom(12).hex().encode()) for index in range(50_000))
+        path = tmp_path / "file.csv.bz2"
+        path.write_bytes(bz2.compress(b"id,code\n" + rows))
+        obfuscator = Obfuscator(
+            json.dumps({"file_to_obfuscate": str(path), "pii_fields": ["code", "email"]})
+        )
+
+        assert obfuscator.find_missing_fields() == ["email"]
+        assert obfuscator.detect_pii_fields() == {}
+
+    def test_missing_fields_are_logged_as_a_warning(self, tmp_path, caplog):
+        path = tmp_path / "file.csv"
+        path.write_text("id,name\n1,Ana\n")
+        obfuscator = Obfuscator(
+            json.dumps({"file_to_obfuscate": str(path), "pii_fields": ["phone"], "on_missing_fields": "warn"})
+        )
+
+        assert obfuscator.obfuscate().getvalue() == "id,name\r\n1,Ana\r\n"
+        assert "has no field phone" in caplog.text
+
+    def test_header_beyond_the_first_bytes_is_malformed(self, tmp_path):
+        path = tmp_path / "file.csv"
+        path.write_text(",".join(f"column_{index}" for index in range(100)) + "\n1\n")
+        obfuscator = Obfuscator(json.dumps({"file_to_obfuscate": str(path), "pii_fields": ["name"]}))
+
+        with pytest.raises(ValueError, match="is not within its first 64 bytes"):
+            obfuscator.find_missing_fields(head_size=64)
+
+
+class TestCommandLine:
+
+    def test_globs_are_obfuscated_into_the_output_directory(self, tmp_path, capsys):
+        for index in range(3):
+            (tmp_path / f"file_{index}.csv").write_text(f"id,name\n{index},Ana\n")
+
+        main([str(tmp_path / "file_*.csv"), "--pii-fields", "name", "--output-dir", str(tmp_path / "out")])
+
+        assert (tmp_path / "out" / "file_2.csv").read_bytes() == b"id,name\r\n2,***\r\n"
+        summary = capsys.readouterr()
+        assert summary.out == ""
+        assert summary.err.count("processed: ") == 3
+
+    def test_globs_keep_the_path_relative_to_their_root(self, tmp_path, capsys):
+        for directory in ("a", "b"):
+            (tmp_path / "col" / directory).mkdir(parents=True)
+            (tmp_path / "col" / directory / "x.csv").write_text(f"id,name\n{directory},Ana\n")
+
+        main([str(tmp_path / "col" / "**" / "x.csv"), "--pii-fields", "name", "--output-dir", str(tmp_path / "out")])
+
+        assert (tmp_path / "out" / "a" / "x.csv").read_bytes() == b"id,name\r\na,***\r\n"
+        assert (tmp_path / "out" / "b" / "x.csv").read_bytes() == b"id,name\r\nb,***\r\n"
+
+    def test_files_with_the_same_output_are_rejected(self, tmp_path, capsys):
+        for directory in ("a", "b"):
+            (tmp_path / directory).mkdir()
+            (tmp_path / directory / "x.csv").write_text("id,name\n1,Ana\n")
+
+        with pytest.raises(SystemExit) as exit_info:
+            main(
+                [str(tmp_path / "a" / "x.csv"), str(tmp_path / "b" / "x.csv"), "--output-dir", str(tmp_path / "out")]
+            )
+
+        assert exit_info.value.code == 1
+        assert "would both be written to" in capsys.readouterr().err
+        assert not (tmp_path / "out" / "x.csv").exists()
+
+    def test_several_files_written_to_stdout_are_rejected(self, tmp_path, capsys):
+        requests = []
+        for name in ("a.csv", "b.csv"):
+            (tmp_path / name).write_text("id,name\n1,Ana\n")
+            requests.append(json.dumps({"file_to_obfuscate": str(tmp_path / name), "output": "-"}))
+
+        with pytest.raises(SystemExit) as exit_info:
+            main([*requests, "--pii-fields", "name"])
+
+        assert exit_info.value.code == 1
+        captured = capsys.readouterr()
+        assert "would both be written to stdout" in captured.err
+        assert captured.out == ""
+
+    def test_failed_file_gives_a_non_zero_exit_status(self, tmp_path, capsys):
+        (tmp_path / "file.csv").write_text("id,name\n1,Ana\n")
+        requests = tmp_path / "requests.jsonl"
+        requests.write_text(
+            json.dumps({"file_to_obfuscate": str(tmp_path / "missing.csv"), "output": str(tmp_path / "a.csv")})
+            + "\n"
+            + json.dumps({"file_to_obfuscate": str(tmp_path / "file.csv"), "output": str(tmp_path / "b.csv")})
+            + "\n"
+        )
+
+        with pytest.raises(SystemExit) as exit_info:
+            main(["--requests", str(requests)])
+
+        assert exit_info.value.code == 1
+        assert "failed: " in capsys.readouterr().err
+        assert (tmp_path / "b.csv").exists()
+
+    def test_output_may_be_the_input_file(self, tmp_path, capsys):
+        path = tmp_path / "same.csv"
+        path.write_text("id,name\n1,Ana\n")
+
+        main([str(path), "--pii-fields", "name", "--output", str(path)])
+
+        assert path.read_bytes() == b"id,name\r\n1,***\r\n"
+        assert "processed: " in capsys.readouterr().err
+
+    def test_single_request_is_streamed_to_stdout(self, capfd):
+        main(['{"file_to_obfuscate": "data/simple.csv", "pii_fields": ["name"]}'])
+
+        output = capfd.readouterr()
+        assert output.out == "name,email_address\r\n***,alice@example.com\r\n***,bob@example.com\r\n"
+        assert "-> stdout" in output.err
@@ -0,0 +1,108 @@
+import pytest
+import gzip
+from gdpr_obfuscator.obfuscator import Obfuscator
+from gdpr_obfuscator.parallel import (
+    first_record_end,
+    iter_record_ranges,
+    obfuscate_local_file,
+    obfuscate_ranges,
+    split_complete_records,
+)
+
+
+BUCKET_NAME = "my-ingestion-bucket"
+
+QUOTED_CSV = (
+    'id,name,notes,email_address\n'
+    '1,"Smith, John","line one\nline two",j.smith@email.com\n'
+    '2,Ana,"say ""hi""\nthen leave",ana@email.com\r\n'
+    '3,"Zoë ""Z"" Müller",,zoe@email.com\n'
+    '4,Bob,"",bob@email.com'
+).encode("utf-8")
+
+
+class TestRecordBoundaries:
+
+    def test_first_record_end_skips_newlines_inside_quotes(self):
+        data = b'"a\nb",c\nd,e\n'
+        assert first_record_end(data) == len(b'"a\nb",c\n')
+
+    def test_first_record_end_returns_none_without_a_complete_record(self):
+        assert first_record_end(b'a,"b\nc') is None
+
+    def test_split_complete_records_keeps_the_unfinished_record(self):
+        records, rest = split_complete_records(b'1,x\n2,"open\nquoted')
+        assert records == b"1,x\n"
+        assert rest == b'2,"open\nquoted'
+
+    def test_split_complete_records_with_escaped_quotes(self):
+        records, rest = split_complete_records(b'1,"a ""b""\nc"\n2,d')
+        assert records == b'1,"a ""b""\nc"\n'
+        assert rest == b"2,d"
+
+    def test_record_ranges_end_on_record_boundaries(self):
+        header_end = first_record_end(QUOTED_CSV)
+
+        ranges = list(iter_record_ranges(QUOTED_CSV, header_end, 10))
+
+        assert [QUOTED_CSV[start:end] for start, end in ranges] == [
+            b'1,"Smith, John","line one\nline two",j.smith@email.com\n',
+            b'2,Ana,"say ""hi""\nthen leave",ana@email.com\r\n',
+            '3,"Zoë ""Z"" Müller",,zoe@email.com\n'.encode("utf-8"),
+            b'4,Bob,"",bob@email.com',
+        ]
+
+
+class TestObfuscateRanges:
+
+    @pytest.mark.parametrize("range_size", [1, 7, 16, 1024])
+    def test_output_matches_the_sequential_stream(self, tmp_path, range_size):
+        path = tmp_path / "quoted.csv"
+        path.write_bytes(QUOTED_CSV)
+        obfuscator = Obfuscator(f'{{"file_to_obfuscate": "{path}", "pii_fields": ["name", "email_address"]}}')
+        expected = b"".join(obfuscator.obfuscate_stream())
+
+        def read_range(start, end):
+            return QUOTED_CSV[start : end + 1]
+
+        output = b"".join(
+            obfuscate_ranges(
+                read_range,
+                len(QUOTED_CSV),
+                ["name", "email_address"],
+                max_workers=2,
+                range_size=range_size,
+                max_connections=3,
+            )
+        )
+
+        assert output == expected
+
+    def test_obfuscate_parallel_reads_s3_ranges(self, s3_client):
+        s3_client.put_object(Bucket=BUCKET_NAME, Key="quoted.csv", Body=QUOTED_CSV)
+        obfuscator = Obfuscator(
+            f'{{"file_to_obfuscate": "s3://{BUCKET_NAME}/quoted.csv", "pii_fields": ["name"]}}'
+        )
+
+        output = b"".join(obfuscator.obfuscate_parallel(max_workers=2, range_size=20))
+
+        assert output == b"".join(obfuscator.obfuscate_stream())
+
+    @pytest.mark.parametrize("range_size", [1, 16, 1024])
+    def test_local_files_are_memory_mapped(self, tmp_path, range_size):
+        path = tmp_path / "quoted.csv"
+        path.write_bytes(QUOTED_CSV + b"\n5,Eve,plain,eve@email.com\n")
+        obfuscator = Obfuscator(f'{{"file_to_obfuscate": "{path}", "pii_fields": ["name"]}}')
+
+        output = b"".join(obfuscate_local_file(str(path), ["name"], max_workers=2, range_size=range_size))
+
+        assert output == b"".join(obfuscator.obfuscate_stream())
+        assert b"".join(obfuscator.obfuscate_parallel(max_workers=2)) == output
+
+    def test_obfuscate_parallel_rejects_compressed_local_files(self, tmp_path):
+        path = tmp_path / "file"
+        path.write_bytes(gzip.compress(QUOTED_CSV))
+        obfuscator = Obfuscator(f'{{"file_to_obfuscate": "{path}"}}')
+
+        with pytest.raises(ValueError, match="not available for compressed files"):
+            list(obfuscator.obfuscate_parallel())
@@ -0,0 +1,148 @@
+import pytest
+import io
+import json
+from gdpr_obfuscator.detection import SchemaRegistry
+from gdpr_obfuscator.obfuscator import Obfuscator
+from gdpr_obfuscator.parquet import RangeReader
+from gdpr_obfuscator.pseudonymise import Pseudonymiser
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+BUCKET_NAME = "my-ingestion-bucket"
+
+
+def parquet_bytes() -> bytes:
+    table = pa.table(
+        {
+            "student_id": pa.array([1, 2, 3, 4, 5], pa.int64()),
+            "name": pa.array(["Ana", "Bob", None, "Zoë", "Eve"]),
+            "email_address": pa.array(["a@x.com", "b@x.com", "c@x.com", "z@x.com", "e@x.com"]),
+            "graduation_date": pa.array([20240331] * 5, pa.int32()),
+        }
+    )
+    buffer = io.BytesIO()
+    pq.write_table(
+        table,
+        buffer,
+        row_group_size=2,
+        compression={"student_id": "zstd", "name": "gzip", "email_address": "snappy", "graduation_date": "none"},
+    )
+    return buffer.getvalue()
+
+
+def obfuscate(file_to_obfuscate: str, pii_fields: list) -> bytes:
+    obfuscator = Obfuscator(json.dumps({"file_to_obfuscate": file_to_obfuscate, "pii_fields": pii_fields}))
+    return b"".join(obfuscator.obfuscate_stream())
+
+
+class TestParquet:
+
+    def test_pii_columns_are_replaced_and_others_kept(self, tmp_path):
+        path = tmp_path / "students.parquet"
+        path.write_bytes(parquet_bytes())
+
+        output = pq.ParquetFile(io.BytesIO(obfuscate(str(path), ["name", "graduation_date", "phone"])))
+        table = output.read()
+
+        assert table.column("name").to_pylist() == ["***"] * 5
+        assert table.column("graduation_date").to_pylist() == [None] * 5
+        assert table.column("student_id").to_pylist() == [1, 2, 3, 4, 5]
+        assert table.column("email_address").to_pylist()[0] == "a@x.com"
+        assert table.schema.field("graduation_date").type == pa.int32()
+
+    def test_row_groups_and_compression_are_preserved(self, tmp_path):
+        path = tmp_path / "students.parquet"
+        path.write_bytes(parquet_bytes())
+
+        metadata = pq.ParquetFile(io.BytesIO(obfuscate(str(path), ["name"]))).metadata
+
+        assert metadata.num_row_groups == 3
+        assert [metadata.row_group(0).column(index).compression for index in range(4)] == [
+            "ZSTD",
+            "GZIP",
+            "SNAPPY",
+            "UNCOMPRESSED",
+        ]
+
+    def test_s3_file_is_read_with_ranges(self, s3_client):
+        s3_client.put_object(Bucket=BUCKET_NAME, Key="students.parquet", Body=parquet_bytes())
+
+        output = obfuscate(f"s3://{BUCKET_NAME}/students.parquet", ["email_address"])
+
+        table = pq.read_table(io.BytesIO(output))
+        assert table.column("email_address").to_pylist() == ["***"] * 5
+
+    def test_token_columns_get_one_token_per_value(self, tmp_path):
+        path = tmp_path / "students.parquet"
+        path.write_bytes(parquet_bytes())
+        pseudonymiser = Pseudonymiser("test-secret")
+        request = {
+            "file_to_obfuscate": str(path),
+            "pii_fields": ["name", "graduation_date"],
+            "transforms": {"name": "token", "graduation_date": "token"},
+        }
+        obfuscator = Obfuscator(json.dumps(request), pseudonymiser=pseudonymiser)
+
+        table = pq.read_table(io.BytesIO(b"".join(obfuscator.obfuscate_stream())))
+
+        token = pseudonymiser.token
+        assert table.column("name").to_pylist() == [token("Ana"), token("Bob"), None, token("Zoë"), token("Eve")]
+        assert table.column("graduation_date").to_pylist() == [token("20240331")] * 5
+        assert table.schema.field("graduation_date").type == pa.string()
+
+    def test_null_columns_keep_their_type_and_dropped_columns_are_removed(self, tmp_path):
+        path = tmp_path / "students.parquet"
+        path.write_bytes(parquet_bytes())
+        request = {
+            "file_to_obfuscate": str(path),
+            "pii_fields": ["name", "student_id", "email_address"],
+            "transforms": {"student_id": "null", "name": "drop"},
+        }
+
+        output = b"".join(Obfuscator(json.dumps(request)).obfuscate_stream())
+
+        table = pq.read_table(io.BytesIO(output))
+        assert table.schema.names == ["student_id", "email_address", "graduation_date"]
+        assert table.schema.field("student_id").type == pa.int64()
+        assert table.column("student_id").to_pylist() == [None] * 5
+        assert table.column("email_address").to_pylist() == ["***"] * 5
+
+    def test_pii_columns_are_detected_from_the_first_batch(self, tmp_path):
+        path = tmp_path / "students.parquet"
+        path.write_bytes(parquet_bytes())
+        request = {"file_to_obfuscate": str(path), "detect_pii": True}
+        obfuscator = Obfuscator(json.dumps(request), schema_registry=SchemaRegistry())
+
+        table = pq.read_table(io.BytesIO(b"".join(obfuscator.obfuscate_stream())))
+
+        assert obfuscator.pii_fields == ["name", "email_address"]
+        assert table.column("email_address").to_pylist() == ["***"] * 5
+        assert table.column("student_id").to_pylist() == [1, 2, 3, 4, 5]
+
+    def test_obfuscate_rejects_parquet_files(self, tmp_path):
+        path = tmp_path / "students.parquet"
+        path.write_bytes(parquet_bytes())
+        obfuscator = Obfuscator(json.dumps({"file_to_obfuscate": str(path)}))
+
+        with pytest.raises(ValueError, match="Parquet files are binary"):
+            obfuscator.obfuscate()
+
+
+class TestRangeReader:
+
+    def test_reads_and_seeks_through_the_range_function(self):
+        data = bytes(range(100))
+        calls = []
+
+        def read_range(start, end):
+            calls.append((start, end))
+            return data[start : end + 1]
+
+        reader = RangeReader(read_range, len(data))
+        reader.seek(-10, io.SEEK_END)
+
+        assert reader.read(4) == data[90:94]
+        assert reader.read() == data[94:]
+        assert calls[0] == (90, 93)
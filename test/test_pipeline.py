@@ -0,0 +1,128 @@
+import pytest
+import gzip
+import io
+import os
+import threading
+from gdpr_obfuscator.metrics import Metrics
+from gdpr_obfuscator.obfuscator import Obfuscator
+from gdpr_obfuscator.pipeline import PrefetchingReader, read_ahead, write_behind
+from gdpr_obfuscator.sinks import BytesSink, S3MultipartSink
+
+
+BUCKET_NAME = "my-ingestion-bucket"
+
+
+class TestStages:
+
+    def test_read_ahead_is_bounded_by_the_queue(self):
+        produced = []
+
+        def numbers():
+            for number in range(100):
+                produced.append(number)
+                yield number
+
+        items = read_ahead(numbers(), queue_size=2)
+        assert next(items) == 0
+        threading.Event().wait(0.2)
+
+        # One item consumed, two queued and one waiting to be queued at most
+        assert len(produced) <= 4
+        items.close()
+        assert len(produced) < 100
+
+    def test_read_ahead_raises_the_errors_of_the_iterable(self):
+        def failing():
+            yield 1
+            raise OSError("connection reset")
+
+        items = read_ahead(failing())
+
+        assert next(items) == 1
+        with pytest.raises(OSError, match="connection reset"):
+            next(items)
+
+    def test_prefetching_reader_returns_the_whole_source(self):
+        data = os.urandom(10_000)
+        reader = PrefetchingReader(io.BytesIO(data), block_size=1000, queue_size=2)
+
+        assert reader.read(1500) + reader.read(3000) + reader.read() == data
+        assert reader.read(10) == b""
+        reader.close()
+
+    def test_write_behind_raises_the_errors_of_the_writes(self):
+        def write(chunk):
+            raise OSError("disk full")
+
+        with pytest.raises(OSError, match="disk full"):
+            write_behind((b"x" for _ in range(100)), write, queue_size=2)
+
+
+    def test_write_behind_closes_the_chunks_when_a_write_fails(self):
+        closed = threading.Event()
+
+        def chunks():
+            try:
+                while True:
+                    yield b"x"
+            finally:
+                closed.set()
+
+        def write(chunk):
+            raise OSError("disk full")
+
+        with pytest.raises(OSError, match="disk full"):
+            write_behind(chunks(), write, queue_size=2)
+
+        assert closed.is_set()
+
+    def test_pipelined_source_is_closed_when_the_sink_fails(self, tmp_path, monkeypatch):
+        path = tmp_path / "file.csv"
+        path.write_text("id,name\n" + "".join(f"{index},Ana\n" for index in range(50_000)))
+        obfuscator = Obfuscator(f'{{"file_to_obfuscate": "{path}", "pii_fields": ["name"]}}')
+        closed = []
+        close = PrefetchingReader.close
+        monkeypatch.setattr(PrefetchingReader, "close", lambda reader: closed.append(close(reader)))
+
+        class FailingSink(BytesSink):
+            def write(self, data):
+                raise OSError("disk full")
+
+        with pytest.raises(OSError, match="disk full"):
+            obfuscator.obfuscate_to(FailingSink(), chunk_size=1024, pipelined=True)
+
+        assert closed == [None]
+
+
+class TestPipelinedObfuscation:
+
+    def test_output_matches_the_sequential_mode(self, tmp_path):
+        path = tmp_path / "file.csv.gz"
+        rows = "".join(f'{index},"Name, {index}",n{index}@email.com\n' for index in range(5000))
+        path.write_bytes(gzip.compress(("id,name,email_address\n" + rows).encode()))
+        request = f'{{"file_to_obfuscate": "{path}", "pii_fields": ["name", "email_address"]}}'
+
+        with BytesSink() as sequential:
+            Obfuscator(request).obfuscate_to(sequential, chunk_size=1024)
+        metrics = Metrics()
+        with BytesSink() as pipelined:
+            written = Obfuscator(request, metrics=metrics).obfuscate_to(
+                pipelined, chunk_size=1024, pipelined=True
+            )
+
+        assert pipelined.getvalue() == sequential.getvalue()
+        assert written == len(pipelined.getvalue())
+        assert metrics.counters["rows"] == 5000
+
+    def test_s3_file_is_uploaded_in_pipelined_mode(self, s3_client):
+        body = b"id,name\n" + b"".join(b"%d,Ana\n" % index for index in range(1000))
+        s3_client.put_object(Bucket=BUCKET_NAME, Key="in.csv", Body=body)
+        obfuscator = Obfuscator(
+            f'{{"file_to_obfuscate": "s3://{BUCKET_NAME}/in.csv", "pii_fields": ["name"]}}'
+        )
+
+        with S3MultipartSink(BUCKET_NAME, "out.csv", s3_client) as sink:
+            obfuscator.obfuscate_to(sink, chunk_size=512, pipelined=True)
+
+        output = s3_client.get_object(Bucket=BUCKET_NAME, Key="out.csv")["Body"].read()
+        assert output == b"id,name\r\n" + b"".join(b"%d,***\r\n" % index for index in range(1000))
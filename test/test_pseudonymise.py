@@ -0,0 +1,131 @@
+import pytest
+import io
+import json
+import pickle
+from gdpr_obfuscator.engine import obfuscate_csv_stream
+from gdpr_obfuscator.obfuscator import Obfuscator
+from gdpr_obfuscator.pseudonymise import Pseudonymiser, set_pseudonymiser
+
+
+CONTENT = b"name,email_address,city\nAna,a@x.com,Leeds\nBob,b@x.com,York\nCai,a@x.com,Hull\n"
+
+
+@pytest.fixture
+def pseudonymiser():
+    return Pseudonymiser("test-secret", cache_size=4)
+
+
+class TestPseudonymiser:
+
+    def test_tokens_are_deterministic_and_keyed(self, pseudonymiser):
+        token = pseudonymiser.token("a@x.com")
+
+        assert token == pseudonymiser("a@x.com") == Pseudonymiser("test-secret").token("a@x.com")
+        assert token != pseudonymiser.token("b@x.com")
+        assert token != Pseudonymiser("other-secret").token("a@x.com")
+        assert len(token) == 16
+
+    def test_memo_is_bounded_and_reports_its_hit_rate(self, pseudonymiser):
+        for value in ["a", "b", "a", "a", "c", "d", "e", "f"]:
+            pseudonymiser.token(value)
+
+        assert pseudonymiser.stats() == {
+            "hits": 2,
+            "misses": 6,
+            "size": 4,
+            "max_size": 4,
+            "hit_rate": 0.25,
+        }
+
+    def test_secret_is_read_from_the_environment(self, monkeypatch):
+        monkeypatch.setenv("OBFUSCATOR_SECRET", "test-secret")
+        assert Pseudonymiser().token("a") == Pseudonymiser("test-secret").token("a")
+
+        monkeypatch.delenv("OBFUSCATOR_SECRET")
+        with pytest.raises(ValueError, match="OBFUSCATOR_SECRET"):
+            Pseudonymiser()
+
+    def test_pickled_copy_gives_the_same_tokens(self, pseudonymiser):
+        pseudonymiser.token("a")
+        copy = pickle.loads(pickle.dumps(pseudonymiser))
+
+        assert copy.token("a") == pseudonymiser.token("a")
+        assert copy.stats()["hits"] == 0
+
+
+class TestTokenTransform:
+
+    def test_csv_fields_get_tokens_or_the_mask(self, tmp_path, pseudonymiser):
+        path = tmp_path / "file.csv"
+        path.write_bytes(CONTENT)
+        request = {
+            "file_to_obfuscate": str(path),
+            "pii_fields": ["name", "email_address"],
+            "transforms": {"email_address": "token"},
+        }
+
+        result = Obfuscator(json.dumps(request), pseudonymiser=pseudonymiser).obfuscate()
+
+        a, b = pseudonymiser.token("a@x.com"), pseudonymiser.token("b@x.com")
+        assert result.getvalue() == (
+            "name,email_address,city\r\n"
+            f"***,{a},Leeds\r\n***,{b},York\r\n***,{a},Hull\r\n"
+        )
+
+    def test_fast_path_and_parser_give_the_same_output(self, pseudonymiser):
+        transforms = {"email_address": pseudonymiser}
+        outputs = [
+            b"".join(
+                obfuscate_csv_stream(
+                    io.BytesIO(CONTENT), ["email_address"], 16, fast_path, transforms
+                )
+            )
+            for fast_path in (True, False)
+        ]
+
+        assert outputs[0] == outputs[1]
+
+    def test_jsonl_values_get_tokens(self, tmp_path, pseudonymiser):
+        path = tmp_path / "file.jsonl"
+        path.write_text('{"user": {"email": "a@x.com", "id": 7}}\n')
+        request = {
+            "file_to_obfuscate": str(path),
+            "pii_fields": ["user.email", "user.id"],
+            "transforms": {"user.email": "token", "user.id": "token"},
+        }
+
+        result = Obfuscator(json.dumps(request), pseudonymiser=pseudonymiser).obfuscate()
+
+        assert json.loads(result.getvalue()) == {
+            "user": {"email": pseudonymiser.token("a@x.com"), "id": pseudonymiser.token("7")}
+        }
+
+    def test_process_wide_pseudonymiser_is_used_by_default(self, tmp_path, pseudonymiser):
+        path = tmp_path / "file.csv"
+        path.write_bytes(CONTENT)
+        request = {
+            "file_to_obfuscate": str(path),
+            "pii_fields": ["email_address"],
+            "transforms": {"email_address": "token"},
+        }
+
+        set_pseudonymiser(pseudonymiser)
+        try:
+            Obfuscator(json.dumps(request)).obfuscate()
+        finally:
+            set_pseudonymiser(None)
+
+        assert pseudonymiser.stats()["hits"] == 1
+
+    @pytest.mark.parametrize(
+        "transforms, message",
+        [
+            ({"name": "reverse"}, "The transform 'reverse' is not supported"),
+            ({"city": "token"}, "The field 'city' has a transform but is not in 'pii_fields'"),
+        ],
+    )
+    def test_invalid_transforms_are_rejected(self, transforms, message):
+        request = {"file_to_obfuscate": "data/simple.csv", "pii_fields": ["name"], "transforms": transforms}
+
+        with pytest.raises(ValueError, match=message):
+            Obfuscator(json.dumps(request))
@@ -0,0 +1,126 @@
+import pytest
+import os
+import hashlib
+import json
+from gdpr_obfuscator.obfuscator import Obfuscator
+from gdpr_obfuscator.sinks import (
+    BytesSink,
+    FileSink,
+    MIN_PART_SIZE,
+    S3MultipartSink,
+)
+
+
+BUCKET_NAME = "my-output-bucket"
+
+
+class TestSinks:
+
+    def test_bytes_sink_keeps_everything_written(self):
+        with BytesSink() as sink:
+            sink.write(b"a,b\r\n")
+            sink.write(b"1,2\r\n")
+
+        assert sink.getvalue() == b"a,b\r\n1,2\r\n"
+
+    def test_file_sink_writes_to_a_local_file(self, tmp_path):
+        path = tmp_path / "out.csv"
+
+        with FileSink(str(path)) as sink:
+            sink.write(b"a,b\r\n")
+
+        assert path.read_bytes() == b"a,b\r\n"
+
+    def test_aborted_file_sink_in_append_mode_restores_the_file(self, tmp_path):
+        path = tmp_path / "out.csv"
+        path.write_bytes(b"a,b\r\n")
+
+        with FileSink(str(path), append=True) as sink:
+            sink.write(b"1,2\r\n")
+        with pytest.raises(RuntimeError):
+            with FileSink(str(path), append=True) as sink:
+                sink.write(b"3,4\r\n")
+                raise RuntimeError("obfuscation failed")
+
+        assert path.read_bytes() == b"a,b\r\n1,2\r\n"
+
+    def test_aborted_file_sink_keeps_the_previous_file(self, tmp_path):
+        path = tmp_path / "out.csv"
+        path.write_bytes(b"a,b\r\n")
+
+        with pytest.raises(RuntimeError):
+            with FileSink(str(path)) as sink:
+                sink.write(b"1,2\r\n")
+                raise RuntimeError("obfuscation failed")
+
+        assert path.read_bytes() == b"a,b\r\n"
+        assert os.listdir(tmp_path) == ["out.csv"]
+
+    def test_file_sink_output_may_be_the_file_being_obfuscated(self, tmp_path):
+        path = tmp_path / "file.csv"
+        path.write_bytes(b"id,name\n1,Ana\n")
+        obfuscator = Obfuscator(json.dumps({"file_to_obfuscate": str(path), "pii_fields": ["name"]}))
+
+        with FileSink(str(path)) as sink:
+            obfuscator.obfuscate_to(sink)
+
+        assert path.read_bytes() == b"id,name\r\n1,***\r\n"
+        assert os.listdir(tmp_path) == ["file.csv"]
+
+    def test_obfuscate_to_writes_the_obfuscated_file_to_the_sink(self):
+        obfuscator = Obfuscator('{"file_to_obfuscate": "data/simple.csv", "pii_fields": ["name"]}')
+
+        with BytesSink() as sink:
+            written = obfuscator.obfuscate_to(sink)
+
+        assert sink.getvalue() == b"name,email_address\r\n***,alice@example.com\r\n***,bob@example.com\r\n"
+        assert written == len(sink.getvalue())
+
+
+class TestS3MultipartSink:
+
+    def test_part_size_below_the_s3_minimum_is_rejected(self, s3_client):
+        with pytest.raises(ValueError):
+            S3MultipartSink(BUCKET_NAME, "out.csv", s3_client, part_size=1024)
+
+    def test_small_output_is_sent_with_a_single_put(self, s3_client):
+        with S3MultipartSink(BUCKET_NAME, "out.csv", s3_client) as sink:
+            sink.write(b"a,b\r\n")
+
+        body = s3_client.get_object(Bucket=BUCKET_NAME, Key="out.csv")["Body"].read()
+        assert body == b"a,b\r\n"
+        assert sink.sha256 == hashlib.sha256(b"a,b\r\n").hexdigest()
+
+    def test_large_output_is_uploaded_in_parts(self, s3_client):
+        data = os.urandom(MIN_PART_SIZE * 2 + 1234)
+
+        with S3MultipartSink(
+            BUCKET_NAME, "big.csv", s3_client, part_size=MIN_PART_SIZE, max_concurrency=2
+        ) as sink:
+            for start in range(0, len(data), 1024 * 1024):
+                sink.write(data[start : start + 1024 * 1024])
+
+        response = s3_client.get_object(Bucket=BUCKET_NAME, Key="big.csv")
+        assert response["Body"].read() == data
+        assert response["ETag"].strip('"').endswith("-3")
+        assert sink.sha256 == hashlib.sha256(data).hexdigest()
+
+    def test_upload_is_aborted_when_an_error_is_raised(self, s3_client):
+        with pytest.raises(RuntimeError):
+            with S3MultipartSink(BUCKET_NAME, "failed.csv", s3_client, part_size=MIN_PART_SIZE) as sink:
+                sink.write(b"x" * (MIN_PART_SIZE + 1))
+                raise RuntimeError("obfuscation failed")
+
+        assert "Contents" not in s3_client.list_objects_v2(Bucket=BUCKET_NAME)
+        assert "Uploads" not in s3_client.list_multipart_uploads(Bucket=BUCKET_NAME)
+
+    @pytest.mark.parametrize("existing_size", [5, MIN_PART_SIZE + 10])
+    def test_append_mode_keeps_the_existing_object(self, s3_client, existing_size):
+        existing = os.urandom(existing_size)
+        s3_client.put_object(Bucket=BUCKET_NAME, Key="out.csv", Body=existing)
+
+        with S3MultipartSink(BUCKET_NAME, "out.csv", s3_client, append=True) as sink:
+            sink.write(b"more rows\r\n")
+
+        body = s3_client.get_object(Bucket=BUCKET_NAME, Key="out.csv")["Body"].read()
+        assert body == existing + b"more rows\r\n"
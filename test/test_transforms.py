@@ -0,0 +1,120 @@
+import pytest
+import json
+import pickle
+from gdpr_obfuscator.obfuscator import Obfuscator
+from gdpr_obfuscator.transforms import (
+    GeneraliseDate,
+    Hash,
+    PartialMask,
+    Truncate,
+    build_transform,
+    parse_transform,
+)
+
+
+class TestTransforms:
+
+    def test_partial_mask_keeps_the_last_characters(self):
+        assert PartialMask(4)("4111111111111111") == "************1111"
+        assert PartialMask(4)("123") == "***"
+
+    def test_partial_mask_keeping_nothing_masks_the_whole_value(self):
+        transform = build_transform(*parse_transform({"type": "partial_mask", "keep": 0}))
+
+        assert transform("4111111111111111") == "*" * 16
+
+    def test_hash_is_salted_and_deterministic(self):
+        assert Hash("a")("Ana") == Hash("a")("Ana")
+        assert Hash("a")("Ana") != Hash("b")("Ana")
+        assert len(Hash()("Ana")) == 64
+
+    def test_truncate_keeps_the_first_characters(self):
+        assert Truncate(3)("AB1 2CD") == "AB1"
+
+    @pytest.mark.parametrize(
+        "value, year, month",
+        [
+            ("2024-03-17", "2024", "2024-03"),
+            ("2024-03-17T10:00:00Z", "2024", "2024-03"),
+            ("17/3/2024", "2024", "2024-03"),
+            ("2024-03", "2024", "2024-03"),
+            ("2024-02-29", "2024", "2024-02"),
+            ("not a date", "***", "***"),
+            ("2024-13-40", "***", "***"),
+            ("2023-02-29", "***", "***"),
+            ("1/99/2024", "***", "***"),
+            ("32/1/2024", "***", "***"),
+            ("", "", ""),
+        ],
+    )
+    def test_generalise_date(self, value, year, month):
+        assert GeneraliseDate("year")(value) == year
+        assert GeneraliseDate("month")(value) == month
+
+    def test_transforms_can_be_pickled_for_worker_processes(self):
+        transform = build_transform(*parse_transform({"type": "partial_mask", "keep": 2}))
+        assert pickle.loads(pickle.dumps(transform)) == transform
+
+
+class TestParseTransform:
+
+    def test_defaults_are_filled_in(self):
+        assert parse_transform("partial_mask") == ("partial_mask", {"keep": 4})
+        assert parse_transform({"type": "truncate", "length": 2}) == ("truncate", {"length": 2})
+
+    @pytest.mark.parametrize(
+        "spec, message",
+        [
+            ("scramble", "transform 'scramble' is not supported"),
+            ({"type": "hash", "keep": 1}, "has no option keep"),
+            ({"type": "partial_mask", "keep": -1}, "must be a non-negative integer"),
+            ({"type": "partial_mask", "keep": True}, "must be a non-negative integer"),
+            ({"type": "truncate", "length": "2"}, "must be a non-negative integer"),
+            ({"type": "generalise_date", "granularity": "day"}, "granularity must be one of"),
+        ],
+    )
+    def test_invalid_specs_are_rejected(self, spec, message):
+        with pytest.raises(ValueError, match=message):
+            parse_transform(spec)
+
+
+class TestRequestSpecs:
+
+    def test_pii_fields_accept_per_column_specs(self, tmp_path):
+        path = tmp_path / "file.csv"
+        path.write_bytes(b"id,name,card,dob,notes\n1,Ana,4111111111111111,1990-03-17,hi\n")
+        request = {
+            "file_to_obfuscate": str(path),
+            "pii_fields": [
+                "name",
+                {"field": "card", "transform": "partial_mask", "keep": 4},
+                {"field": "dob", "transform": "generalise_date"},
+                {"field": "notes", "transform": "drop"},
+            ],
+        }
+
+        obfuscator = Obfuscator(json.dumps(request))
+
+        assert obfuscator.pii_fields == ["name", "card", "dob", "notes"]
+        assert b"".join(obfuscator.obfuscate_stream()) == (
+            b"id,name,card,dob\r\n1,***,************1111,1990\r\n"
+        )
+
+    def test_transforms_accept_specs_with_options(self, tmp_path):
+        path = tmp_path / "file.jsonl"
+        path.write_bytes(b'{"name": "Ana", "postcode": "AB1 2CD", "phone": "0123"}\n')
+        request = {
+            "file_to_obfuscate": str(path),
+            "pii_fields": ["name", "postcode", "phone"],
+            "transforms": {"postcode": {"type": "truncate", "length": 3}, "phone": "null"},
+        }
+
+        output = b"".join(Obfuscator(json.dumps(request)).obfuscate_stream())
+
+        assert json.loads(output) == {"name": "***", "postcode": "AB1", "phone": None}
+
+    def test_objects_without_a_field_are_rejected(self):
+        request = {"file_to_obfuscate": "file.csv", "pii_fields": [{"transform": "drop"}]}
+
+        with pytest.raises(ValueError, match="must name its field"):
+            Obfuscator(json.dumps(request))